@@ -1,9 +1,29 @@
-from fastapi import Depends, HTTPException, status
+"""
+Authentication of API requests
+Supabase access tokens are JWTs. With AUTH_VERIFY_MODE=local the signature
+(HS256 with SUPABASE_JWT_SECRET, or RS256/ES256 keys from SUPABASE_JWKS_URL),
+expiry and audience are checked in-process; Supabase is only asked about
+tokens that can't be checked locally (AUTH_REMOTE_FALLBACK). Verified tokens
+are kept in a TTL-bounded LRU, so repeat requests cost a dict lookup.
+"""
+import hmac
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import jwt
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
 from gotrue.errors import AuthApiError
+
+from . import metrics
 from .config import settings
 
+logger = logging.getLogger("auth")
+
 # Initialize Supabase Client
 supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
 
@@ -19,50 +39,183 @@ class UserWrapper:
         if not self.email and isinstance(user_data, dict):
              self.email = user_data.get("email")
 
+
+class TokenCache:
+    """LRU of verified tokens (by SHA-256), each valid for ttl seconds or until the token expires."""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, valid_until = entry
+            if valid_until <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, token: str, user: UserWrapper, expires_at: float = None):
+        valid_until = time.time() + self.ttl
+        if expires_at is not None:
+            valid_until = min(valid_until, expires_at)
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (user, valid_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+
+
+class LocalVerificationUnavailable(Exception):
+    """There is no local key for the token's algorithm or key id."""
+
+
+_jwks_client = None
+_ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+def _jwks():
+    global _jwks_client
+    if _jwks_client is None:
+        # Keys are fetched once and refreshed when a token names an unknown kid
+        _jwks_client = jwt.PyJWKClient(settings.SUPABASE_JWKS_URL, cache_keys=True, timeout=5)
+    return _jwks_client
+
+
+def _signing_key(token: str):
+    """(key, algorithm) to verify a token with, or LocalVerificationUnavailable."""
+    algorithm = jwt.get_unverified_header(token).get("alg")
+    if algorithm == "HS256" and settings.SUPABASE_JWT_SECRET:
+        return settings.SUPABASE_JWT_SECRET, algorithm
+    if algorithm in _ASYMMETRIC_ALGORITHMS and settings.SUPABASE_JWKS_URL:
+        try:
+            return _jwks().get_signing_key_from_jwt(token).key, algorithm
+        except jwt.PyJWKClientError as e:
+            raise LocalVerificationUnavailable(str(e))
+    raise LocalVerificationUnavailable(f"No local key for {algorithm} tokens")
+
+
+def verify_token_locally(token: str):
+    """
+    Check signature, expiry and audience of an access token without a
+    network call (except fetching JWKS keys). Returns (user, exp).
+    Raises jwt.InvalidTokenError for bad tokens.
+    """
+    key, algorithm = _signing_key(token)
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=settings.SUPABASE_JWT_AUDIENCE,
+        leeway=settings.AUTH_LEEWAY,
+        options={"require": ["exp", "sub"]},
+    )
+    return UserWrapper({"id": claims["sub"], "email": claims.get("email")}), claims["exp"]
+
+
+def verify_token_remotely(token: str) -> UserWrapper:
+    """Ask Supabase Auth who the token belongs to (one HTTP round-trip)."""
+    user_response = supabase.auth.get_user(token)
+
+    user = None
+
+    # Supabase-py v2 often returns a UserResponse object where .user is the User object
+    if hasattr(user_response, "user") and user_response.user:
+        user = user_response.user
+    elif isinstance(user_response, dict) and "user" in user_response:
+         user = user_response["user"]
+    else:
+         # Fallback: maybe it IS the user object?
+         user = user_response
+
+    if not user:
+         raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # If user is a User object (pydantic model), it has .id
+    # If it's a dict, safely extract.
+    # Our wrapper handles both.
+    return UserWrapper(user)
+
+
+def _unverified_expiry(token: str):
+    """exp of a token Supabase already vouched for (bounds its cache entry)."""
+    try:
+        return jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        return None
+
+
+def verify_token(token: str) -> UserWrapper:
+    """The user of a valid access token; raises for invalid ones."""
+    user = token_cache.get(token)
+    if user is not None:
+        metrics.incr("auth.cache_hit")
+        return user
+
+    if settings.AUTH_VERIFY_MODE == "local":
+        try:
+            user, expires_at = verify_token_locally(token)
+            metrics.incr("auth.local")
+        except LocalVerificationUnavailable as e:
+            if not settings.AUTH_REMOTE_FALLBACK:
+                raise
+            logger.info(f"Token not verifiable locally ({e}); asking Supabase")
+            metrics.incr("auth.remote_fallback")
+            user, expires_at = verify_token_remotely(token), _unverified_expiry(token)
+    else:
+        metrics.incr("auth.remote")
+        user, expires_at = verify_token_remotely(token), _unverified_expiry(token)
+
+    token_cache.put(token, user, expires_at)
+    return user
+
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
-    Verifies the JWT token using Supabase logic.
+    Verifies the JWT token (locally or via Supabase, see verify_token).
     Returns a standardized user object with .id attribute.
     """
-    token = credentials.credentials
-    
     try:
-        # Verify user using Supabase Auth
-        user_response = supabase.auth.get_user(token)
-        
-        # Debug logging to see what we actually get
-        # import logging
-        # logger = logging.getLogger("auth")
-        # logger.info(f"User Response Type: {type(user_response)}")
-        # logger.info(f"User Response: {user_response}")
-
-        user = None
-        
-        # Supabase-py v2 often returns a UserResponse object where .user is the User object
-        if hasattr(user_response, "user") and user_response.user:
-            user = user_response.user
-        elif isinstance(user_response, dict) and "user" in user_response:
-             user = user_response["user"]
-        else:
-             # Fallback: maybe it IS the user object?
-             user = user_response
-
-        if not user:
-             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-            
-        # If user is a User object (pydantic model), it has .id
-        # If it's a dict, safely extract.
-        # Our wrapper handles both.
-        return UserWrapper(user)
-        
+        return verify_token(credentials.credentials)
+    except HTTPException:
+        raise
     except Exception as e:
-        # logger.error(f"Auth failed: {e}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Authentication failed: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+
+def require_ops_token(x_ops_token: str = Header(None)):
+    """
+    Guard for operational endpoints: the X-Ops-Token header must match
+    OPS_TOKEN. Without OPS_TOKEN they don't exist (404).
+    """
+    if not settings.OPS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_ops_token or not hmac.compare_digest(x_ops_token.encode(), settings.OPS_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid ops token")
@@ -0,0 +1,76 @@
+"""
+Block payloads as served by the block endpoints
+One dict per block in the BlockResponse shape, built from ORM objects or
+from BLOCK_COLUMNS rows (which skip the legacy image_data bytes). Shared by
+the API and the page payload cache (page_cache.py).
+"""
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from .compact import META_VERSION_VERBOSE, expand_block_meta, is_compact
+from .models import Block, Document
+
+
+def iter_block_payloads(db: Session, doc_id: str, blocks, compact: bool = False):
+    """
+    Shape blocks (ORM objects or BLOCK_COLUMNS rows) for BlockResponse.
+    doc_id is the requested document; blocks of a shared document belong to
+    its canonical copy but are reported under the requested id.
+    Blocks stored in the compact encoding are expanded to the verbose shape
+    unless the client asked for format=compact (it then needs the
+    document's style_palette to decode them).
+    """
+    palettes = {}
+    for block in blocks:
+        words_meta, style_runs = block.words_meta, block.style_runs
+        meta_version = block.meta_version or META_VERSION_VERBOSE
+        if not compact and is_compact(block):
+            if block.doc_id not in palettes:
+                palettes[block.doc_id] = db.query(Document.style_palette).filter(
+                    Document.id == block.doc_id
+                ).scalar() or []
+            words_meta, style_runs = expand_block_meta(block, palettes[block.doc_id])
+            meta_version = META_VERSION_VERBOSE
+        yield {
+            "id": block.id,
+            "doc_id": doc_id,
+            "page_number": block.page_number,
+            "block_order": block.block_order,
+            "text": block.text,
+            "block_type": block.block_type,
+            "image_path": block.image_path,
+            "words_meta": words_meta,
+            "style_runs": style_runs,
+            "position_meta": block.position_meta,
+            "meta_version": meta_version,
+        }
+
+
+def block_payloads(db: Session, doc_id: str, blocks: list, compact: bool = False) -> list:
+    return list(iter_block_payloads(db, doc_id, blocks, compact))
+
+
+# Columns served by the block list endpoints (not the legacy image_data bytes)
+BLOCK_COLUMNS = (
+    Block.id, Block.doc_id, Block.page_number, Block.block_order,
+    Block.text, Block.block_type, Block.image_path, Block.words_meta,
+    Block.style_runs, Block.position_meta, Block.meta_version,
+)
+
+
+def block_rows_query(db: Session, content_id: str, start_page: int = None, end_page: int = None,
+                     after: tuple = None, pages: list = None):
+    """
+    Blocks of a document in reading order, as BLOCK_COLUMNS rows, optionally
+    limited to a page range or list and/or after a (page, order) cursor.
+    """
+    query = db.query(*BLOCK_COLUMNS).filter(Block.doc_id == content_id)
+    if pages is not None:
+        query = query.filter(Block.page_number.in_(pages))
+    if start_page is not None:
+        query = query.filter(Block.page_number >= start_page)
+    if end_page is not None:
+        query = query.filter(Block.page_number <= end_page)
+    if after is not None:
+        query = query.filter(tuple_(Block.page_number, Block.block_order) > after)
+    return query.order_by(Block.page_number, Block.block_order)
@@ -0,0 +1,72 @@
+"""
+COPY-based bulk loading of Block rows
+Blocks go to Postgres as one COPY stream per batch instead of ORM objects
+and executemany INSERTs. Used by parser._save_batch when the connection
+supports it (psycopg2) and settings.INGEST_COPY_BLOCKS is on.
+"""
+import io
+import json
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import Block
+
+# Column order of the COPY stream
+_COLUMNS = [column for column in Block.__table__.columns]
+_COPY_SQL = f"COPY blocks ({', '.join(c.name for c in _COLUMNS)}) FROM STDIN"
+_JSON_COLUMNS = {c.name for c in _COLUMNS if isinstance(c.type, JSONB)}
+_DEFAULTS = {
+    c.name: c.default.arg
+    for c in _COLUMNS
+    if c.default is not None and c.default.is_scalar
+}
+
+# COPY text format escapes (backslash first)
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_supported(db_session: Session) -> bool:
+    """True when blocks can be loaded with COPY on this session."""
+    if not settings.INGEST_COPY_BLOCKS:
+        return False
+    try:
+        return db_session.get_bind().dialect.driver == "psycopg2"
+    except Exception:
+        return False
+
+
+def _field(name: str, value) -> str:
+    if value is None:
+        return "\\N"
+    if name in _JSON_COLUMNS:
+        value = json.dumps(value, separators=(",", ":"))
+    elif isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        value = "\\x" + bytes(value).hex()
+    else:
+        value = str(value)
+    return value.translate(_ESCAPES)
+
+
+def copy_blocks(db_session: Session, rows: list):
+    """
+    Insert block rows (dicts keyed by column name, as made by
+    parser._build_block_row) with one COPY. Runs in the session's
+    transaction (does not commit).
+    """
+    if not rows:
+        return
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(
+            _field(c.name, row.get(c.name, _DEFAULTS.get(c.name))) for c in _COLUMNS
+        ))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    connection = db_session.connection().connection.dbapi_connection
+    with connection.cursor() as cursor:
+        cursor.copy_expert(_COPY_SQL, buffer)
@@ -0,0 +1,113 @@
+"""
+Compact (columnar) encoding for Block.words_meta and Block.style_runs
+
+Version 1 (the default) stores one JSON object per word and per style run,
+repeating the font, size, colour and flags on every entry. Version 2 moves
+those styles into a per-document palette (Document.style_palette) and stores
+each block as parallel arrays:
+
+    words_meta = {"o": [start0, end0, start1, end1, ...],   # char offsets
+                  "s": [style0, style1, ...],               # palette index per word
+                  "nl": [word_index, ...],                  # words starting a line
+                  "x": [x, ...]}                            # indent of those words
+    style_runs = {"r": [start0, end0, style0, start1, ...]}
+
+Word text is recovered from Block.text, "align" is always "left" and
+"isCentered" always False, so neither is stored. expand_* rebuild the
+version 1 shape exactly, which is what the API serves by default.
+"""
+
+META_VERSION_VERBOSE = 1
+META_VERSION_COMPACT = 2
+
+
+class StylePalette:
+    """Append-only list of [fontSize, font, color, isBold, isItalic] entries."""
+
+    def __init__(self, styles: list = None):
+        self.styles = [list(s) for s in (styles or [])]
+        self._index = {tuple(s): i for i, s in enumerate(self.styles)}
+
+    def index(self, font_size, font, color, is_bold, is_italic) -> int:
+        key = (font_size, font, color, is_bold, is_italic)
+        idx = self._index.get(key)
+        if idx is None:
+            idx = len(self.styles)
+            self.styles.append(list(key))
+            self._index[key] = idx
+        return idx
+
+
+def encode_block_meta(words_meta: list, style_runs: list, palette: StylePalette) -> tuple:
+    """Encode version 1 words_meta/style_runs into the compact version 2 shape."""
+    offsets, styles, newlines, xs = [], [], [], []
+    for i, w in enumerate(words_meta):
+        offsets += (w["start"], w["end"])
+        styles.append(palette.index(w["fontSize"], w["fontFamily"], w["color"], w["isBold"], w["isItalic"]))
+        if w["isNewline"]:
+            newlines.append(i)
+            xs.append(w["x"])
+
+    runs = []
+    for r in style_runs:
+        runs += (r["start"], r["end"], palette.index(r["fontSize"], r["font"], r["color"], r["isBold"], r["isItalic"]))
+
+    return {"o": offsets, "s": styles, "nl": newlines, "x": xs}, {"r": runs}
+
+
+def expand_words_meta(words: dict, text: str, palette: list) -> list:
+    """Rebuild the version 1 words_meta list from its compact form."""
+    offsets = words["o"]
+    line_x = dict(zip(words["nl"], words["x"]))
+    words_meta = []
+    for i, style_idx in enumerate(words["s"]):
+        start, end = offsets[2 * i], offsets[2 * i + 1]
+        font_size, font, color, is_bold, is_italic = palette[style_idx]
+        is_newline = i in line_x
+        words_meta.append({
+            "start": start,
+            "end": end,
+            "text": text[start:end],
+            "fontSize": font_size,
+            "fontFamily": font,
+            "isBold": is_bold,
+            "isItalic": is_italic,
+            "color": color,
+            "align": "left",
+            "isNewline": is_newline,
+            "x": line_x[i] if is_newline else 0
+        })
+    return words_meta
+
+
+def expand_style_runs(runs: dict, palette: list) -> list:
+    """Rebuild the version 1 style_runs list from its compact form."""
+    flat = runs["r"]
+    style_runs = []
+    for i in range(0, len(flat), 3):
+        font_size, font, color, is_bold, is_italic = palette[flat[i + 2]]
+        style_runs.append({
+            "start": flat[i],
+            "end": flat[i + 1],
+            "fontSize": font_size,
+            "font": font,
+            "color": color,
+            "isBold": is_bold,
+            "isItalic": is_italic,
+            "isCentered": False
+        })
+    return style_runs
+
+
+def is_compact(block) -> bool:
+    return (block.meta_version or META_VERSION_VERBOSE) == META_VERSION_COMPACT
+
+
+def expand_block_meta(block, palette: list) -> tuple:
+    """Return (words_meta, style_runs) of a Block in the version 1 shape."""
+    if not is_compact(block):
+        return block.words_meta, block.style_runs
+    return (
+        expand_words_meta(block.words_meta, block.text or "", palette),
+        expand_style_runs(block.style_runs, palette),
+    )
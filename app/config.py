@@ -29,11 +29,102 @@ class Settings:
     # Database
     import os
     DATABASE_URL = os.getenv("DATABASE_URL")
+    # Serve the read endpoints (documents list, blocks, pages, annotations, stats)
+    # on an asyncpg engine instead of the threadpool (see database.get_read_db)
+    ASYNC_DB = os.getenv("ASYNC_DB", "false").lower() == "true"
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")  # empty = DATABASE_URL with the asyncpg driver
+    # Connection pool (per engine and per process): pool_size persistent
+    # connections plus up to max_overflow extra ones under load; a checkout
+    # waits at most DB_POOL_TIMEOUT seconds for one to free up
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    # Reconnect connections older than this many seconds (-1 = never)
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # Postgres statement_timeout for every connection, in ms (0 = none)
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+    # Log statements slower than this, in ms (0 = off)
+    DB_SLOW_QUERY_MS = int(os.getenv("DB_SLOW_QUERY_MS", "500"))
     
+    # Operational endpoints (/api/metrics, /api/diagnostics/*) need this in an
+    # X-Ops-Token header; unset = those endpoints are disabled (404)
+    OPS_TOKEN = os.getenv("OPS_TOKEN", "")
+
     # Supabase Auth
     SUPABASE_URL = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
     SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
+    # Asymmetric signing keys (RS256/ES256), e.g. <SUPABASE_URL>/auth/v1/.well-known/jwks.json
+    SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", "")
+    SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+    # "local" checks tokens in-process (see auth.py), "remote" asks Supabase on every cache miss
+    AUTH_VERIFY_MODE = os.getenv(
+        "AUTH_VERIFY_MODE", "local" if SUPABASE_JWT_SECRET or SUPABASE_JWKS_URL else "remote"
+    )
+    # Ask Supabase when a token can't be checked locally (no key for its algorithm)
+    AUTH_REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "true").lower() == "true"
+    # Verified tokens kept (LRU) and for how long at most; never past the token's exp
+    AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+    AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+    # Clock skew tolerated on exp/nbf/iat, in seconds
+    AUTH_LEEWAY = int(os.getenv("AUTH_LEEWAY", "10"))
+    
+    # Parser settings
+    # Process pool size for page extraction (1 = serial)
+    PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", "1"))
+    # Below this page count the pool start-up cost outweighs the gain
+    PARSER_PARALLEL_MIN_PAGES = int(os.getenv("PARSER_PARALLEL_MIN_PAGES", "50"))
+    # Store words_meta/style_runs in the compact columnar encoding (opt-in)
+    COMPACT_BLOCK_META = os.getenv("COMPACT_BLOCK_META", "false").lower() == "true"
+    # Record image xrefs at parse time and extract the bytes later
+    PARSER_DEFER_IMAGES = os.getenv("PARSER_DEFER_IMAGES", "false").lower() == "true"
+
+    # Background ingestion
+    # Documents parsed concurrently / accepted (running + queued) before uploads get 503
+    INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "2"))
+    INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "16"))
+    # Where ingest jobs run: "process" (own worker processes, so parsing never
+    # competes with request handling for the API process's GIL) or "thread"
+    INGEST_EXECUTOR = os.getenv("INGEST_EXECUTOR", "process").lower()
+    # Pages per block insert/commit; readers see pages as each batch lands
+    INGEST_BATCH_PAGES = int(os.getenv("INGEST_BATCH_PAGES", "20"))
+    # Load blocks with COPY when the driver supports it (false = ORM bulk insert)
+    INGEST_COPY_BLOCKS = os.getenv("INGEST_COPY_BLOCKS", "true").lower() == "true"
+    # Uploads are streamed to a temp file here and parsed from disk
+    UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "")  # empty = system temp dir
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+    # Downloads are streamed from Postgres in chunks of this size
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+    # Where PDF/image/thumbnail bytes live: database (BYTEA columns), local or s3
+    BLOB_STORAGE = os.getenv("BLOB_STORAGE", "database").lower()
+    BLOB_STORAGE_DIR = os.getenv("BLOB_STORAGE_DIR", str(UPLOAD_DIR / "blobs"))
+    # S3 credentials come from the usual AWS_* variables / instance profile
+    S3_BUCKET = os.getenv("S3_BUCKET", "")
+    S3_PREFIX = os.getenv("S3_PREFIX", "")
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")  # S3-compatible services (MinIO, ...)
+    S3_REGION = os.getenv("S3_REGION", "")
+
+    # Block list endpoint: default keyset page size, and rows per fetch when streaming NDJSON
+    BLOCK_PAGE_SIZE = int(os.getenv("BLOCK_PAGE_SIZE", "500"))
+    BLOCK_STREAM_BATCH = int(os.getenv("BLOCK_STREAM_BATCH", "200"))
+
+    # Block responses: compressed when at least this large, with the first of these
+    # codings the client accepts (zstd/br need the zstandard/brotli packages)
+    COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+    COMPRESS_ENCODINGS = [e.strip() for e in os.getenv("COMPRESS_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+
+    # Serialized page payloads of the block endpoints: in-process LRU size,
+    # whether they are also kept in page_payloads, and filled at ingest
+    PAGE_CACHE_MAX_MB = int(os.getenv("PAGE_CACHE_MAX_MB", "64"))
+    PAGE_CACHE_PERSIST = os.getenv("PAGE_CACHE_PERSIST", "true").lower() == "true"
+    PAGE_CACHE_PREFILL = os.getenv("PAGE_CACHE_PREFILL", "true").lower() == "true"
+
+    # Page rasters (/pages/{n}/image): on-disk LRU cache and render limits
+    RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "")  # empty = <system temp>/pdfread-render-cache
+    RENDER_CACHE_MAX_MB = int(os.getenv("RENDER_CACHE_MAX_MB", "512"))
+    RENDER_MAX_ZOOM = float(os.getenv("RENDER_MAX_ZOOM", "4"))
+    RENDER_TILE_SIZE = int(os.getenv("RENDER_TILE_SIZE", "512"))  # pixels
     
     if not DATABASE_URL:
         raise ValueError("DATABASE_URL must be set")
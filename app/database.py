@@ -1,22 +1,184 @@
 """
 Database connection and session management
+Pool sizing, recycling and the Postgres statement timeout come from settings
+(DB_POOL_* / DB_STATEMENT_TIMEOUT_MS). Each engine's pool records how long
+checkouts wait and how many connections are in use, and statements slower
+than DB_SLOW_QUERY_MS are logged; see db_diagnostics (GET /api/diagnostics/db).
 """
+import re
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
 
+from . import metrics
 from .config import settings
 
+logger = logging.getLogger("database")
+
 # Database URL from settings
 DATABASE_URL = settings.DATABASE_URL
 
 # Handle SSL for Supabase/PostgreSQL if needed
 # connect_args = {"sslmode": "require"} if "supabase" in DATABASE_URL else {}
 
+# Postgres error code of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+
+class PoolStats:
+    """Checkout waits (seconds) and peak in-use connections of one engine's pool."""
+
+    def __init__(self, name: str, recent: int = 1000):
+        self.name = name
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._recent.append(seconds)
+        metrics.incr("db.pool.checkouts")
+        metrics.incr("db.pool.wait_seconds", seconds)
+
+    def record_timeout(self, seconds: float):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_max = max(self.wait_max, seconds)
+        metrics.incr("db.pool.timeouts")
+
+    def record_in_use(self, in_use: int):
+        if in_use > self.peak_in_use:
+            with self._lock:
+                self.peak_in_use = max(self.peak_in_use, in_use)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_total, wait_max, peak = self.wait_total, self.wait_max, self.peak_in_use
+        pick = lambda p: round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 2) if recent else None
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_ms": {
+                "mean": round(wait_total / checkouts * 1000, 2) if checkouts else None,
+                "p50": pick(0.50),
+                "p99": pick(0.99),
+                "max": round(wait_max * 1000, 2),
+                "recent": len(recent),
+            },
+            "peak_in_use": peak,
+        }
+
+
+class _TimedCheckout:
+    """Pool mixin timing how long each checkout waits for a connection."""
+
+    stats: PoolStats = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record_timeout(time.perf_counter() - started)
+            raise
+        self.stats.record_wait(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    stats = PoolStats("sync")
+
+
+def engine_options(url: str, asyncpg: bool = False) -> dict:
+    """create_engine keyword arguments from the DB_* settings."""
+    options = {
+        "pool_pre_ping": True,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0 and make_url(url).get_backend_name() == "postgresql":
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if asyncpg:
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+_slow_queries = deque(maxlen=20)
+
+
+def _statement_summary(statement: str) -> str:
+    return re.sub(r"\s+", " ", statement).strip()[:300]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    if elapsed * 1000 < settings.DB_SLOW_QUERY_MS:
+        return
+    summary = _statement_summary(statement)
+    # Statement text only: parameters may hold user content
+    logger.warning(f"Slow query ({elapsed * 1000:.0f} ms): {summary}")
+    metrics.incr("db.slow_queries")
+    _slow_queries.append({
+        "statement": summary,
+        "ms": round(elapsed * 1000, 1),
+        "at": datetime.now(timezone.utc).isoformat(),
+    })
+
+
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+    error = context.original_exception
+    if getattr(error, "pgcode", None) == QUERY_CANCELED or getattr(error, "sqlstate", None) == QUERY_CANCELED:
+        metrics.incr("db.statement_timeouts")
+        logger.warning(f"Statement cancelled (statement_timeout): {_statement_summary(context.statement or '')}")
+
+
+def instrument(sync_engine, stats: PoolStats):
+    """Attach the in-use gauge and, with DB_SLOW_QUERY_MS, slow-query logging to an engine."""
+    event.listen(
+        sync_engine, "checkout",
+        lambda dbapi_connection, record, proxy: stats.record_in_use(sync_engine.pool.checkedout()),
+    )
+    event.listen(sync_engine, "handle_error", _handle_error)
+    if settings.DB_SLOW_QUERY_MS > 0:
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
 engine = create_engine(
     DATABASE_URL,
     # connect_args=connect_args, # Uncomment if SSL is required and not in URL
-    pool_pre_ping=True
+    poolclass=TimedQueuePool,
+    **engine_options(DATABASE_URL)
 )
+instrument(engine, TimedQueuePool.stats)
 
 # Debug: Print active database URL (masked)
 masked_url = DATABASE_URL.split("@")[-1] if "@" in DATABASE_URL else "PostgreSQL"
@@ -33,3 +195,105 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL for the asyncpg driver (libpq's sslmode becomes asyncpg's ssl)."""
+    url = make_url(url).set(drivername="postgresql+asyncpg")
+    if "sslmode" in url.query:
+        query = dict(url.query)
+        query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url.render_as_string(hide_password=False)
+
+
+# Async engine for the read endpoints (ASYNC_DB=true); needs asyncpg
+async_engine = None
+AsyncSessionLocal = None
+if settings.ASYNC_DB:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+        stats = PoolStats("async")
+
+    _async_url = settings.ASYNC_DATABASE_URL or async_database_url(DATABASE_URL)
+    async_engine = create_async_engine(
+        _async_url,
+        poolclass=TimedAsyncQueuePool,
+        **engine_options(_async_url, asyncpg=True)
+    )
+    instrument(async_engine.sync_engine, TimedAsyncQueuePool.stats)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_read_db():
+    """
+    Dependency of the read endpoints: an AsyncSession with ASYNC_DB, else
+    None (run_read then opens a Session in the worker thread).
+    Either way, run the work through run_read.
+    """
+    if AsyncSessionLocal is None:
+        yield None
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _with_session(fn, *args, **kwargs):
+    # Open and close in the worker thread: the connection goes back to the
+    # pool before the thread does, so threads never wait on each other's
+    # dependency teardown for a connection
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def run_read(db, fn, *args, **kwargs):
+    """
+    Call fn(session, *args, **kwargs) with a sync Session. On an
+    AsyncSession the queries are awaited on the event loop (run_sync), so
+    a request waiting on Postgres holds no worker thread; otherwise fn
+    runs in the threadpool as a plain def endpoint would.
+    """
+    if db is not None:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(_with_session, fn, *args, **kwargs)
+
+
+def pool_status(sync_engine) -> dict:
+    """Live gauges and checkout wait stats of an engine's pool."""
+    pool = sync_engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # overflow() counts up from -pool_size while the pool is still filling
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.as_dict())
+    return status
+
+
+def db_diagnostics() -> dict:
+    """Pool state of each engine, the DB_* settings and the latest slow queries."""
+    return {
+        "pools": {
+            "sync": pool_status(engine),
+            "async": pool_status(async_engine.sync_engine) if async_engine is not None else None,
+        },
+        "settings": {
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT,
+            "pool_recycle": settings.DB_POOL_RECYCLE,
+            "statement_timeout_ms": settings.DB_STATEMENT_TIMEOUT_MS,
+            "slow_query_ms": settings.DB_SLOW_QUERY_MS,
+        },
+        "slow_queries": list(_slow_queries),
+    }
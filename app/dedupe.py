@@ -0,0 +1,217 @@
+"""
+Upload deduplication by PDF content hash
+
+The first upload of a PDF is parsed normally and becomes the canonical copy.
+Later uploads of the same bytes (by any user) get their own Document row with
+source_doc_id pointing at it: blocks, images, TOC and file bytes are shared
+instead of being parsed and stored again. Blocks are copy-on-write: before a
+shared document's blocks change it gets its own (detach_shared_document),
+and before the canonical copy's blocks change the sharers take over the
+current rows (detach_sharers). The PDF bytes are never copied; they stay on
+one row per content hash (see storage.file_holder_id).
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .documents import bump_annotation_version
+from .models import Document
+from .page_cache import bump_content_version
+from .storage import HOLDS_FILE
+
+logger = logging.getLogger("dedupe")
+
+
+def find_parsed_copy(db: Session, content_hash: str):
+    """Return a fully parsed canonical Document with these bytes, or None."""
+    if not content_hash:
+        return None
+    return db.query(Document).filter(
+        Document.content_hash == content_hash,
+        Document.source_doc_id.is_(None),
+        Document.status == "ready"
+    ).order_by(Document.created_at).first()
+
+
+def lookup_parsed_copy(db: Session, content_hash: str):
+    """find_parsed_copy that also counts cache hits and misses."""
+    source = find_parsed_copy(db, content_hash)
+    metrics.incr("ingest.cache_hit" if source else "ingest.cache_miss")
+    return source
+
+
+def create_shared_document(db: Session, source: Document, doc_id: str, title: str, user_id: str) -> Document:
+    """Create a per-user Document that reuses the parsed content of source."""
+    doc_record = Document(
+        id=doc_id,
+        title=title,
+        file_path=title,
+        file_data=None,
+        total_pages=source.total_pages,
+        created_at=datetime.utcnow().isoformat(),
+        user_id=user_id,
+        toc=source.toc,
+        style_palette=source.style_palette,
+        status="ready",
+        pages_ready=source.total_pages,
+        content_hash=source.content_hash,
+        source_doc_id=source.id
+    )
+    db.add(doc_record)
+    db.commit()
+    logger.info(f"Doc {doc_id} shares parsed content of {source.id}")
+    return doc_record
+
+
+def content_doc_id(db: Session, doc_id: str) -> str:
+    """Id of the document whose blocks/file bytes back doc_id."""
+    source_id = db.query(Document.source_doc_id).filter(Document.id == doc_id).scalar()
+    return source_id or doc_id
+
+
+def ensure_content_hash(db: Session, doc: Document) -> str:
+    """
+    Content hash of a document; for documents uploaded before hashing it
+    is computed inside Postgres (the bytes never reach Python) and saved.
+    Files in the blob store are named by their hash.
+    """
+    if doc.content_hash:
+        return doc.content_hash
+    row = db.query(Document.file_key, func.encode(func.sha256(Document.file_data), "hex")).filter(
+        Document.id == (doc.source_doc_id or doc.id)
+    ).first()
+    if not row or not (row[0] or row[1]):
+        return None
+    file_key, content_hash = row
+    if file_key:
+        content_hash = file_key.rsplit("/", 1)[-1]
+    doc.content_hash = content_hash
+    db.commit()
+    return content_hash
+
+
+# Columns copied when a shared document gets its own blocks
+_BLOCK_COPY_SQL = text("""
+    INSERT INTO blocks (
+        id, doc_id, page_number, block_order, text, block_type, image_path,
+        image_data, image_hash, image_xref, words_meta, style_runs, position_meta, meta_version
+    )
+    SELECT
+        n.id, :doc_id, b.page_number, b.block_order, b.text, b.block_type,
+        CASE WHEN b.image_path IS NULL THEN NULL ELSE '/api/images/' || n.id END,
+        b.image_data, b.image_hash, b.image_xref, b.words_meta, b.style_runs, b.position_meta, b.meta_version
+    FROM blocks b
+    CROSS JOIN LATERAL (SELECT gen_random_uuid()::text AS id) n
+    WHERE b.doc_id = :source_id
+""")
+
+# Hand a deleted document's PDF bytes to another row with the same content
+_FILE_MOVE_SQL = text("""
+    UPDATE documents d
+    SET file_data = s.file_data, file_key = s.file_key
+    FROM documents s
+    WHERE s.id = :source_id AND d.id = :doc_id
+""")
+
+# Point the document's annotations at its own copies of the blocks
+_ANNOTATION_REMAP_SQL = text("""
+    UPDATE annotations a
+    SET block_id = nb.id
+    FROM blocks ob, blocks nb
+    WHERE a.doc_id = :doc_id
+      AND a.block_id = ob.id
+      AND ob.doc_id = :source_id
+      AND nb.doc_id = :doc_id
+      AND nb.page_number = ob.page_number
+      AND nb.block_order = ob.block_order
+""")
+
+
+def detach_shared_document(db: Session, doc: Document) -> bool:
+    """
+    Copy-on-write: give a shared document its own blocks before it is
+    modified, and point its annotations at them. Copies happen inside
+    Postgres; the PDF bytes stay shared. Returns whether anything was
+    copied. Does not commit.
+    """
+    if not doc.source_doc_id:
+        return False
+    params = {"doc_id": doc.id, "source_id": doc.source_doc_id}
+    db.execute(_BLOCK_COPY_SQL, params)
+    db.execute(_ANNOTATION_REMAP_SQL, params)
+    bump_annotation_version(db, doc.id)
+    doc.source_doc_id = None
+    logger.info(f"Doc {doc.id} detached from shared content {params['source_id']}")
+    return True
+
+
+def _heir_id(db: Session, doc_id: str):
+    """The oldest document sharing doc_id's content, or None."""
+    return db.query(Document.id).filter(
+        Document.source_doc_id == doc_id
+    ).order_by(Document.created_at).limit(1).scalar()
+
+
+def _hand_over_blocks(db: Session, doc_id: str, heir_id: str):
+    """Move doc_id's blocks to heir_id and make it the canonical copy for the other sharers."""
+    params = {"doc_id": heir_id, "source_id": doc_id}
+    db.execute(text("UPDATE blocks SET doc_id = :doc_id WHERE doc_id = :source_id"), params)
+    db.execute(text("UPDATE documents SET source_doc_id = NULL WHERE id = :doc_id"), params)
+    db.execute(text("UPDATE documents SET source_doc_id = :doc_id WHERE source_doc_id = :source_id"), params)
+    # The sharers now read blocks of heir_id: new cache keys and ETags
+    bump_content_version(db, heir_id)
+
+
+def detach_sharers(db: Session, doc: Document) -> bool:
+    """
+    Copy-on-write for the canonical copy: before its blocks are modified,
+    the documents sharing them take over the current rows (block ids
+    unchanged, so their annotations stay valid) and doc gets its own copies,
+    with its annotations pointed at them. Returns whether anything was
+    copied. Does not commit.
+    """
+    heir_id = _heir_id(db, doc.id)
+    if not heir_id:
+        return False
+    _hand_over_blocks(db, doc.id, heir_id)
+    params = {"doc_id": doc.id, "source_id": heir_id}
+    db.execute(_BLOCK_COPY_SQL, params)
+    db.execute(_ANNOTATION_REMAP_SQL, params)
+    bump_annotation_version(db, doc.id)
+    logger.info(f"Doc {doc.id} handed its shared content to {heir_id} before changing it")
+    return True
+
+
+def detach_for_update(db: Session, doc: Document) -> bool:
+    """Give doc blocks of its own (shared or canonical side) before they are modified."""
+    if doc.source_doc_id:
+        return detach_shared_document(db, doc)
+    return detach_sharers(db, doc)
+
+
+def release_document(db: Session, doc: Document):
+    """
+    Before deleting a document, hand its blocks to one of the documents
+    sharing them (repointing the others), and its PDF bytes to another
+    document with the same content. Does not commit.
+    """
+    heir_id = _heir_id(db, doc.id)
+    if heir_id:
+        _hand_over_blocks(db, doc.id, heir_id)
+        logger.info(f"Doc {doc.id} handed its content to {heir_id}")
+
+    holds = db.query(Document.id).filter(Document.id == doc.id, HOLDS_FILE).first()
+    if not holds or not doc.content_hash:
+        return
+    same_content = db.query(Document.id).filter(
+        Document.content_hash == doc.content_hash, Document.id != doc.id
+    )
+    if same_content.filter(HOLDS_FILE).first():
+        return  # already stored on another row
+    heir_id = heir_id or same_content.order_by(Document.created_at).limit(1).scalar()
+    if heir_id:
+        db.execute(_FILE_MOVE_SQL, {"doc_id": heir_id, "source_id": doc.id})
+        logger.info(f"Doc {doc.id} handed its PDF bytes to {heir_id}")
@@ -0,0 +1,101 @@
+"""
+Size-bounded LRU cache of byte strings on local disk
+Entries are files named by the SHA-1 of their key; recency is the file's
+mtime (touched on every hit), so the order survives restarts. The size
+bound is enforced per process: workers sharing a directory each evict
+from their own view of it.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger("disk_cache")
+
+
+class DiskLRUCache:
+    def __init__(self, directory, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name[:2] / name
+
+    def _load(self):
+        """Index the files already on disk, oldest first (once, lazily)."""
+        if self._loaded:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.directory.glob("*/*"):
+            if path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime, path.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._path(name).unlink(missing_ok=True)
+
+    def get(self, key: str):
+        """Cached bytes for key, or None."""
+        name = hashlib.sha1(key.encode()).hexdigest()
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                return None
+            path = self._path(name)
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another process sharing the directory
+                self._size -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+            return data
+
+    def put(self, key: str, data: bytes):
+        """Store data under key (atomically), evicting old entries past max_bytes."""
+        if len(data) > self.max_bytes:
+            return
+        name = hashlib.sha1(key.encode()).hexdigest()
+        path = self._path(name)
+        with self._lock:
+            self._load()
+            path.parent.mkdir(exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    out.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                Path(tmp_path).unlink(missing_ok=True)
+                logger.warning(f"Could not write cache entry {name}: {e}")
+                return
+            self._size += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
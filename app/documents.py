@@ -0,0 +1,85 @@
+"""
+Document data access for the API
+Document.file_data is deferred with raiseload in the model, so loading a
+Document never pulls the PDF and touching the attribute raises instead of
+fetching it behind the caller's back; the bytes are read explicitly via
+storage.load_file_data or streamed by downloads.py. Ownership checks that
+don't need the row select only its id.
+
+Conditional GETs compare ETags built from the version counters on the
+document (content_version for blocks, annotation_version, metadata_version),
+which are looked up on their own so a 304 never loads the row.
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .models import Document
+
+
+def owned_documents(db: Session, user_id: str):
+    """Query of the documents a user owns."""
+    return db.query(Document).filter(Document.user_id == user_id)
+
+
+def get_owned_document(db: Session, doc_id: str, user_id: str):
+    """The user's document (without its PDF bytes), or None."""
+    return owned_documents(db, user_id).filter(Document.id == doc_id).first()
+
+
+def owns_document(db: Session, doc_id: str, user_id: str) -> bool:
+    return db.query(Document.id).filter(
+        Document.id == doc_id,
+        Document.user_id == user_id
+    ).first() is not None
+
+
+def find_document(db: Session, doc_id: str):
+    """A document by id regardless of owner (without its PDF bytes), or None."""
+    return db.query(Document).filter(Document.id == doc_id).first()
+
+
+def document_state(db: Session, doc_id: str, user_id: str):
+    """The columns a document's ETag derives from, for the user's document (or None)."""
+    return db.query(
+        Document.metadata_version,
+        Document.status,
+        Document.pages_ready
+    ).filter(
+        Document.id == doc_id,
+        Document.user_id == user_id
+    ).first()
+
+
+def annotation_version(db: Session, doc_id: str):
+    """Version of a document's annotation list, or None if there is no such document."""
+    return db.query(func.coalesce(Document.annotation_version, 0)).filter(Document.id == doc_id).scalar()
+
+
+def _bump(db: Session, column, doc_filter):
+    db.query(Document).filter(doc_filter).update(
+        {column: func.coalesce(column, 0) + 1},
+        synchronize_session=False
+    )
+
+
+def _doc_filter(doc_id: str, with_shared: bool):
+    if with_shared:
+        return (Document.id == doc_id) | (Document.source_doc_id == doc_id)
+    return Document.id == doc_id
+
+
+def bump_annotation_version(db: Session, doc_id: str, with_shared: bool = False):
+    """
+    Mark a document's annotations as changed (and those of the documents
+    sharing its blocks when with_shared). Does not commit.
+    """
+    _bump(db, Document.annotation_version, _doc_filter(doc_id, with_shared))
+
+
+def bump_metadata_version(db: Session, doc_id: str, with_shared: bool = False):
+    """
+    Mark a document's metadata as changed (and that of the documents
+    sharing its content when with_shared, e.g. after a TOC rebuild).
+    Does not commit.
+    """
+    _bump(db, Document.metadata_version, _doc_filter(doc_id, with_shared))
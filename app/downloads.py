@@ -0,0 +1,109 @@
+"""
+Streaming PDF downloads
+The stored file is sent in chunks read with substring() on the bytea
+column, so a download never holds the whole blob in the worker, and a
+single byte range (Range: bytes=...) reads only the chunks it covers.
+file_data uses uncompressed TOAST storage (see ensure_db_schema) so
+Postgres can fetch those slices without decompressing the whole value.
+Files in the blob store (Document.file_key) are streamed from there.
+"""
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from .models import Document
+from .storage import file_holder_id, require_blob_store
+
+logger = logging.getLogger("downloads")
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range starts past the end of the file."""
+
+
+def parse_range(header: str, length: int):
+    """
+    (start, end) inclusive for a single "bytes=" range, clamped to the
+    file. Returns None for headers that should be ignored (other units,
+    multiple ranges, malformed) and raises RangeNotSatisfiable past the end.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or not (first or last) or not (first + last).isdigit():
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(0, length - suffix), length - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= length:
+        raise RangeNotSatisfiable()
+    return start, min(int(last), length - 1) if last else length - 1
+
+
+class StoredFile:
+    """Where a document's PDF bytes are: a blob store key, or file_data of storage_id."""
+
+    def __init__(self, storage_id: str, file_key: str, length: int):
+        self.storage_id = storage_id
+        self.file_key = file_key
+        self.length = length
+
+
+def stored_file(db_session: Session, doc_id: str):
+    """Location and size of a document's PDF, without reading it (None if there is none)."""
+    storage_id = file_holder_id(db_session, doc_id)
+    if not storage_id:
+        return None
+    row = db_session.query(Document.file_key, func.octet_length(Document.file_data)).filter(
+        Document.id == storage_id
+    ).first()
+    if not row:
+        return None
+    file_key, length = row
+    if file_key:
+        length = require_blob_store().size(file_key)
+    if not length:
+        return None
+    return StoredFile(storage_id, file_key, length)
+
+
+def iter_file_data(stored: StoredFile, start: int, end: int, chunk_size: int = None):
+    """
+    Yield bytes start..end (inclusive) of a stored PDF in chunks. Uses its
+    own session, since the response is streamed after the request's
+    session has been closed.
+    """
+    chunk_size = chunk_size or settings.DOWNLOAD_CHUNK_SIZE
+    if stored.file_key:
+        yield from require_blob_store().iter_range(stored.file_key, start, end, chunk_size)
+        return
+
+    storage_id = stored.storage_id
+    db = SessionLocal()
+    try:
+        position = start
+        while position <= end:
+            size = min(chunk_size, end - position + 1)
+            # substring() offsets are 1-based
+            chunk = db.query(func.substring(Document.file_data, position + 1, size)).filter(
+                Document.id == storage_id
+            ).scalar()
+            if not chunk:
+                logger.warning(f"File data of {storage_id} ended early at byte {position}")
+                return
+            yield bytes(chunk)
+            position += len(chunk)
+    finally:
+        db.close()
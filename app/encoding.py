@@ -0,0 +1,152 @@
+"""
+Content negotiation for the block endpoints
+Block lists are JSON unless the client sends Accept: application/msgpack
+(needs the optional msgpack package), and bodies of COMPRESS_MIN_BYTES or
+more are compressed with the best coding the client accepts of
+COMPRESS_ENCODINGS: zstd (zstandard package), br (brotli package) or gzip.
+Codings whose package isn't installed are skipped, so the API works with
+none of them. scripts/measure_block_encoding.py compares the options.
+"""
+import gzip
+import json
+import zlib
+
+from fastapi.responses import Response, StreamingResponse
+
+from .config import settings
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_ACCEPT = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+# Negotiated responses must name what they were negotiated on (and so must their 304s)
+VARY = "Accept, Accept-Encoding"
+
+# Levels for dynamic responses: most of the size win at a fraction of the max-level CPU
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+
+def _import(name: str):
+    try:
+        return __import__(name)
+    except ImportError:
+        return None
+
+
+msgpack = _import("msgpack")
+brotli = _import("brotli")
+zstandard = _import("zstandard")
+
+AVAILABLE_ENCODINGS = {"gzip"} | ({"br"} if brotli else set()) | ({"zstd"} if zstandard else set())
+
+
+class Negotiated:
+    """Media type and content coding picked for a request (encoding None = identity)."""
+
+    def __init__(self, media_type: str, encoding: str):
+        self.media_type = media_type
+        self.encoding = encoding
+
+    @property
+    def variant(self) -> str:
+        """Suffix that keeps ETags distinct per representation."""
+        kind = "msgpack" if self.media_type == MSGPACK_MEDIA_TYPE else "json"
+        return f"{kind}-{self.encoding or 'identity'}"
+
+
+def _accepted_codings(header: str) -> dict:
+    """{coding: q} from an Accept-Encoding header."""
+    codings = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[name] = q
+    return codings
+
+
+def choose_encoding(accept_encoding: str):
+    """The best content coding the client accepts and the server has, or None."""
+    if not accept_encoding:
+        return None
+    accepted = _accepted_codings(accept_encoding)
+    best, best_q = None, 0.0
+    for name in settings.COMPRESS_ENCODINGS:
+        if name not in AVAILABLE_ENCODINGS:
+            continue
+        q = accepted.get(name, accepted.get("*", 0.0))
+        # Ties go to the server's order (COMPRESS_ENCODINGS)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def negotiate(request, allow_msgpack: bool = True) -> Negotiated:
+    accept = request.headers.get("accept", "")
+    media_type = JSON_MEDIA_TYPE
+    if allow_msgpack and msgpack is not None and any(t in accept for t in _MSGPACK_ACCEPT):
+        media_type = MSGPACK_MEDIA_TYPE
+    return Negotiated(media_type, choose_encoding(request.headers.get("accept-encoding", "")))
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding: str):
+    """Compress an iterator of byte chunks as one stream, flushing after each chunk."""
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        step = lambda chunk: compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        finish = compressor.flush
+    elif encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        step = lambda chunk: compressor.process(chunk) + compressor.flush()
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+        step = lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    # Flushing per chunk lets the client decode pages as they arrive
+    for chunk in chunks:
+        data = step(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def encoded_response(negotiated: Negotiated, json_body: bytes, headers: dict) -> Response:
+    """
+    Response for a JSON body (as produced by page_cache.encode_payloads) in
+    the negotiated media type and content coding.
+    """
+    body = json_body
+    if negotiated.media_type == MSGPACK_MEDIA_TYPE:
+        body = msgpack.packb(json.loads(json_body), use_bin_type=True)
+    headers = dict(headers)
+    if negotiated.encoding and len(body) >= settings.COMPRESS_MIN_BYTES:
+        body = compress(body, negotiated.encoding)
+        headers["Content-Encoding"] = negotiated.encoding
+    return Response(content=body, media_type=negotiated.media_type, headers=headers)
+
+
+def encoded_stream(negotiated: Negotiated, chunks, media_type: str, headers: dict) -> StreamingResponse:
+    """Streamed response of already-serialized chunks, compressed as negotiated."""
+    headers = dict(headers)
+    if negotiated.encoding:
+        chunks = compress_stream(chunks, negotiated.encoding)
+        headers["Content-Encoding"] = negotiated.encoding
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
@@ -0,0 +1,237 @@
+"""
+Content-addressed image storage
+Image bytes live once per distinct content in image_blobs, keyed by SHA-256,
+and blocks reference them through Block.image_hash.
+"""
+import time
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+
+import fitz  # PyMuPDF
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .models import Block, ImageBlob
+from .storage import get_blob_store, image_key, load_file_data
+
+logger = logging.getLogger("images")
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "bmp": "image/bmp",
+    "tif": "image/tiff",
+    "tiff": "image/tiff",
+    "jpx": "image/jp2",
+    "jp2": "image/jp2",
+    "webp": "image/webp",
+}
+
+
+# Formats browsers display natively; anything else (JBIG2, JPX, ...) becomes PNG
+BROWSER_FORMATS = {"png", "jpg", "jpeg", "gif", "webp", "bmp"}
+
+
+def media_type_for(ext: str) -> str:
+    return MEDIA_TYPES.get((ext or "png").lower(), "application/octet-stream")
+
+
+def to_browser_format(data: bytes, ext: str) -> tuple:
+    """Return (bytes, ext), converting formats browsers can't show to PNG."""
+    if (ext or "png").lower() in BROWSER_FORMATS:
+        return data, ext or "png"
+    try:
+        pix = fitz.Pixmap(data)
+        if pix.colorspace and pix.colorspace.n > 3:
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        return pix.tobytes("png"), "png"
+    except Exception as e:
+        logger.warning(f"Could not convert {ext} image to PNG, storing as is: {e}")
+        return data, ext
+
+
+def extract_xref_image(pdf, xref: int) -> tuple:
+    """
+    Load an image by xref in its original format where browsers can show it.
+    Images with a soft mask, or in other formats, are rendered to PNG.
+    Returns (bytes, ext).
+    """
+    info = pdf.extract_image(xref)
+    if not info or not info.get("image"):
+        raise ValueError(f"xref {xref} is not an image")
+
+    ext = info["ext"]
+    if not info.get("smask") and ext.lower() in BROWSER_FORMATS:
+        return info["image"], ext
+
+    pix = fitz.Pixmap(pdf, xref)
+    if pix.colorspace and pix.colorspace.n > 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    if info.get("smask"):
+        pix = fitz.Pixmap(pix, fitz.Pixmap(pdf, info["smask"]))
+    return pix.tobytes("png"), "png"
+
+
+def guess_ext(data: bytes) -> str:
+    """Best-effort format sniffing for bytes stored without their extension."""
+    if data.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if data.startswith(b"GIF8"):
+        return "gif"
+    if data.startswith(b"\x00\x00\x00\x0cjP  ") or data.startswith(b"\xff\x4f\xff\x51"):
+        return "jpx"
+    return "png"
+
+
+class ImageCollector:
+    """
+    Deduplicates the images of one ingest and writes new blobs per batch.
+
+    Recently seen images are remembered (bounded LRU) with their digest, so a
+    logo repeated on every page is compared by bytes instead of re-hashed.
+    Blobs already stored (by this or any other document) are never re-sent.
+    """
+    RECENT_IMAGES = 64
+
+    def __init__(self):
+        self._recent = OrderedDict()  # (size, head, tail) -> (bytes, digest)
+        self._written = set()         # digests known to be in image_blobs
+        self.pending = {}             # digest -> (bytes, media_type)
+        self.images = 0
+        self.image_bytes = 0
+        self.stored_bytes = 0
+        self.seconds = 0.0            # time spent in add (hashing, conversion)
+
+    def add(self, data: bytes, ext: str) -> str:
+        """Register image bytes and return their content hash."""
+        started = time.perf_counter()
+        self.images += 1
+        self.image_bytes += len(data)
+        try:
+            key = (len(data), data[:64], data[-64:])
+            recent = self._recent.get(key)
+            if recent is not None and recent[0] == data:
+                self._recent.move_to_end(key)
+                return recent[1]
+
+            digest = hashlib.sha256(data).hexdigest()
+            self._recent[key] = (data, digest)
+            if len(self._recent) > self.RECENT_IMAGES:
+                self._recent.popitem(last=False)
+
+            if digest not in self._written and digest not in self.pending:
+                stored, stored_ext = to_browser_format(data, ext)
+                self.pending[digest] = (stored, media_type_for(stored_ext))
+            return digest
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def flush(self, db_session: Session):
+        """Insert pending blobs that are not stored yet (call before inserting blocks)."""
+        if not self.pending:
+            return
+
+        existing = {
+            h for (h,) in db_session.query(ImageBlob.hash).filter(ImageBlob.hash.in_(list(self.pending)))
+        }
+        rows = [
+            {
+                "hash": digest,
+                "data": data,
+                "media_type": media_type,
+                "size": len(data),
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            for digest, (data, media_type) in self.pending.items()
+            if digest not in existing
+        ]
+        store = get_blob_store()
+        if store is not None:
+            # Bytes go to the blob store first, so a stored row always has them
+            for row in rows:
+                row["storage_key"] = image_key(row["hash"])
+                store.put(row["storage_key"], row.pop("data"))
+        if rows:
+            # Concurrent ingests of the same image are fine: first insert wins
+            db_session.execute(insert(ImageBlob).values(rows).on_conflict_do_nothing(index_elements=["hash"]))
+            self.stored_bytes += sum(r["size"] for r in rows)
+
+        self._written.update(self.pending)
+        self.pending = {}
+
+
+_materialize_locks = weakref.WeakValueDictionary()  # doc_id -> Lock while someone holds it
+_materialize_locks_guard = threading.Lock()
+
+
+def materialize_document_images(db_session: Session, doc_id: str) -> int:
+    """
+    Lazy-load path for a deferred image: extract all of the document's
+    deferred images in one pass, since every pass reads the whole PDF (a
+    full object download with the S3 store). Concurrent requests for the
+    same document wait for that pass instead of starting their own.
+    """
+    with _materialize_locks_guard:
+        lock = _materialize_locks.get(doc_id)
+        if lock is None:
+            lock = _materialize_locks[doc_id] = threading.Lock()
+    with lock:
+        return materialize_images(db_session, doc_id)
+
+
+def materialize_images(db_session: Session, doc_id: str, batch_size: int = 50,
+                       file_path: str = None) -> int:
+    """
+    Extract the deferred images of a document by xref, store them and link
+    their blocks. Each xref is extracted once however many blocks use it.
+    file_path reads the PDF from disk instead of the stored file.
+    Returns the number of blocks updated.
+    """
+    query = db_session.query(Block.image_xref).filter(
+        Block.doc_id == doc_id,
+        Block.image_xref.isnot(None),
+        Block.image_hash.is_(None)
+    )
+    xrefs = sorted(x for (x,) in query.distinct())
+    if not xrefs:
+        return 0
+
+    if file_path:
+        pdf = fitz.open(file_path)
+    else:
+        file_data = load_file_data(db_session, doc_id)
+        if not file_data:
+            return 0
+        pdf = fitz.open(stream=file_data, filetype="pdf")
+
+    images = ImageCollector()
+    updated = 0
+    try:
+        for start in range(0, len(xrefs), batch_size):
+            digests = {}
+            for x in xrefs[start:start + batch_size]:
+                try:
+                    data, ext = extract_xref_image(pdf, x)
+                except Exception as e:
+                    logger.warning(f"Image xref {x} of doc {doc_id} could not be extracted: {e}")
+                    continue
+                digests[x] = images.add(data, ext)
+
+            images.flush(db_session)
+            for x, digest in digests.items():
+                updated += db_session.query(Block).filter(
+                    Block.doc_id == doc_id,
+                    Block.image_xref == x,
+                    Block.image_hash.is_(None)
+                ).update({Block.image_hash: digest}, synchronize_session=False)
+            db_session.commit()
+    finally:
+        pdf.close()
+
+    return updated
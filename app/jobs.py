@@ -0,0 +1,285 @@
+"""
+Background ingestion jobs
+Runs parse_pdf off the request path and tracks progress. Parsing is
+CPU-bound Python and PyMuPDF work that holds the GIL, so with
+INGEST_EXECUTOR=process (default) each job runs in a worker process and
+reports progress back over a queue; the API process only keeps the job
+registry. INGEST_EXECUTOR=thread runs jobs in a thread pool of the API
+process instead.
+"""
+import time
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from . import metrics
+from .config import settings
+from .database import SessionLocal
+from .images import materialize_images
+from .metrics import ParseStats
+from .models import Document
+from .page_cache import prefill_page_cache
+from .parser import parse_pdf
+from .thumbnails import generate_thumbnails
+from .uploads import discard_spool
+
+logger = logging.getLogger("jobs")
+
+
+class JobQueueFull(Exception):
+    """Raised when the ingestion queue has no free slots."""
+
+
+class IngestJob:
+    def __init__(self, job_id: str, doc_id: str, user_id: str, title: str):
+        self.id = job_id
+        self.doc_id = doc_id
+        self.user_id = user_id
+        self.title = title
+        self.status = "queued"      # queued, running, done, failed
+        self.stage = "queued"       # queued, opening, extracting, saving, images, done
+        self.pages_processed = 0
+        self.total_pages = 0
+        self.error = None
+        self.metrics = None         # parse stats, see metrics.ParseStats
+        self.created_at = datetime.utcnow().isoformat()
+        self.finished_at = None
+
+    def report(self, stage: str, pages_processed: int, total_pages: int):
+        """Progress callback handed to parse_pdf."""
+        self.stage = stage
+        self.pages_processed = pages_processed
+        self.total_pages = total_pages
+
+
+# Set in ingest worker processes: progress and parse stats go back to the API process
+_progress_queue = None
+
+
+def _forward_parse_stats(doc_id: str, stats: dict):
+    _progress_queue.put(("parse", doc_id, stats))
+
+
+def _init_ingest_process(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # The API process adds them to its counters and runs its parse hooks
+    metrics.add_parse_hook(_forward_parse_stats)
+
+
+class _ProcessJob(IngestJob):
+    """IngestJob inside a worker process: progress is sent to the API process."""
+
+    def report(self, stage: str, pages_processed: int, total_pages: int):
+        super().report(stage, pages_processed, total_pages)
+        _progress_queue.put(("progress", self.id, stage, pages_processed, total_pages))
+
+
+# Job attributes copied back to the API process when a worker finishes
+_JOB_FIELDS = ("status", "stage", "pages_processed", "total_pages", "error", "metrics")
+
+
+def _run_in_process(fn, job_id: str, doc_id: str, user_id: str, title: str, total_pages: int, args, kwargs):
+    job = _ProcessJob(job_id, doc_id, user_id, title)
+    job.total_pages = total_pages
+    fn(job, *args, **kwargs)
+    return {field: getattr(job, field) for field in _JOB_FIELDS}
+
+
+class JobManager:
+    """
+    In-process job registry plus a bounded executor.
+    At most max_workers jobs parse concurrently and at most max_pending are
+    accepted (running + queued); submit raises JobQueueFull beyond that.
+    With processes, jobs run in a spawned process pool of max_workers and a
+    thread per running job waits for its result.
+    """
+    MAX_FINISHED = 1000  # finished jobs kept around for status polling
+
+    def __init__(self, max_workers: int, max_pending: int, processes: bool = True):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._max_workers = max_workers
+        self._processes = processes
+        self._process_pool = None  # started with the first job
+        self._progress_queue = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: IngestJob, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull("Too many documents are being processed, try again shortly")
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+
+        def run():
+            try:
+                if self._processes:
+                    self._run_in_process(job, fn, args, kwargs)
+                else:
+                    fn(job, *args, **kwargs)
+            finally:
+                job.finished_at = datetime.utcnow().isoformat()
+                self._slots.release()
+
+        self._executor.submit(run)
+        return job
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                ctx = multiprocessing.get_context("spawn")
+                if self._progress_queue is None:
+                    self._progress_queue = ctx.Queue()
+                    threading.Thread(target=self._drain_progress, name="ingest-progress", daemon=True).start()
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    mp_context=ctx,
+                    initializer=_init_ingest_process,
+                    initargs=(self._progress_queue,),
+                )
+            return self._process_pool
+
+    def _run_in_process(self, job: IngestJob, fn, args, kwargs):
+        pool = self._pool()
+        try:
+            result = pool.submit(
+                _run_in_process, fn, job.id, job.doc_id, job.user_id, job.title, job.total_pages, args, kwargs
+            ).result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # The worker died (e.g. killed for memory); later jobs get a fresh pool
+                with self._lock:
+                    if self._process_pool is pool:
+                        self._process_pool = None
+            logger.error(f"Ingest job {job.id} failed in its worker process for doc {job.doc_id}: {e}")
+            result = {"status": "failed", "error": str(e) or type(e).__name__}
+            _mark_failed(job.doc_id)
+        with self._lock:
+            for field, value in result.items():
+                setattr(job, field, value)
+
+    def _drain_progress(self):
+        while True:
+            try:
+                message = self._progress_queue.get()
+            except (EOFError, OSError):
+                return
+            try:
+                if message[0] == "parse":
+                    _, doc_id, stats = message
+                    metrics.report_parse(doc_id, stats)
+                    continue
+                _, job_id, stage, pages_processed, total_pages = message
+                with self._lock:
+                    job = self._jobs.get(job_id)
+                    # A late message must not overwrite the final state
+                    if job is not None and job.status not in ("done", "failed"):
+                        job.status = "running"
+                        job.report(stage, pages_processed, total_pages)
+            except Exception as e:
+                logger.warning(f"Bad ingest progress message {message!r}: {e}")
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        finished = [j.id for j in self._jobs.values() if j.finished_at]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager(
+    settings.INGEST_MAX_JOBS, settings.INGEST_MAX_PENDING, processes=settings.INGEST_EXECUTOR == "process"
+)
+
+
+def _mark_failed(doc_id: str):
+    db = SessionLocal()
+    try:
+        db.query(Document).filter(Document.id == doc_id).update({Document.status: "failed"})
+        db.commit()
+    except Exception:
+        db.rollback()
+    finally:
+        db.close()
+
+
+def run_ingest_job(job: IngestJob, spool_path: str):
+    """
+    Parse an uploaded document whose Document row was already persisted
+    with status "processing". Uses its own DB session (runs in a worker process or thread).
+    The PDF is read from the spooled upload, which is removed afterwards.
+    """
+    db = SessionLocal()
+    job.status = "running"
+    stats = ParseStats()
+    try:
+        parse_pdf(
+            file_path=spool_path,
+            db_session=db,
+            doc_id=job.doc_id,
+            title=job.title,
+            user_id=job.user_id,
+            progress=job.report,
+            stats=stats,
+        )
+        job.metrics = stats.as_dict()
+        # Deferred images (PARSER_DEFER_IMAGES) are extracted once the text
+        # is readable; a request before that extracts them all (one pass).
+        job.report("images", job.total_pages, job.total_pages)
+        started = time.perf_counter()
+        materialize_images(db, job.doc_id, file_path=spool_path)
+        job.metrics["seconds"]["materialize_images"] = round(time.perf_counter() - started, 4)
+        content_hash = db.query(Document.content_hash).filter(Document.id == job.doc_id).scalar()
+        if content_hash:
+            # The thumbnail endpoint renders lazily, so a failure here isn't fatal
+            started = time.perf_counter()
+            try:
+                generate_thumbnails(db, content_hash, file_path=spool_path)
+                job.metrics["seconds"]["thumbnails"] = round(time.perf_counter() - started, 4)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Thumbnail generation failed for doc {job.doc_id}: {e}")
+        if settings.PAGE_CACHE_PREFILL:
+            # Pages are serialized on first request otherwise
+            started = time.perf_counter()
+            try:
+                # A worker process's LRU isn't the one requests are served from
+                prefill_page_cache(db, job.doc_id, in_memory=_progress_queue is None)
+                job.metrics["seconds"]["page_cache"] = round(time.perf_counter() - started, 4)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Page cache prefill failed for doc {job.doc_id}: {e}")
+        job.report("done", job.total_pages, job.total_pages)
+        job.status = "done"
+        logger.info(f"Ingest job {job.id} finished for doc {job.doc_id}")
+    except Exception as e:
+        db.rollback()
+        job.status = "failed"
+        job.error = str(e)
+        logger.error(f"Ingest job {job.id} failed for doc {job.doc_id}: {e}", exc_info=True)
+        try:
+            db.query(Document).filter(Document.id == job.doc_id).update({Document.status: "failed"})
+            db.commit()
+        except Exception:
+            db.rollback()
+    finally:
+        db.close()
+        discard_spool(spool_path)
@@ -2,23 +2,52 @@
 PDF Reader Backend API
 FastAPI application for processing PDF files with PyMuPDF
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 import shutil
 import uuid
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 import logging
 from datetime import datetime
 import json
+import fitz
 from sqlalchemy import text
 
 from .config import settings
-from .database import engine, get_db
+from .database import SessionLocal, engine, get_db, get_read_db, run_read, db_diagnostics
 
 
-from .parser import parse_pdf
+from .auth import require_ops_token
+from .blocks import block_payloads, block_rows_query, iter_block_payloads
+from .compact import META_VERSION_VERBOSE, expand_block_meta, is_compact
+from .dedupe import (
+    create_shared_document, detach_for_update,
+    ensure_content_hash, lookup_parsed_copy, release_document
+)
+from .documents import (
+    annotation_version, bump_annotation_version, bump_metadata_version, document_state,
+    find_document, get_owned_document, owned_documents, owns_document
+)
+from .downloads import RangeNotSatisfiable, iter_file_data, parse_range, stored_file
+from .encoding import VARY, encoded_response, encoded_stream, negotiate
+from .images import materialize_document_images
+from .page_cache import (
+    bump_content_version, delete_page_payloads, encode_payloads, join_pages, page_payloads, page_source
+)
+from .page_render import (
+    IMAGE_FORMATS, MIN_ZOOM, RenderError, normalize_zoom, page_sizes, render_etag, render_key, render_page,
+    tile_grid
+)
+from .thumbnails import (
+    DEFAULT_SIZE as DEFAULT_THUMBNAIL_SIZE, delete_unused_thumbnails, get_thumbnail, thumbnail_etag
+)
+from .storage import delete_blobs, get_blob_store, pdf_key, require_blob_store, unreferenced_file_key
+from .uploads import UploadTooLarge, spool_upload, store_file_data
+from .jobs import IngestJob, JobQueueFull, job_manager, run_ingest_job
+from . import metrics
 from . import models
 from . import schemas
 
@@ -75,6 +104,18 @@ def health():
     return {"status": "ok", "version": "3.0.0"}
 
 
+@app.get("/api/metrics", dependencies=[Depends(require_ops_token)])
+def get_metrics():
+    """In-process counters (e.g. ingest.cache_hit / ingest.cache_miss)"""
+    return metrics.snapshot()
+
+
+@app.get("/api/diagnostics/db", dependencies=[Depends(require_ops_token)])
+def get_db_diagnostics():
+    """Connection pool gauges, checkout waits and recent slow queries"""
+    return db_diagnostics()
+
+
 # ============ Document Endpoints ============
 
 # @app.post("/api/upload", response_model=schemas.UploadResponse)
@@ -119,14 +160,18 @@ def login(user: UserLogin):
 
 # ============ Document Endpoints ============
 
-@app.post("/api/upload", response_model=schemas.UploadResponse)
-async def upload_pdf(
+@app.post("/api/upload", response_model=schemas.UploadResponse, status_code=202)
+def upload_pdf(
+    response: Response,
     file: UploadFile = File(...), 
     db: Session = Depends(get_db),
     current_user: any = Depends(get_current_user)
 ):
     """
-    Upload and process a PDF file (Authenticated)
+    Upload a PDF file (Authenticated).
+    The file is stored right away and parsed by a background job;
+    poll /api/jobs/{job_id} for progress.
+    A file that was already parsed (same bytes) is ready immediately (200).
     """
     logger.info(f"User {current_user.id} uploading file: {file.filename}")
     
@@ -144,152 +189,375 @@ async def upload_pdf(
     
     doc_id = str(uuid.uuid4())[:8]
     
-    try:
-        file_content = await file.read()
-        logger.info(f"File read successful ({len(file_content)} bytes). Parsing...")
-            
-        # Extract user ID safely
-        user_id = getattr(current_user, "id", None)
-        if not user_id and isinstance(current_user, dict):
-            user_id = current_user.get("id")
-            
-        if not user_id:
-            logger.error(f"Could not extract user ID from user object: {current_user}")
-            raise HTTPException(status_code=500, detail="User identification failed")
-
-        doc_record = parse_pdf(
-            file_path=file.filename,
-            db_session=db,
-            doc_id=doc_id,
-            title=file.filename,
-            file_bytes=file_content,
-            user_id=user_id
-        )
-        
-        logger.info(f"Document {doc_id} processed successfully for user {user_id}")
+    # Extract user ID safely
+    user_id = getattr(current_user, "id", None)
+    if not user_id and isinstance(current_user, dict):
+        user_id = current_user.get("id")
         
+    if not user_id:
+        logger.error(f"Could not extract user ID from user object: {current_user}")
+        raise HTTPException(status_code=500, detail="User identification failed")
+
+    # Stream the body to a temp file (hashed and size-checked per chunk);
+    # from here on the PDF is only read from disk
+    try:
+        upload = spool_upload(file.file, settings.MAX_FILE_SIZE)
+        logger.info(f"File spooled ({upload.size} bytes). Queueing...")
+    except UploadTooLarge as e:
+        logger.warning(f"Upload failed: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error reading upload: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=400, detail=f"Error reading upload: {str(e)}")
+
+    try:
+        return _queue_upload(upload, response, db, doc_id, file.filename, user_id)
+    except BaseException:
+        upload.discard()
+        raise
+
+
+def _queue_upload(upload, response: Response, db: Session, doc_id: str, filename: str, user_id: str):
+    """Store a spooled upload and hand it to an ingest job (which removes the spool file)."""
+    # Same bytes already parsed: reuse blocks, images and TOC
+    source = lookup_parsed_copy(db, upload.sha256)
+    if source:
+        doc_record = create_shared_document(db, source, doc_id, filename, user_id)
+        upload.discard()
+        response.status_code = 200
         return schemas.UploadResponse(
             status="ok",
             document_id=doc_record.id,
             title=doc_record.title,
             total_pages=doc_record.total_pages
         )
+
+    try:
+        # Page count only; full parsing happens in the background job
+        with fitz.open(upload.path, filetype="pdf") as pdf:
+            total_pages = len(pdf)
     except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+        logger.error(f"Error reading PDF: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=400, detail=f"Invalid PDF: {str(e)}")
 
+    job = IngestJob(str(uuid.uuid4()), doc_id, user_id, filename)
+    job.total_pages = total_pages
 
-@app.get("/api/documents", response_model=schemas.DocumentListResponse)
-def list_documents(
-    db: Session = Depends(get_db),
+    try:
+        doc_record = models.Document(
+            id=doc_id,
+            title=filename,
+            file_path=filename,
+            total_pages=total_pages,
+            created_at=datetime.utcnow().isoformat(),
+            user_id=user_id,
+            status="processing",
+            pages_ready=0,
+            content_hash=upload.sha256
+        )
+        db.add(doc_record)
+        db.flush()
+        store_file_data(db, doc_id, upload)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        # The blob store write isn't part of the transaction
+        if get_blob_store() is not None:
+            delete_blobs([unreferenced_file_key(db, pdf_key(upload.sha256))])
+        logger.error(f"Error storing PDF: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error storing PDF: {str(e)}")
+
+    try:
+        job_manager.submit(job, run_ingest_job, upload.path)
+    except JobQueueFull as e:
+        file_key = doc_record.file_key
+        db.delete(doc_record)
+        db.commit()
+        delete_blobs([unreferenced_file_key(db, file_key)])
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    logger.info(f"Document {doc_id} queued as job {job.id} for user {user_id}")
+    
+    return schemas.UploadResponse(
+        status="processing",
+        document_id=doc_id,
+        title=filename,
+        total_pages=total_pages,
+        job_id=job.id
+    )
+
+
+@app.get("/api/jobs/{job_id}", response_model=schemas.JobResponse)
+def get_job(
+    job_id: str,
     current_user: any = Depends(get_current_user)
 ):
-    """List documents owned by the user"""
-    logger.info(f"User {current_user.id} fetching document list")
-    from sqlalchemy.orm import defer
-    
-    docs = db.query(models.Document).filter(
-        models.Document.user_id == current_user.id
-    ).options(
-        defer(models.Document.file_data)
-    ).all()
+    """Get the progress of a background ingestion job (Owner only)"""
+    job = job_manager.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return schemas.JobResponse(
+        id=job.id,
+        document_id=job.doc_id,
+        status=job.status,
+        stage=job.stage,
+        pages_processed=job.pages_processed,
+        total_pages=job.total_pages,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        metrics=job.metrics
+    )
+
+
+def _list_documents(db: Session, user_id: str):
+    logger.info(f"User {user_id} fetching document list")
+    docs = owned_documents(db, user_id).all()
     
-    logger.info(f"Found {len(docs)} documents for user {current_user.id}")
+    logger.info(f"Found {len(docs)} documents for user {user_id}")
     return schemas.DocumentListResponse(
         total=len(docs),
         documents=docs
     )
 
 
+@app.get("/api/documents", response_model=schemas.DocumentListResponse)
+async def list_documents(
+    db=Depends(get_read_db),
+    current_user: any = Depends(get_current_user)
+):
+    """List documents owned by the user"""
+    return await run_read(db, _list_documents, current_user.id)
+
+
 @app.get("/api/documents/{doc_id}", response_model=schemas.DocumentResponse)
 def get_document(
     doc_id: str, 
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: any = Depends(get_current_user)
 ):
     """Get document metadata (Owner only)"""
     logger.info(f"User {current_user.id} fetching metadata for doc {doc_id}")
-    doc = db.query(models.Document).filter(
-        models.Document.id == doc_id,
-        models.Document.user_id == current_user.id
-    ).first()
+    state = document_state(db, doc_id, current_user.id)
     
-    if not doc:
+    if not state:
         logger.warning(f"Document {doc_id} not found for user {current_user.id}")
         raise HTTPException(status_code=404, detail="Document not found")
+
+    etag = _document_etag(doc_id, state)
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=_revalidate_headers(etag))
+
+    doc = get_owned_document(db, doc_id, current_user.id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    response.headers.update(_revalidate_headers(_document_etag(doc_id, doc)))
     return doc
 
 
-@app.get("/api/documents/{doc_id}/download")
+@app.api_route("/api/documents/{doc_id}/download", methods=["GET", "HEAD"])
 def download_document(
     doc_id: str, 
+    request: Request,
     db: Session = Depends(get_db),
     current_user: any = Depends(get_current_user)
 ):
     """
     Download/View the original PDF file (Owner only)
+    Streamed from the database in chunks; supports a single byte range
+    (Range / If-Range) and ETag revalidation, as used by PDF.js for
+    incremental loading.
     """
     logger.info(f"User {current_user.id} downloading doc {doc_id}")
-    from fastapi.responses import Response
     
-    doc = db.query(models.Document).filter(
-        models.Document.id == doc_id,
-        models.Document.user_id == current_user.id
-    ).first()
+    doc = get_owned_document(db, doc_id, current_user.id)
     
-    if not doc or not doc.file_data:
+    stored = stored_file(db, doc.id) if doc else None
+    if not stored:
         raise HTTPException(status_code=404, detail="Document data not found")
+    length = stored.length
         
     # Determine filename
     filename = (doc.title or f"{doc_id}.pdf")
     if not filename.lower().endswith(".pdf"):
         filename += ".pdf"
-        
-    return Response(
-        content=doc.file_data, 
+
+    etag = f'"{ensure_content_hash(db, doc)}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f'inline; filename="{filename}"'
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    status_code, start, end = 200, 0, length - 1
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, length)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+        if byte_range:
+            status_code, (start, end) = 206, byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, media_type="application/pdf", headers=headers)
+    return StreamingResponse(
+        iter_file_data(stored, start, end),
+        status_code=status_code,
         media_type="application/pdf",
-        headers={"Content-Disposition": f'inline; filename="{filename}"'}
+        headers=headers
     )
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match already names this ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+# Thumbnails and page images are keyed by PDF content, so a URL's bytes never change for a given ETag
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Documents, blocks and annotations change; clients keep them but revalidate with If-None-Match
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+def _revalidate_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+
+
+def _document_etag(doc_id: str, state) -> str:
+    return f'"doc-{doc_id}-{state.metadata_version or 0}-{state.status}-{state.pages_ready or 0}"'
+
+
+def _blocks_etag(source, variant: str):
+    """ETag of a block response (see page_cache.PageSource), or None while the blocks are still being written"""
+    if source.status == "processing":
+        return None
+    return f'"blocks-{source.content_id}-{source.version}-{variant}"'
+
+
 @app.get("/api/documents/{doc_id}/thumbnail")
 def get_document_thumbnail(
     doc_id: str,
+    request: Request,
+    size: str = Query(DEFAULT_THUMBNAIL_SIZE, pattern="^(sm|md)$"),
     db: Session = Depends(get_db),
     current_user: any = Depends(get_current_user)
 ):
-    """Generate a thumbnail of the first page of the PDF"""
-    from fastapi.responses import Response
-    import fitz
+    """First-page thumbnail (JPEG), rendered once per PDF and stored"""
+    doc = get_owned_document(db, doc_id, current_user.id)
     
-    doc = db.query(models.Document).filter(
-        models.Document.id == doc_id,
-        models.Document.user_id == current_user.id
-    ).first()
-    
-    if not doc or not doc.file_data:
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
+
+    if doc.content_hash:
+        etag = thumbnail_etag(doc.content_hash, size)
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL})
     
     try:
-        pdf = fitz.open(stream=doc.file_data, filetype="pdf")
-        page = pdf[0]  # First page
-        
-        # Render at 2x for good quality thumbnails
-        mat = fitz.Matrix(2.0, 2.0)
-        pix = page.get_pixmap(matrix=mat)
-        img_bytes = pix.tobytes("png")
-        pdf.close()
-        
-        logger.info(f"Generated thumbnail for doc {doc_id}")
-        return Response(
-            content=img_bytes,
-            media_type="image/png",
-            headers={"Cache-Control": "public, max-age=3600"}
-        )
+        thumbnail = get_thumbnail(db, doc, size)
     except Exception as e:
         logger.error(f"Thumbnail generation failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
 
+    if not thumbnail:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    headers = {
+        "ETag": thumbnail_etag(thumbnail.content_hash, size),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL
+    }
+    if thumbnail.storage_key:
+        return StreamingResponse(
+            require_blob_store().iter_range(thumbnail.storage_key),
+            media_type=thumbnail.media_type,
+            headers=headers
+        )
+    return Response(content=thumbnail.data, media_type=thumbnail.media_type, headers=headers)
+
+
+@app.get("/api/documents/{doc_id}/pages/{page_number}/image")
+def get_page_image(
+    doc_id: str,
+    page_number: int,
+    request: Request,
+    zoom: float = Query(1.0, ge=MIN_ZOOM, le=settings.RENDER_MAX_ZOOM),
+    tile: Optional[str] = Query(None, pattern=r"^\d+,\d+$"),
+    image_format: str = Query("jpeg", alias="format", pattern="^(jpeg|png)$"),
+    db: Session = Depends(get_db),
+    current_user: any = Depends(get_current_user)
+):
+    """
+    Raster of one page at a zoom level (1.0 = 72 dpi), or of one tile of it:
+    tile=col,row selects the RENDER_TILE_SIZE pixel square at that grid
+    position. X-Tile-Grid gives the page's grid at this zoom and Link
+    headers name the neighbouring pages for prefetching.
+    """
+    doc = get_owned_document(db, doc_id, current_user.id)
+
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not 0 <= page_number < (doc.total_pages or 0):
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    content_hash = ensure_content_hash(db, doc)
+    if not content_hash:
+        raise HTTPException(status_code=404, detail="Document data not found")
+
+    zoom = normalize_zoom(zoom)
+    tile_position = tuple(int(n) for n in tile.split(",")) if tile else None
+    etag = render_etag(render_key(content_hash, page_number, zoom, tile_position, image_format))
+
+    sizes = page_sizes(db, doc, content_hash)
+    if not sizes or page_number >= len(sizes):
+        raise HTTPException(status_code=404, detail="Page not found")
+    columns, rows = tile_grid(sizes[page_number], zoom)
+    if tile_position and (tile_position[0] >= columns or tile_position[1] >= rows):
+        raise HTTPException(status_code=400, detail="Tile out of range")
+
+    query = request.url.query
+    links = [
+        f'</api/documents/{doc_id}/pages/{neighbour}/image{"?" + query if query else ""}>; rel="prefetch"'
+        for neighbour in (page_number + 1, page_number - 1)
+        if 0 <= neighbour < doc.total_pages
+    ]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "X-Tile-Grid": f"{columns}x{rows}",
+    }
+    if links:
+        headers["Link"] = ", ".join(links)
+
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = render_page(db, doc, content_hash, page_number, zoom, tile_position, image_format)
+    except RenderError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Page render failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to render page")
+
+    if data is None:
+        raise HTTPException(status_code=404, detail="Document data not found")
+
+    return Response(content=data, media_type=IMAGE_FORMATS[image_format], headers=headers)
+
 
 @app.delete("/api/documents/{doc_id}", response_model=schemas.StatusResponse)
 def delete_document(
@@ -300,10 +568,7 @@ def delete_document(
     """
     Delete a document and its associated data (Owner only)
     """
-    doc = db.query(models.Document).filter(
-        models.Document.id == doc_id,
-        models.Document.user_id == current_user.id
-    ).first()
+    doc = get_owned_document(db, doc_id, current_user.id)
     
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -320,12 +585,36 @@ def delete_document(
         # 1. Delete Annotations
         db.query(models.Annotation).filter(models.Annotation.doc_id == doc_id).delete()
         
-        # 2. Delete Blocks
+        # 2. Shared content moves to a document still using it
+        release_document(db, doc)
+        delete_page_payloads(db, doc_id)
+
+        # 3. Delete Blocks, then image blobs no other block references
+        image_hashes = [
+            h for (h,) in db.query(models.Block.image_hash).filter(
+                models.Block.doc_id == doc_id,
+                models.Block.image_hash.isnot(None)
+            ).distinct()
+        ]
         db.query(models.Block).filter(models.Block.doc_id == doc_id).delete()
+        unused_blobs = []  # blob store keys, removed once the rows are gone
+        if image_hashes:
+            still_used = db.query(models.Block.id).filter(models.Block.image_hash == models.ImageBlob.hash).exists()
+            unused_images = db.query(models.ImageBlob).filter(
+                models.ImageBlob.hash.in_(image_hashes),
+                ~still_used
+            )
+            unused_blobs += [key for (key,) in unused_images.with_entities(models.ImageBlob.storage_key)]
+            unused_images.delete(synchronize_session=False)
         
-        # 3. Delete Document
+        # 4. Delete Document, then its thumbnails and stored file if no other document has the same PDF
+        file_key = doc.file_key
         db.delete(doc)
+        db.flush()
+        unused_blobs += delete_unused_thumbnails(db, doc.content_hash)
+        unused_blobs.append(unreferenced_file_key(db, file_key))
         db.commit()
+        delete_blobs(unused_blobs)
     except Exception as e:
         db.rollback()
         logger.error(f"Error deleting document {doc_id}: {e}")
@@ -346,10 +635,7 @@ def update_document(
     """
     Update document metadata (e.g. theme) (Owner only)
     """
-    doc = db.query(models.Document).filter(
-        models.Document.id == doc_id,
-        models.Document.user_id == current_user.id
-    ).first()
+    doc = get_owned_document(db, doc_id, current_user.id)
     
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -358,6 +644,7 @@ def update_document(
         doc.theme = data.theme
     if data.title is not None:
         doc.title = data.title
+    bump_metadata_version(db, doc_id)
         
     db.commit()
     db.refresh(doc)
@@ -376,12 +663,7 @@ def start_reading_session(
     logger.info(f"User {current_user.id} starting reading session for doc {data.document_id}")
     
     # Verify the document belongs to the user
-    doc = db.query(models.Document).filter(
-        models.Document.id == data.document_id,
-        models.Document.user_id == current_user.id
-    ).first()
-    
-    if not doc:
+    if not owns_document(db, data.document_id, current_user.id):
         raise HTTPException(status_code=404, detail="Document not found")
     
     from datetime import datetime
@@ -433,18 +715,10 @@ def heartbeat_reading_session(
     return session
 
 
-@app.get("/api/documents/{doc_id}/stats", response_model=schemas.ReadingStatsResponse)
-def get_document_reading_stats(
-    doc_id: str,
-    db: Session = Depends(get_db),
-    current_user: any = Depends(get_current_user)
-):
-    """Get aggregated reading time stats for a document"""
-    from sqlalchemy import func
-    
+def _document_reading_stats(db: Session, doc_id: str, user_id: str):
     sessions = db.query(models.ReadingSession).filter(
         models.ReadingSession.document_id == doc_id,
-        models.ReadingSession.user_id == current_user.id
+        models.ReadingSession.user_id == user_id
     ).all()
     
     total_seconds = sum(s.duration_seconds or 0 for s in sessions)
@@ -460,8 +734,28 @@ def get_document_reading_stats(
     )
 
 
+@app.get("/api/documents/{doc_id}/stats", response_model=schemas.ReadingStatsResponse)
+async def get_document_reading_stats(
+    doc_id: str,
+    db=Depends(get_read_db),
+    current_user: any = Depends(get_current_user)
+):
+    """Get aggregated reading time stats for a document"""
+    return await run_read(db, _document_reading_stats, doc_id, current_user.id)
+
+
 # ============ Database Migration Helper (Dev Only) ============
 # ============ Database Migration Helper (Dev Only) ============
+def _ensure_column(conn, table: str, column: str, ddl_type: str):
+    """Add a column to an existing table if it is missing"""
+    result = conn.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_name=:table AND column_name=:column;"
+    ), {"table": table, "column": column})
+    if not result.fetchone():
+        logger.info(f"Migrating DB: Adding '{column}' column to '{table}' table")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
 @app.on_event("startup")
 def ensure_db_schema():
     """Ensure new columns exist in Postgres (Simple manual migration)"""
@@ -484,6 +778,38 @@ def ensure_db_schema():
                 logger.info("Migrating DB: Adding 'file_data' column to 'documents' table")
                 conn.execute(text("ALTER TABLE documents ADD COLUMN file_data BYTEA"))
             
+            # Columns added by later features
+            _ensure_column(conn, "documents", "status", "VARCHAR DEFAULT 'ready'")
+            _ensure_column(conn, "documents", "pages_ready", "INTEGER")
+            _ensure_column(conn, "documents", "style_palette", "JSONB")
+            _ensure_column(conn, "blocks", "meta_version", "INTEGER")
+            _ensure_column(conn, "blocks", "image_hash", "VARCHAR REFERENCES image_blobs(hash)")
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_blocks_image_hash ON blocks (image_hash)"))
+            _ensure_column(conn, "blocks", "image_xref", "INTEGER")
+            _ensure_column(conn, "documents", "content_hash", "VARCHAR")
+            _ensure_column(conn, "documents", "source_doc_id", "VARCHAR")
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_source_doc_id ON documents (source_doc_id)"))
+            _ensure_column(conn, "documents", "parser_version", "INTEGER")
+            _ensure_column(conn, "documents", "parse_metrics", "JSONB")
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_doc_block_order ON blocks (doc_id, page_number, block_order)"
+            ))
+            _ensure_column(conn, "documents", "file_key", "VARCHAR")
+            _ensure_column(conn, "documents", "content_version", "INTEGER DEFAULT 0")
+            _ensure_column(conn, "documents", "annotation_version", "INTEGER DEFAULT 0")
+            _ensure_column(conn, "documents", "metadata_version", "INTEGER DEFAULT 0")
+            _ensure_column(conn, "image_blobs", "storage_key", "VARCHAR")
+            _ensure_column(conn, "document_thumbnails", "storage_key", "VARCHAR")
+            # Uncompressed out-of-line storage, so ranged downloads read only their slices
+            # (applies to newly written files)
+            storage = conn.execute(text(
+                "SELECT attstorage FROM pg_attribute WHERE attrelid = 'documents'::regclass AND attname = 'file_data'"
+            )).scalar()
+            if storage and storage != "e":
+                logger.info("Migrating DB: Setting STORAGE EXTERNAL on 'documents.file_data'")
+                conn.execute(text("ALTER TABLE documents ALTER COLUMN file_data SET STORAGE EXTERNAL"))
+
             # Check if user_id column exists in documents
             result = conn.execute(text(
                 "SELECT column_name FROM information_schema.columns WHERE table_name='documents' AND column_name='user_id';"
@@ -506,71 +832,216 @@ def ensure_db_schema():
     except Exception as e:
         logger.warning(f"DB Migration check failed: {e}")
 
+@app.on_event("shutdown")
+def stop_ingest_jobs():
+    """Stop accepting queued ingestion work on shutdown"""
+    job_manager.shutdown()
+
 # ============ Image Endpoint ============
 
 @app.get("/api/images/{block_id}")
 def get_image(block_id: str, db: Session = Depends(get_db)):
     """
-    Serve image directly from database
+    Serve image from the content-addressed image store
     """
-    block = db.query(models.Block).filter(models.Block.id == block_id).first()
-    if not block:
+    from fastapi.responses import Response
+
+    def find_image():
+        return db.query(
+            models.ImageBlob.hash,
+            models.ImageBlob.data,
+            models.ImageBlob.storage_key,
+            models.ImageBlob.size,
+            models.ImageBlob.media_type
+        ).join(
+            models.Block, models.Block.image_hash == models.ImageBlob.hash
+        ).filter(models.Block.id == block_id).first()
+
+    image = find_image()
+    if not image:
+        # Deferred image: extract the document's images on first request
+        deferred_doc_id = db.query(models.Block.doc_id).filter(
+            models.Block.id == block_id,
+            models.Block.image_xref.isnot(None)
+        ).scalar()
+        if deferred_doc_id:
+            materialize_document_images(db, deferred_doc_id)
+            image = find_image()
+
+    if image:
+        # Content-addressed: the bytes behind a hash never change
+        headers = {
+            "ETag": f'"{image.hash}"',
+            "Cache-Control": "public, max-age=31536000, immutable"
+        }
+        if image.storage_key:
+            if image.size is not None:
+                headers["Content-Length"] = str(image.size)
+            return StreamingResponse(
+                require_blob_store().iter_range(image.storage_key),
+                media_type=image.media_type,
+                headers=headers
+            )
+        return Response(content=image.data, media_type=image.media_type, headers=headers)
+
+    # Legacy blocks store their bytes inline
+    image_data = db.query(models.Block.image_data).filter(models.Block.id == block_id).scalar()
+    if not image_data:
         raise HTTPException(status_code=404, detail="Image not found")
-    
-    if not block.image_data:
-        # Fallback to file system if path exists but no data in DB (legacy)
-        # But user asked to remove local files. 
-        # For new system, we expect data in DB.
-        raise HTTPException(status_code=404, detail="Image data not found")
 
-    from fastapi.responses import Response
-    return Response(content=block.image_data, media_type="image/png")
+    return Response(content=image_data, media_type="image/png")
 
 
 # ============ Block Endpoints ============
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Bytes of NDJSON lines gathered before each write to the client
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+
+def _stream_block_ndjson(doc_id: str, content_id: str, start_page: int, end_page: int,
+                         after: tuple, compact: bool):
+    """
+    Yield blocks as NDJSON, read through a server-side cursor in
+    BLOCK_STREAM_BATCH rows, so memory stays flat for any document size.
+    Uses its own session: the body is streamed after the request's session closes.
+    """
+    db = SessionLocal()
+    try:
+        rows = block_rows_query(db, content_id, start_page, end_page, after).yield_per(settings.BLOCK_STREAM_BATCH)
+        lines, size = [], 0
+        for payload in iter_block_payloads(db, doc_id, rows, compact):
+            line = json.dumps(payload, separators=(",", ":")) + "\n"
+            lines.append(line)
+            size += len(line)
+            if size >= NDJSON_CHUNK_BYTES:
+                yield "".join(lines).encode()
+                lines, size = [], 0
+        if lines:
+            yield "".join(lines).encode()
+    finally:
+        db.close()
+
+
 @app.get("/api/documents/{doc_id}/blocks", response_model=List[schemas.BlockResponse])
-def get_blocks(
+async def get_blocks(
     doc_id: str, 
+    request: Request,
     start_page: int = None,
     end_page: int = None,
-    db: Session = Depends(get_db)
+    meta_format: str = Query("full", alias="format", pattern="^(full|compact)$"),
+    cursor: Optional[str] = Query(None, pattern=r"^\d+:\d+$"),
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+    db=Depends(get_read_db)
 ):
     """
-    Get blocks for a document, optionally filtered by page range (inclusive)
+    Get blocks for a document, optionally filtered by page range (inclusive).
+    format=compact returns words_meta/style_runs as stored (see compact.py).
+    With limit (or cursor) the result is one keyset page in reading order;
+    X-Next-Cursor / Link rel="next" point at the following page.
+    With Accept: application/x-ndjson all matching blocks are streamed,
+    one JSON object per line. Accept: application/msgpack and
+    Accept-Encoding are negotiated as in encoding.py.
     """
+    return await run_read(db, _blocks_response, request, doc_id, start_page, end_page, meta_format, cursor, limit)
+
+
+def _blocks_response(db: Session, request: Request, doc_id: str, start_page: int, end_page: int,
+                     meta_format: str, cursor: str, limit: int):
     # Verify document exists
-    doc = db.query(models.Document).filter(models.Document.id == doc_id).first()
-    if not doc:
+    source = page_source(db, doc_id)
+    if not source:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    query = db.query(models.Block).filter(models.Block.doc_id == doc_id)
-    
-    if start_page is not None:
-        query = query.filter(models.Block.page_number >= start_page)
-    
-    if end_page is not None:
-        query = query.filter(models.Block.page_number <= end_page)
-        
-    blocks = query.order_by(
-        models.Block.page_number,
-        models.Block.block_order
-    ).all()
-    
-    return blocks
+
+    content_id = source.content_id
+    compact = meta_format == "compact"
+    after = tuple(int(n) for n in cursor.split(":")) if cursor else None
+    ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+    negotiated = negotiate(request, allow_msgpack=not ndjson)
+
+    headers = {"Vary": VARY}
+    representation = f"ndjson-{negotiated.encoding or 'identity'}" if ndjson else negotiated.variant
+    etag = _blocks_etag(source, f"{meta_format}-{representation}")
+    if etag:
+        headers.update(_revalidate_headers(etag))
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+    if ndjson:
+        return encoded_stream(
+            negotiated,
+            _stream_block_ndjson(doc_id, content_id, start_page, end_page, after, compact),
+            NDJSON_MEDIA_TYPE,
+            headers
+        )
+
+    if limit is None and cursor is None and source.cacheable:
+        # The whole range, assembled from the cached pages
+        first = max(start_page or 0, 0)
+        last = min(source.total_pages - 1, source.total_pages - 1 if end_page is None else end_page)
+        pages = list(range(first, last + 1))
+        payloads = page_payloads(db, source, pages, compact=compact)
+        return encoded_response(negotiated, join_pages([payloads[p] for p in pages]), headers)
+
+    query = block_rows_query(db, content_id, start_page, end_page, after)
+    if limit is None and cursor is None:
+        rows = query.all()
+        return encoded_response(negotiated, encode_payloads(block_payloads(db, doc_id, rows, compact)), headers)
+
+    # One row past the page tells whether there is a next one
+    limit = limit or settings.BLOCK_PAGE_SIZE
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1].page_number}:{rows[-1].block_order}"
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor, limit=limit)}>; rel="next"'
+    return encoded_response(negotiated, encode_payloads(block_payloads(db, doc_id, rows, compact)), headers)
 
 
 @app.get("/api/documents/{doc_id}/pages/{page_number}/blocks", response_model=List[schemas.BlockResponse])
-def get_page_blocks(doc_id: str, page_number: int, db: Session = Depends(get_db)):
+async def get_page_blocks(
+    doc_id: str,
+    page_number: int,
+    request: Request,
+    meta_format: str = Query("full", alias="format", pattern="^(full|compact)$"),
+    db=Depends(get_read_db)
+):
     """
-    Get blocks for a specific page
+    Get blocks for a specific page.
+    format=compact returns words_meta/style_runs as stored (see compact.py).
+    While the document is still being ingested, pages past the
+    pages_ready watermark answer 409 with Retry-After.
     """
-    blocks = db.query(models.Block).filter(
-        models.Block.doc_id == doc_id,
-        models.Block.page_number == page_number
-    ).order_by(models.Block.block_order).all()
-    
-    return blocks
+    return await run_read(db, _page_blocks_response, request, doc_id, page_number, meta_format)
+
+
+def _page_blocks_response(db: Session, request: Request, doc_id: str, page_number: int, meta_format: str):
+    source = page_source(db, doc_id)
+    if source is None:
+        return []
+
+    if source.status == "processing" and page_number >= (source.pages_ready or 0):
+        raise HTTPException(
+            status_code=409,
+            detail="Page is still being processed",
+            headers={"Retry-After": "2"}
+        )
+
+    if source.total_pages is not None and not 0 <= page_number < source.total_pages:
+        return []
+
+    negotiated = negotiate(request)
+    headers = {"Vary": VARY}
+    etag = _blocks_etag(source, f"{meta_format}-{negotiated.variant}")
+    if etag:
+        headers.update(_revalidate_headers(etag))
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+    # Serialized once per page and content version (see page_cache.py)
+    data = page_payloads(db, source, [page_number], compact=meta_format == "compact")[page_number]
+    return encoded_response(negotiated, data, headers)
 
 
 @app.post("/api/documents/{doc_id}/blocks/{block_id}/split", response_model=List[schemas.BlockResponse])
@@ -585,18 +1056,41 @@ def split_block(
     The word at split_index becomes the first word of the new block.
     """
     # 1. Get original block
+    doc = find_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
     block = db.query(models.Block).filter(
         models.Block.id == block_id,
-        models.Block.doc_id == doc_id
+        models.Block.doc_id == (doc.source_doc_id or doc_id)
     ).first()
     
     if not block:
         raise HTTPException(status_code=404, detail="Block not found")
+
+    # Shared content is copy-on-write (whichever side splits), then this
+    # document's own copy of the block is split
+    if detach_for_update(db, doc):
+        block = db.query(models.Block).filter(
+            models.Block.doc_id == doc_id,
+            models.Block.page_number == block.page_number,
+            models.Block.block_order == block.block_order
+        ).one()
         
     # 2. Parse metadata
-    # With JSONB, these are already Python objects (lists/dicts)
-    words = block.words_meta if block.words_meta else []
-    styles = block.style_runs 
+    # With JSONB, these are already Python objects (lists/dicts).
+    # Compact blocks are expanded; both halves are stored verbose since the
+    # compact form derives word text from offsets into the original text.
+    if is_compact(block):
+        palette = db.query(models.Document.style_palette).filter(
+            models.Document.id == doc_id
+        ).scalar() or []
+        words, styles = expand_block_meta(block, palette)
+        block.style_runs = styles
+        block.meta_version = META_VERSION_VERBOSE
+    else:
+        words = block.words_meta if block.words_meta else []
+        styles = block.style_runs 
     pos = block.position_meta
 
     split_idx = data.split_index
@@ -638,11 +1132,12 @@ def split_block(
     block.words_meta = words_1
     
     db.add(new_block)
+    bump_content_version(db, doc_id)
     db.commit()
     db.refresh(block)
     db.refresh(new_block)
     
-    return [block, new_block]
+    return block_payloads(db, doc_id, [block, new_block])
 
 
 # ============ Annotation Endpoints ============
@@ -674,6 +1169,7 @@ def create_annotation(data: schemas.AnnotationCreate, db: Session = Depends(get_
     )
     
     db.add(annotation)
+    bump_annotation_version(db, data.doc_id)
     db.commit()
     db.refresh(annotation)
     
@@ -699,6 +1195,7 @@ def update_annotation(annotation_id: str, data: schemas.AnnotationUpdate, db: Se
         annotation.font_style = data.font_style
     if data.note is not None:
         annotation.note = data.note
+    bump_annotation_version(db, annotation.doc_id)
     
     db.commit()
     db.refresh(annotation)
@@ -706,10 +1203,21 @@ def update_annotation(annotation_id: str, data: schemas.AnnotationUpdate, db: Se
 
 
 @app.get("/api/documents/{doc_id}/annotations", response_model=List[schemas.AnnotationResponse])
-def get_annotations(doc_id: str, db: Session = Depends(get_db)):
+async def get_annotations(doc_id: str, request: Request, response: Response, db=Depends(get_read_db)):
     """
     Get all annotations for a document
     """
+    return await run_read(db, _annotations_response, request, response, doc_id)
+
+
+def _annotations_response(db: Session, request: Request, response: Response, doc_id: str):
+    version = annotation_version(db, doc_id)
+    if version is not None:
+        etag = f'"annotations-{doc_id}-{version}"'
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=_revalidate_headers(etag))
+        response.headers.update(_revalidate_headers(etag))
+
     annotations = db.query(models.Annotation).filter(
         models.Annotation.doc_id == doc_id
     ).all()
@@ -730,6 +1238,7 @@ def delete_annotation(annotation_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Annotation not found")
     
     db.delete(annotation)
+    bump_annotation_version(db, annotation.doc_id)
     db.commit()
     
     return schemas.StatusResponse(status="ok", message="Annotation deleted")
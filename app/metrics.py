@@ -0,0 +1,75 @@
+"""
+In-process counters for operational visibility
+Exposed through GET /api/metrics
+"""
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger("metrics")
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(_counters)
+
+
+class ParseStats:
+    """
+    Timers (seconds) and counters of one parse_pdf run.
+    Picklable and mergeable, so extraction workers can return their own and
+    the parent adds them up (worker timers then sum CPU time across workers).
+    """
+
+    def __init__(self):
+        self.seconds = Counter()
+        self.counts = Counter()
+
+    def add_time(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+
+    def incr(self, name: str, value: int = 1):
+        self.counts[name] += value
+
+    def merge(self, other: "ParseStats"):
+        self.seconds.update(other.seconds)
+        self.counts.update(other.counts)
+
+    def as_dict(self) -> dict:
+        return {
+            "seconds": {stage: round(value, 4) for stage, value in self.seconds.items()},
+            "counts": dict(self.counts),
+        }
+
+
+# Callables (doc_id, stats_dict) notified after every parsed document,
+# e.g. to forward timings to an external metrics system
+_parse_hooks = []
+
+
+def add_parse_hook(hook):
+    _parse_hooks.append(hook)
+
+
+def report_parse(doc_id: str, stats: dict):
+    """Add a document's parse stats to the counters and notify the hooks."""
+    with _lock:
+        _counters["parse.documents"] += 1
+        for stage, seconds in stats["seconds"].items():
+            _counters[f"parse.seconds.{stage}"] += seconds
+        for name, value in stats["counts"].items():
+            _counters[f"parse.{name}"] += value
+
+    for hook in list(_parse_hooks):
+        try:
+            hook(doc_id, stats)
+        except Exception as e:
+            logger.warning(f"Parse metrics hook {hook!r} failed: {e}")
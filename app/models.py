@@ -5,7 +5,7 @@ Schema designed to be migration-compatible with Postgres
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.types import TypeDecorator, Text, LargeBinary
 from sqlalchemy import Column, String, Integer, ForeignKey, Index
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from .database import Base
 import json
 
@@ -17,12 +17,24 @@ class Document(Base):
     id = Column(String, primary_key=True)
     title = Column(String)
     file_path = Column(String) # Store filename
-    file_data = Column(LargeBinary, nullable=True) # Store PDF bytes
+    # Store PDF bytes. Never loaded with the row; read it explicitly (see documents.py)
+    file_data = deferred(Column(LargeBinary, nullable=True), raiseload=True)
+    file_key = Column(String, nullable=True) # PDF in the blob store instead of file_data (see storage.py)
     total_pages = Column(Integer)
     created_at = Column(String)
     theme = Column(String, default="plain")
     user_id = Column(String, nullable=True) # Link to Supabase User
     toc = Column(JSONB, nullable=True)  # JSONB for TOC
+    status = Column(String, default="ready") # processing, ready, failed (NULL = legacy, ready)
+    pages_ready = Column(Integer, nullable=True) # Pages whose blocks are committed (NULL = legacy, all)
+    style_palette = Column(JSONB, nullable=True) # Shared styles for compact block meta (see compact.py)
+    content_hash = Column(String, nullable=True, index=True) # SHA-256 of the PDF bytes
+    source_doc_id = Column(String, nullable=True, index=True) # Shares blocks/file of this doc (see dedupe.py)
+    parser_version = Column(Integer, nullable=True) # parser.PARSER_VERSION the blocks were built with (NULL = legacy)
+    parse_metrics = Column(JSONB, nullable=True) # Per-stage timings/counters of the last parse (metrics.ParseStats)
+    content_version = Column(Integer, default=0) # Bumped whenever the blocks change (see page_cache.py)
+    annotation_version = Column(Integer, default=0) # Bumped by annotation writes (ETag of the annotation list)
+    metadata_version = Column(Integer, default=0) # Bumped when title/theme/TOC change (ETag of the document)
 
     # Relationships
     blocks = relationship("Block", back_populates="document", cascade="all, delete-orphan")
@@ -40,11 +52,14 @@ class Block(Base):
     text = Column(Text, nullable=True)
     block_type = Column(String, default="text") # text, image
     image_path = Column(String, nullable=True)
-    image_data = Column(LargeBinary, nullable=True) # Store image bytes directly
+    image_data = Column(LargeBinary, nullable=True) # Legacy: image bytes stored per block
+    image_hash = Column(String, ForeignKey("image_blobs.hash"), nullable=True, index=True) # Content-addressed image
+    image_xref = Column(Integer, nullable=True) # PDF xref of a deferred image, extracted on demand
     
     words_meta = Column(JSONB)      # JSONB: [{start, end}, ...]
     style_runs = Column(JSONB)      # JSONB: [{start, end, fontSize, font}, ...]
     position_meta = Column(JSONB)   # JSONB: [x0, y0, x1, y1] bbox
+    meta_version = Column(Integer, nullable=True) # words_meta/style_runs encoding: NULL/1 verbose, 2 compact
 
     # Relationships
     document = relationship("Document", back_populates="blocks")
@@ -53,9 +68,50 @@ class Block(Base):
     # Index for efficient queries
     __table_args__ = (
         Index('idx_doc_block', 'doc_id', 'page_number'),
+        Index('idx_doc_block_order', 'doc_id', 'page_number', 'block_order'),  # Reading-order keyset scans
     )
 
 
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+
+    hash = Column(String, primary_key=True)  # SHA-256 hex of the bytes
+    data = Column(LargeBinary)
+    storage_key = Column(String, nullable=True)  # Bytes in the blob store instead of data (see storage.py)
+    media_type = Column(String, default="image/png")
+    size = Column(Integer)
+    created_at = Column(String)
+
+
+class DocumentThumbnail(Base):
+    __tablename__ = "document_thumbnails"
+
+    # Keyed by content, so documents sharing a PDF share thumbnails and a
+    # changed file gets new ones (see thumbnails.py)
+    content_hash = Column(String, primary_key=True)  # Document.content_hash
+    size = Column(String, primary_key=True)  # sm, md
+    data = Column(LargeBinary)
+    storage_key = Column(String, nullable=True)  # Bytes in the blob store instead of data
+    media_type = Column(String, default="image/jpeg")
+    width = Column(Integer)
+    height = Column(Integer)
+    created_at = Column(String)
+
+
+class PagePayload(Base):
+    __tablename__ = "page_payloads"
+
+    # Serialized BlockResponse list of one page, as sent by get_page_blocks.
+    # Valid while content_id/content_version match the document (see page_cache.py)
+    doc_id = Column(String, primary_key=True)
+    page_number = Column(Integer, primary_key=True)
+    meta_format = Column(String, primary_key=True)  # full, compact
+    content_id = Column(String, index=True)  # Document whose blocks were serialized (source_doc_id when shared)
+    content_version = Column(Integer)
+    data = Column(LargeBinary)  # UTF-8 JSON array
+    created_at = Column(String)
+
+
 class Annotation(Base):
     __tablename__ = "annotations"
 
@@ -0,0 +1,260 @@
+"""
+Pre-serialized page payloads for the block endpoints
+A page's block list only changes when its blocks do (re-parse, split), so
+it is serialized to JSON once and the bytes are served as they are. Entries
+are keyed by (document, content document, content_version, page, format):
+every write to a document's blocks bumps Document.content_version, which
+makes all of its cached pages unreachable without tracking them one by one.
+
+Two levels: a byte-bounded LRU in the worker (PAGE_CACHE_MAX_MB), backed by
+the page_payloads table (PAGE_CACHE_PERSIST) so restarted or other workers
+don't re-serialize. Ingest fills them for the full format (PAGE_CACHE_PREFILL):
+both when jobs run in the API process, only the table when they run in
+worker processes (INGEST_EXECUTOR=process), whose LRU no request reads.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .blocks import block_payloads, block_rows_query
+from .config import settings
+from .models import Document, PagePayload
+
+logger = logging.getLogger("page_cache")
+
+META_FORMATS = ("full", "compact")
+# Pages serialized (and upserted) per round trip
+_BATCH_PAGES = 50
+
+
+class PayloadLRU:
+    """In-process LRU of serialized pages, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes}
+
+
+page_cache = PayloadLRU(settings.PAGE_CACHE_MAX_MB * 1024 * 1024)
+
+
+class PageSource:
+    """Which blocks (and which version of them) a document serves, and its ingest state."""
+
+    def __init__(self, doc_id: str, content_id: str, version: int, status: str,
+                 pages_ready: int, total_pages: int):
+        self.doc_id = doc_id
+        self.content_id = content_id
+        self.version = version or 0
+        self.status = status
+        self.pages_ready = pages_ready
+        self.total_pages = total_pages
+
+    @property
+    def cacheable(self) -> bool:
+        # Pages of a document being ingested are still being written
+        return self.status != "processing" and self.total_pages is not None
+
+
+def page_source(db_session: Session, doc_id: str):
+    """PageSource of a document, or None if it doesn't exist."""
+    doc = db_session.query(
+        Document.status,
+        Document.pages_ready,
+        Document.total_pages,
+        Document.source_doc_id,
+        Document.content_version
+    ).filter(Document.id == doc_id).first()
+    if not doc:
+        return None
+    version = doc.content_version
+    if doc.source_doc_id:
+        # Shared blocks change (and are versioned) on the canonical copy
+        version = db_session.query(Document.content_version).filter(
+            Document.id == doc.source_doc_id
+        ).scalar()
+    return PageSource(
+        doc_id, doc.source_doc_id or doc_id, version, doc.status, doc.pages_ready, doc.total_pages
+    )
+
+
+def encode_payloads(payloads: list) -> bytes:
+    """JSON bytes exactly as FastAPI's JSONResponse would render the list."""
+    return json.dumps(payloads, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _cache_key(source: PageSource, page_number: int, meta_format: str) -> tuple:
+    return (source.doc_id, source.content_id, source.version, page_number, meta_format)
+
+
+def _load_persisted(db_session: Session, source: PageSource, pages: list, meta_format: str) -> dict:
+    rows = db_session.query(PagePayload.page_number, PagePayload.data).filter(
+        PagePayload.doc_id == source.doc_id,
+        PagePayload.meta_format == meta_format,
+        PagePayload.page_number.in_(pages),
+        PagePayload.content_id == source.content_id,
+        PagePayload.content_version == source.version
+    ).all()
+    return {row.page_number: bytes(row.data) for row in rows}
+
+
+def _persist(db_session: Session, source: PageSource, serialized: dict, meta_format: str):
+    """
+    Upsert serialized pages in a short transaction of their own: the
+    caller's session (a read request's) is never committed, and a failed
+    write only costs the cache entry, not the response.
+    """
+    created_at = datetime.utcnow().isoformat()
+    rows = [
+        {
+            "doc_id": source.doc_id,
+            "page_number": page_number,
+            "meta_format": meta_format,
+            "content_id": source.content_id,
+            "content_version": source.version,
+            "data": data,
+            "created_at": created_at,
+        }
+        for page_number, data in serialized.items()
+    ]
+    try:
+        stmt = insert(PagePayload).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PagePayload.doc_id, PagePayload.page_number, PagePayload.meta_format],
+            set_={
+                "content_id": stmt.excluded.content_id,
+                "content_version": stmt.excluded.content_version,
+                "data": stmt.excluded.data,
+                "created_at": stmt.excluded.created_at,
+            }
+        )
+        with db_session.get_bind().begin() as conn:
+            conn.execute(stmt)
+    except Exception as e:
+        metrics.incr("page_cache.persist_failed")
+        logger.warning(f"Could not persist {len(rows)} pages of doc {source.doc_id}: {e}")
+
+
+def page_payloads(db_session: Session, source: PageSource, pages: list, compact: bool = False,
+                  in_memory: bool = True) -> dict:
+    """
+    {page_number: JSON array bytes} of the given pages. Served from the
+    LRU, then page_payloads, and serialized from the blocks (one query for
+    all misses) otherwise; misses are stored when the document is cacheable.
+    in_memory=False leaves the LRU out (neither read nor filled).
+    """
+    meta_format = "compact" if compact else "full"
+    use_lru = in_memory and source.cacheable
+    found = {}
+    missing = []
+    for page_number in pages:
+        data = page_cache.get(_cache_key(source, page_number, meta_format)) if use_lru else None
+        if data is None:
+            missing.append(page_number)
+        else:
+            found[page_number] = data
+    metrics.incr("page_cache.memory_hit", len(found))
+
+    for start in range(0, len(missing), _BATCH_PAGES):
+        batch = missing[start:start + _BATCH_PAGES]
+        persisted = {}
+        if source.cacheable and settings.PAGE_CACHE_PERSIST:
+            persisted = _load_persisted(db_session, source, batch, meta_format)
+            metrics.incr("page_cache.table_hit", len(persisted))
+
+        to_build = [page_number for page_number in batch if page_number not in persisted]
+        built = {}
+        if to_build:
+            metrics.incr("page_cache.miss", len(to_build))
+            rows_by_page = defaultdict(list)
+            for row in block_rows_query(db_session, source.content_id, pages=to_build):
+                rows_by_page[row.page_number].append(row)
+            for page_number in to_build:
+                built[page_number] = encode_payloads(
+                    block_payloads(db_session, source.doc_id, rows_by_page[page_number], compact)
+                )
+
+        if use_lru:
+            for page_number, data in {**persisted, **built}.items():
+                page_cache.put(_cache_key(source, page_number, meta_format), data)
+        if source.cacheable and built and settings.PAGE_CACHE_PERSIST:
+            _persist(db_session, source, built, meta_format)
+        found.update(persisted)
+        found.update(built)
+    return found
+
+
+def join_pages(pages: list) -> bytes:
+    """Concatenate serialized page arrays into one JSON array."""
+    bodies = [data[1:-1] for data in pages if data != b"[]"]
+    return b"[" + b",".join(bodies) + b"]"
+
+
+def bump_content_version(db_session: Session, doc_id: str):
+    """
+    Invalidate the cached pages of a document whose blocks changed (and of
+    documents sharing them). Does not commit; the new version becomes
+    visible together with the block changes.
+    """
+    db_session.query(Document).filter(Document.id == doc_id).update(
+        {Document.content_version: func.coalesce(Document.content_version, 0) + 1},
+        synchronize_session=False
+    )
+    db_session.query(PagePayload).filter(PagePayload.content_id == doc_id).delete(synchronize_session=False)
+
+
+def delete_page_payloads(db_session: Session, doc_id: str):
+    """Drop the persisted pages of a deleted document. Does not commit."""
+    db_session.query(PagePayload).filter(
+        or_(PagePayload.doc_id == doc_id, PagePayload.content_id == doc_id)
+    ).delete(synchronize_session=False)
+
+
+def prefill_page_cache(db_session: Session, doc_id: str, in_memory: bool = True) -> int:
+    """
+    Serialize every page of a freshly parsed document (full format); returns
+    the page count. in_memory=False (ingest worker processes) only writes
+    page_payloads, so without PAGE_CACHE_PERSIST there is nothing to do.
+    """
+    if not in_memory and not settings.PAGE_CACHE_PERSIST:
+        return 0
+    source = page_source(db_session, doc_id)
+    if source is None or not source.cacheable:
+        return 0
+    pages = list(range(source.total_pages))
+    for start in range(0, len(pages), _BATCH_PAGES):
+        page_payloads(db_session, source, pages[start:start + _BATCH_PAGES], in_memory=in_memory)
+    return len(pages)
@@ -0,0 +1,152 @@
+"""
+Page rasters for readers that can't (or shouldn't) download the whole PDF
+A page is rendered with fitz at a zoom level, either whole or as one
+RENDER_TILE_SIZE square tile, and kept in an on-disk LRU cache keyed by
+the document's content hash, page, zoom, tile and format. Documents that
+share a file share cached rasters.
+"""
+import json
+import math
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import fitz  # PyMuPDF
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .config import settings
+from .disk_cache import DiskLRUCache
+from .models import Document
+from .storage import load_file_data
+
+logger = logging.getLogger("page_render")
+
+IMAGE_FORMATS = {"jpeg": "image/jpeg", "png": "image/png"}
+JPEG_QUALITY = 85
+# Larger whole-page renders must be requested as tiles
+MAX_PAGE_PIXELS = 4096 * 4096
+# Smallest zoom after rounding; below it a page renders to an empty image
+MIN_ZOOM = 0.01
+# Parsed PDFs kept open between renders (by content hash)
+_OPEN_DOCS = 4
+
+render_cache = DiskLRUCache(
+    settings.RENDER_CACHE_DIR or Path(tempfile.gettempdir()) / "pdfread-render-cache",
+    settings.RENDER_CACHE_MAX_MB * 1024 * 1024,
+)
+
+# fitz documents are not thread-safe; renders (cache misses only) are
+# serialized, but fetching a PDF that isn't open yet happens outside the lock
+_render_lock = threading.Lock()
+_open_docs = OrderedDict()
+
+
+class RenderError(ValueError):
+    """The requested page, tile or size can't be rendered."""
+
+
+def normalize_zoom(zoom: float) -> float:
+    """Zoom rounded to 2 decimals, so near-identical requests share a cache entry."""
+    return max(MIN_ZOOM, round(zoom, 2))
+
+
+def render_key(content_hash: str, page_number: int, zoom: float, tile, image_format: str) -> str:
+    tile_part = f"{tile[0]},{tile[1]}" if tile else "full"
+    return f"{content_hash}/{page_number}/{zoom:g}/{tile_part}.{image_format}"
+
+
+def render_etag(key: str) -> str:
+    return '"' + key.replace("/", "-") + '"'
+
+
+@contextmanager
+def _opened_pdf(db_session: Session, doc: Document, content_hash: str):
+    """
+    Hold _render_lock with the document's parsed PDF (None if it has no
+    bytes). A PDF that isn't open yet is fetched from the database or blob
+    store before the lock is taken, so other renders don't wait on it.
+    """
+    file_data = None
+    while True:
+        with _render_lock:
+            pdf = _open_docs.get(content_hash)
+            if pdf is None and file_data:
+                pdf = fitz.open(stream=file_data, filetype="pdf")
+                _open_docs[content_hash] = pdf
+                while len(_open_docs) > _OPEN_DOCS:
+                    _, old = _open_docs.popitem(last=False)
+                    old.close()
+            if pdf is not None:
+                _open_docs.move_to_end(content_hash)
+                yield pdf
+                return
+        if file_data is not None:
+            yield None
+            return
+        file_data = load_file_data(db_session, doc.id) or b""
+
+
+def page_sizes(db_session: Session, doc: Document, content_hash: str) -> list:
+    """[(width, height)] in points for every page, cached next to the rasters."""
+    key = f"{content_hash}/page-sizes"
+    cached = render_cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    with _opened_pdf(db_session, doc, content_hash) as pdf:
+        if pdf is None:
+            return None
+        sizes = [(page.rect.width, page.rect.height) for page in pdf]
+    render_cache.put(key, json.dumps(sizes).encode())
+    return sizes
+
+
+def tile_grid(page_size, zoom: float) -> tuple:
+    """(columns, rows) of RENDER_TILE_SIZE tiles covering a page at zoom."""
+    width, height = page_size
+    tile = settings.RENDER_TILE_SIZE
+    return math.ceil(width * zoom / tile), math.ceil(height * zoom / tile)
+
+
+def render_page(db_session: Session, doc: Document, content_hash: str, page_number: int,
+                zoom: float, tile=None, image_format: str = "jpeg"):
+    """
+    Image bytes of a page (or of tile (column, row)) at zoom, from the
+    cache or freshly rendered. Returns None when the PDF is missing and
+    raises RenderError for pages/tiles out of range or oversized renders.
+    """
+    key = render_key(content_hash, page_number, zoom, tile, image_format)
+    data = render_cache.get(key)
+    if data is not None:
+        metrics.incr("render.cache_hit")
+        return data
+    metrics.incr("render.cache_miss")
+
+    with _opened_pdf(db_session, doc, content_hash) as pdf:
+        if pdf is None:
+            return None
+        if not 0 <= page_number < pdf.page_count:
+            raise RenderError("Page out of range")
+        page = pdf[page_number]
+        clip = None
+        if tile:
+            columns, rows = tile_grid((page.rect.width, page.rect.height), zoom)
+            column, row = tile
+            if column >= columns or row >= rows:
+                raise RenderError("Tile out of range")
+            side = settings.RENDER_TILE_SIZE / zoom
+            clip = fitz.Rect(column * side, row * side, (column + 1) * side, (row + 1) * side) & page.rect
+        elif page.rect.width * page.rect.height * zoom * zoom > MAX_PAGE_PIXELS:
+            raise RenderError("Page too large at this zoom; request tiles")
+
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+        if image_format == "png":
+            data = pix.tobytes("png")
+        else:
+            data = pix.tobytes("jpg", jpg_quality=JPEG_QUALITY)
+
+    render_cache.put(key, data)
+    return data
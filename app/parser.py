@@ -5,313 +5,725 @@ Extracts text, words, and style information from PDF files
 import fitz  # PyMuPDF
 import json
 import uuid
-from collections import Counter
+import time
+import multiprocessing
+from collections import Counter, deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from sqlalchemy.orm import Session
 import logging
 
+from .bulk_load import copy_blocks, copy_supported
+from .compact import StylePalette, encode_block_meta, META_VERSION_COMPACT
+from .config import settings
+from .images import ImageCollector
+from .metrics import ParseStats, report_parse
 from .models import Document, Block
 
 logger = logging.getLogger("parser")
 
+# Bump when a change to extraction alters the stored blocks/TOC, so
+# scripts/reprocess.py can find documents parsed by an older version.
+PARSER_VERSION = 1
+
+
+class SmartTocBuilder:
+    """
+    Heuristic table of contents based on font sizes, built in a single pass.
+
+    Blocks are fed in page order while they are being extracted. Body text is
+    the most common size (by characters), and headings are the MAX_LEVELS
+    largest sizes at least HEADING_RATIO times larger than it. The body size
+    is tracked as lines stream in, so once BODY_SAMPLE_CHARS characters have
+    been seen, lines at or below the heading threshold are dropped right away:
+    candidates grow with the number of headings, not with the body text. A
+    body size that only becomes dominant later can't bring back lines dropped
+    before; on real documents the body dominates from the first pages.
+
+    Builders for a chunk of pages (parallel extraction) are created with
+    prune_body=False: a chunk's own body size says nothing about the
+    document's, so they only keep their MAX_LEVELS largest sizes, and the
+    threshold is applied to the combined counts in merge. A chunk set in a
+    different size (an appendix in larger type, say) therefore can't drop
+    headings the serial pass keeps.
+    """
+    MAX_LEVELS = 3
+    HEADING_RATIO = 1.1
+    BODY_SAMPLE_CHARS = 2000
+
+    def __init__(self, prune_body: bool = True):
+        self.prune_body = prune_body
+        self.font_counts = Counter()
+        self.total_chars = 0
+        self.body_size = None
+        self.candidates = []  # (size, text, page_num)
+        self.kept_sizes = set()
+
+    def add_block(self, block: dict, page_num: int):
+        """Record the lines of a text block (type 0) from page.get_text("dict")."""
+        for line in block["lines"]:
+            if not line["spans"]: continue
+
+            # Compute max size for the line
+            max_size = 0
+            line_text = ""
+            for span in line["spans"]:
+                if span["size"] > max_size:
+                    max_size = span["size"]
+                line_text += span["text"] + " "
+
+            line_text = line_text.strip()
+            if not line_text: continue
+
+            # Round size to minimize noise
+            rounded_size = round(max_size * 2) / 2
+            self._count(rounded_size, len(line_text))
+
+            if self._keep_size(rounded_size):
+                self.candidates.append((rounded_size, line_text, page_num + 1))
+
+    def _threshold(self):
+        """Sizes at or below this can't be headings (None until the body size is known)."""
+        if not self.prune_body or self.total_chars < self.BODY_SAMPLE_CHARS:
+            return None
+        return self.body_size * self.HEADING_RATIO
+
+    def _count(self, size: float, chars: int):
+        before = self._threshold()
+        self.font_counts[size] += chars
+        self.total_chars += chars
+        if self.body_size is None or self.font_counts[size] > self.font_counts[self.body_size]:
+            self.body_size = size
+        after = self._threshold()
+        if after is not None and (before is None or after > before):
+            self._prune(after)
+
+    def _prune(self, threshold: float):
+        dropped = {size for size in self.kept_sizes if size <= threshold}
+        if dropped:
+            self.kept_sizes -= dropped
+            self.candidates = [c for c in self.candidates if c[0] not in dropped]
+
+    def _keep_size(self, size: float) -> bool:
+        if size in self.kept_sizes:
+            return True
+        threshold = self._threshold()
+        if threshold is not None and size <= threshold:
+            return False
+        if len(self.kept_sizes) < self.MAX_LEVELS:
+            self.kept_sizes.add(size)
+            return True
+        smallest = min(self.kept_sizes)
+        if size < smallest:
+            return False
+        # New size displaces the smallest kept one
+        self.kept_sizes.remove(smallest)
+        self.kept_sizes.add(size)
+        self.candidates = [c for c in self.candidates if c[0] != smallest]
+        return True
+
+    def merge(self, other: "SmartTocBuilder"):
+        """Append the observations of a builder that covered later pages (see prune_body)."""
+        self.font_counts.update(other.font_counts)
+        self.total_chars += other.total_chars
+        self.body_size = self.font_counts.most_common(1)[0][0] if self.font_counts else None
+        threshold = self._threshold()
+        sizes = [s for s in self.kept_sizes | other.kept_sizes if threshold is None or s > threshold]
+        self.kept_sizes = set(sorted(sizes, reverse=True)[:self.MAX_LEVELS])
+        self.candidates = [c for c in self.candidates + other.candidates if c[0] in self.kept_sizes]
+
+    def build(self) -> list:
+        """Returns list of [level, title, page]."""
+        if not self.font_counts:
+            return []
+
+        # Body text is the most common size
+        body_size = self.font_counts.most_common(1)[0][0]
+
+        # Heading candidates are at least 10% larger than body.
+        # Map top sizes to levels 1, 2, 3 (largest -> 1)
+        headings = sorted([s for s in self.kept_sizes if s > body_size * self.HEADING_RATIO], reverse=True)
+        if not headings:
+            return []
+
+        heading_levels = {size: i + 1 for i, size in enumerate(headings)}
+        return [
+            [heading_levels[size], text, page]
+            for size, text, page in self.candidates
+            if size in heading_levels
+        ]
+
 
 def generate_smart_toc(doc) -> list:
     """
     Generate a table of contents based on font sizes (heuristic).
     Returns list of [level, title, page].
+
+    parse_pdf builds this during extraction; use this only for documents
+    that were ingested without it.
     """
     try:
-        # 1. Collect font sizes and lines
-        font_counts = Counter()
-        text_lines = [] # (text, size, page_num)
-        
+        toc_builder = SmartTocBuilder()
         for page_num in range(len(doc)):
-            page = doc[page_num]
-            blocks = page.get_text("dict")["blocks"]
-            for block in blocks:
+            for block in doc[page_num].get_text("dict")["blocks"]:
                 if block["type"] != 0: continue # Skip non-text
-                
-                for line in block["lines"]:
-                    if not line["spans"]: continue
-                    
-                    # Compute average/max size for the line
-                    max_size = 0
-                    line_text = ""
-                    for span in line["spans"]:
-                        if span["size"] > max_size:
-                            max_size = span["size"]
-                        line_text += span["text"] + " "
-                    
-                    line_text = line_text.strip()
-                    if not line_text: continue
-                    
-                    # Round size to minimize noise
-                    rounded_size = round(max_size * 2) / 2
-                    font_counts[rounded_size] += len(line_text)
-                    
-                    text_lines.append({
-                        "text": line_text,
-                        "size": rounded_size,
-                        "page": page_num + 1
-                    })
-        
-        if not font_counts:
-            return []
-
-        # 2. Identify Body Text (most common size)
-        if not font_counts:
-            return []
-            
-        body_size = font_counts.most_common(1)[0][0]
-        
-        # 3. Identify Heading Candidates (larger than body)
-        # We consider sizes at least 10% larger than body
-        candidates = sorted([s for s in font_counts if s > body_size * 1.1], reverse=True)
-        
-        # Map top 3 sizes to levels 1, 2, 3
-        # Use simple mapping: Largest -> 1, Second -> 2...
-        if not candidates:
-            return []
-            
-        heading_levels = {size: i + 1 for i, size in enumerate(candidates[:3])}
-        
-        # 4. Construct TOC
-        toc = []
-        for line in text_lines:
-            lvl = heading_levels.get(line["size"])
-            if lvl:
-                toc.append([lvl, line["text"], line["page"]])
-                
-        return toc
+                toc_builder.add_block(block, page_num)
+        return toc_builder.build()
 
     except Exception as e:
         logger.error(f"Smart TOC generation failed: {e}")
         return []
 
 
+def _page_image_infos(page):
+    """
+    get_image_info() plus the xref of each image, or None if some image has
+    no xref (inline image). get_image_info(xrefs=True) finds xrefs by hashing
+    every image's pixels, which is the decoding we want to avoid, so images
+    are matched to the page's image xrefs by (width, height, bpc) and hashing
+    is only used when that is ambiguous.
+    """
+    by_shape = {}
+    for item in page.get_images(full=True):
+        xref, _, width, height, bpc = item[:5]
+        by_shape.setdefault((width, height, bpc), set()).add(xref)
+
+    image_infos = page.get_image_info()
+    for info in image_infos:
+        xrefs = by_shape.get((info["width"], info["height"], info["bpc"]), ())
+        if len(xrefs) != 1:
+            image_infos = page.get_image_info(xrefs=True)
+            break
+        info["xref"] = next(iter(xrefs))
+
+    if any(info["xref"] == 0 for info in image_infos):
+        return None
+    return image_infos
+
+
+def _get_page_dict_blocks(page, defer_images: bool) -> list:
+    """
+    page.get_text("dict") blocks. With defer_images, image payloads are not
+    decoded: text comes from get_text without TEXT_PRESERVE_IMAGES and images
+    from get_image_info (bbox + xref). get_image_info numbers images as they
+    would be numbered among all blocks, so images go back in at those
+    positions and text blocks fill the rest in order; the block order is
+    unchanged. Inline images have no xref to load them from later, so pages
+    containing one are extracted eagerly.
+    """
+    if not defer_images:
+        return page.get_text("dict")["blocks"]
+
+    if not page.get_images():
+        return page.get_text("dict")["blocks"]
+
+    image_infos = _page_image_infos(page)
+    if image_infos is None:
+        return page.get_text("dict")["blocks"]
+
+    text_blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES)["blocks"]
+    if not image_infos:
+        return text_blocks
+
+    total = len(text_blocks) + len(image_infos)
+    image_slots = {info["number"]: info for info in image_infos}
+    if len(image_slots) != len(image_infos) or any(n >= total for n in image_slots):
+        # Numbering doesn't line up; don't guess the order
+        return page.get_text("dict")["blocks"]
+
+    text_iter = iter(text_blocks)
+    blocks = []
+    for number in range(total):
+        info = image_slots.get(number)
+        if info is None:
+            blocks.append(next(text_iter))
+        else:
+            blocks.append({"type": 1, "number": number, "bbox": info["bbox"], "xref": info["xref"]})
+    return blocks
+
+
+def _extract_page_blocks(page, page_num: int, toc_builder: SmartTocBuilder = None,
+                         defer_images: bool = False, stats: ParseStats = None) -> list:
+    """
+    Extract the blocks of a single page as plain dicts (no ORM objects).
+    Kept free of DB state so it can run inside a worker process.
+    If toc_builder is given, text blocks are also fed to it.
+    With defer_images, image blocks carry an xref instead of their bytes.
+    stats (optional) collects get_text / text timings and span/word counts.
+    """
+    page_blocks = []
+
+    # Get text blocks with detailed info
+    started = time.perf_counter()
+    blocks = _get_page_dict_blocks(page, defer_images)
+    text_started = time.perf_counter()
+
+    block_order = 0
+    span_count = 0
+    word_count = 0
+
+    for block in blocks:
+        # Handle image blocks
+        if block["type"] == 1: # 1 = Image
+            # get_text("dict") provides the image bytes for type 1 blocks,
+            # deferred blocks only the xref to load them from later
+            img_bytes = block.get("image")
+            xref = block.get("xref", 0)
+
+            if not img_bytes and not xref:
+                 # Skip empty images to avoid errors
+                 continue
+
+            page_blocks.append({
+                "page_number": page_num,
+                "block_order": block_order,
+                "block_type": "image",
+                "text": None,
+                "image_data": img_bytes,                 # Moved to image_blobs by the parent
+                "image_ext": block.get("ext"),
+                "image_xref": xref or None,
+                "words_meta": [],
+                "style_runs": [],
+                "position_meta": block["bbox"]
+            })
+            block_order += 1
+            continue
+
+        # Handle Text blocks (type 0)
+        if "lines" not in block:
+            continue
+
+        if toc_builder is not None:
+            toc_builder.add_block(block, page_num)
+
+        # Alignment heuristics often fail or conflict with exact positioning.
+        # User requested default left alignment and exact positioning.
+        # We will rely on 'x' coordinate (indentation) for visual placement.
+
+        full_text = ""
+        words_meta = []
+        style_runs = []
+
+        char_index = 0
+
+        # Process each line and span
+        for line_idx, line in enumerate(block["lines"]):
+            # Get line indentation (relative to page)
+            lx0, ly0, _, _ = line["bbox"]
+
+            is_line_start = True
+
+            for span in line["spans"]:
+                span_text = span["text"]
+                if not span_text: continue
+
+                # Sanitize text: PostgreSQL cannot handle NULL bytes (0x00) in text fields
+                span_text = span_text.replace("\x00", "")
+                if not span_text: continue
+
+                # Style extraction
+                size = span["size"]
+                font = span["font"]
+
+                # Clean font name
+                # Remove subset tag (e.g. "ABCDE+Arial-Bold" -> "Arial-Bold")
+                if "+" in font:
+                    font = font.split("+")[-1]
+
+                dest_color = span.get("color", 0)
+
+                # Convert color to hex
+                if isinstance(dest_color, int):
+                     color_hex = f"#{dest_color:06x}"
+                else:
+                     color_hex = "#000000"
+
+                # Normalize flags
+                flags = span.get("flags", 0)
+                is_bold = "Bold" in font or (flags & 16)
+                is_italic = "Italic" in font or (flags & 2)
+
+                span_words = span_text.split()
+                span_count += 1
+                word_count += len(span_words)
+
+                span_start_idx = char_index
+                full_text += span_text
+                char_index += len(span_text)
+
+                # Record style run
+                style_runs.append({
+                    "start": span_start_idx,
+                    "end": char_index,
+                    "fontSize": size,
+                    "font": font,
+                    "color": color_hex,
+                    "isBold": is_bold,
+                    "isItalic": is_italic,
+                    "isCentered": False
+                })
+
+                # Extract words
+                cursor = 0
+                for i, word in enumerate(span_words):
+                    w_start = span_text.find(word, cursor)
+                    if w_start == -1: continue
+
+                    w_end = w_start + len(word)
+                    cursor = w_end
+
+                    abs_start = span_start_idx + w_start
+                    abs_end = span_start_idx + w_end
+
+                    # Determine if this word starts a new line
+                    forced_newline = False
+                    indent_val = 0
+
+                    if is_line_start and i == 0:
+                        forced_newline = True
+                        indent_val = lx0 # Store absolute x position
+                        is_line_start = False
 
-def parse_pdf(file_path: str, db_session: Session, doc_id: str, title: str, file_bytes: bytes = None, user_id: str = None) -> Document:
-    # ... (code) ...
+                    words_meta.append({
+                        "start": abs_start,
+                        "end": abs_end,
+                        "text": word,
+                        "fontSize": size,
+                        "fontFamily": font,
+                        "isBold": is_bold,
+                        "isItalic": is_italic,
+                        "color": color_hex,
+                        "align": "left", # Force left
+                        "isNewline": forced_newline,
+                        "x": indent_val
+                    })
+
+            # Add explicit newline in text for fallback
+            full_text += "\n"
+            char_index += 1
+
+        # Skip empty blocks
+        if not full_text.strip():
+            continue
+
+        page_blocks.append({
+            "page_number": page_num,
+            "block_order": block_order,
+            "block_type": "text",
+            "text": full_text,
+            "words_meta": words_meta,
+            "style_runs": style_runs,
+            "position_meta": block["bbox"]
+        })
+        block_order += 1
+
+    if stats is not None:
+        stats.add_time("get_text", text_started - started)
+        stats.add_time("text", time.perf_counter() - text_started)
+        stats.incr("pages")
+        stats.incr("spans", span_count)
+        stats.incr("words", word_count)
+
+    return page_blocks
+
+
+# ============ Parallel extraction (worker side) ============
+
+# Each worker process opens its own fitz document once, in the initializer,
+# so the PDF bytes are shipped to a worker only once instead of per task.
+_worker_doc = None
+
+
+def _init_extract_worker(file_bytes: bytes, file_path: str):
+    global _worker_doc
+    if file_bytes:
+        _worker_doc = fitz.open(stream=file_bytes, filetype="pdf")
+    else:
+        _worker_doc = fitz.open(file_path)
+
+
+def _extract_page_range(task) -> tuple:
+    """
+    Extract pages [start, end) with the worker's own document handle.
+    Returns (pages, toc_builder, stats); toc_builder is None unless collect_toc.
+    """
+    start, end, collect_toc, defer_images = task
+    toc_builder = SmartTocBuilder(prune_body=False) if collect_toc else None
+    stats = ParseStats()
+    pages = [
+        _extract_page_blocks(_worker_doc[page_num], page_num, toc_builder, defer_images, stats)
+        for page_num in range(start, end)
+    ]
+    return pages, toc_builder, stats
+
+
+def _split_page_range(total_pages: int, workers: int) -> list:
+    """Split the page range into contiguous chunks (a few per worker for load balancing)."""
+    chunk_count = min(total_pages, workers * 4)
+    chunk_size = -(-total_pages // chunk_count)  # ceil division
+    return [(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
+
+
+def _iter_pages_parallel(file_path: str, file_bytes: bytes, total_pages: int, workers: int,
+                         toc_builder: SmartTocBuilder = None, defer_images: bool = False,
+                         stats: ParseStats = None):
+    """
+    Yield per-page block dicts in page order, extracted across a process pool.
+    Chunks are consumed in submission order, so merging back is just iteration.
+    Only a small window of chunks is in flight, so extracted-but-unsaved
+    pages can't pile up when inserts are slower than extraction.
+    """
+    collect_toc = toc_builder is not None
+    tasks = iter([
+        (start, end, collect_toc, defer_images)
+        for start, end in _split_page_range(total_pages, workers)
+    ])
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_extract_worker,
+        initargs=(file_bytes, file_path),
+    ) as executor:
+        in_flight = deque(executor.submit(_extract_page_range, task) for task in islice(tasks, workers * 2))
+        while in_flight:
+            pages, chunk_toc, chunk_stats = in_flight.popleft().result()
+            for task in islice(tasks, 1):
+                in_flight.append(executor.submit(_extract_page_range, task))
+            if collect_toc:
+                toc_builder.merge(chunk_toc)
+            if stats is not None:
+                stats.merge(chunk_stats)
+            yield from pages
+
+
+def _iter_pages_serial(doc, total_pages: int, toc_builder: SmartTocBuilder = None,
+                       defer_images: bool = False, stats: ParseStats = None):
+    for page_num in range(total_pages):
+        yield _extract_page_blocks(doc[page_num], page_num, toc_builder, defer_images, stats)
+
+
+def _no_progress(stage: str, pages_processed: int, total_pages: int):
+    pass
+
+
+def _build_block_row(doc_id: str, block_data: dict, images: ImageCollector,
+                     palette: StylePalette = None, block_id: str = None) -> dict:
+    """
+    Turn an extracted block dict into a blocks row (dict keyed by column).
+    Image bytes go to the content-addressed store; the block keeps the hash.
+    Deferred images only keep their xref until images.materialize_images runs.
+    With a palette, words_meta/style_runs are stored in the compact encoding.
+    block_id reuses an existing id (re-processing); a new one is made otherwise.
+    """
+    block_id = block_id or str(uuid.uuid4())
+    if block_data["block_type"] == "image":
+        img_bytes = block_data.pop("image_data")
+        img_ext = block_data.pop("image_ext")
+        if img_bytes:
+            block_data["image_hash"] = images.add(img_bytes, img_ext)
+        # Point to API endpoint
+        block_data["image_path"] = f"/api/images/{block_id}"
+    elif palette is not None:
+        block_data["words_meta"], block_data["style_runs"] = encode_block_meta(
+            block_data["words_meta"], block_data["style_runs"], palette
+        )
+        block_data["meta_version"] = META_VERSION_COMPACT
+    block_data["id"] = block_id
+    block_data["doc_id"] = doc_id
+    return block_data
+
+
+def _build_block_record(doc_id: str, block_data: dict, images: ImageCollector,
+                        palette: StylePalette = None, block_id: str = None) -> Block:
+    """_build_block_row as a Block ORM object."""
+    return Block(**_build_block_row(doc_id, block_data, images, palette, block_id))
+
+
+def _save_batch(db_session: Session, doc_record: Document, block_rows: list, pages_ready: int,
+                images: ImageCollector, palette: StylePalette = None, stats: ParseStats = None):
+    """
+    Insert a batch of blocks and advance the pages_ready watermark in one commit.
+    New image blobs and the palette are saved with the blocks that reference them.
+    Blocks are loaded with COPY where supported (bulk_load.py), otherwise
+    as ORM objects through bulk_save_objects.
+    """
+    stats = stats if stats is not None else ParseStats()
+    started = time.perf_counter()
+    images.flush(db_session)
+    flushed = time.perf_counter()
+    if palette is not None:
+        doc_record.style_palette = list(palette.styles)
+    if block_rows:
+        if copy_supported(db_session):
+            db_session.flush()  # Document row first (FK constraint)
+            copy_blocks(db_session, block_rows)
+        else:
+            # bulk_save_objects does not work well with relationships needing FKs unless flushed
+            # but since we flushed Document, it should be fine.
+            db_session.bulk_save_objects([Block(**row) for row in block_rows])
+    inserted = time.perf_counter()
+    doc_record.pages_ready = pages_ready
+    db_session.commit()
+
+    stats.add_time("image_flush", flushed - started)
+    stats.add_time("insert", inserted - flushed)
+    stats.add_time("commit", time.perf_counter() - inserted)
+    stats.incr("batches")
+
+
+def parse_pdf(
+    file_path: str,
+    db_session: Session,
+    doc_id: str,
+    title: str,
+    file_bytes: bytes = None,
+    user_id: str = None,
+    workers: int = None,
+    progress=None,
+    compact: bool = None,
+    defer_images: bool = None,
+    stats: ParseStats = None,
+) -> Document:
+    """
+    Parse a PDF into Document + Block rows.
+
+    workers: size of the extraction process pool. Defaults to
+    settings.PARSER_WORKERS; 1 (or a document shorter than
+    settings.PARSER_PARALLEL_MIN_PAGES) keeps the serial path.
+    Both paths produce the same blocks in (page_number, block_order) order.
+
+    progress: optional callback(stage, pages_processed, total_pages).
+
+    Per-stage timings and counters (see metrics.ParseStats) are stored in
+    Document.parse_metrics and passed to metrics.report_parse; pass stats to
+    read them without reloading the document. Extraction timings are summed
+    over the workers when the pool is used.
+
+    If a Document row with doc_id already exists (persisted by the upload
+    endpoint) it is filled in and marked ready instead of being created.
+
+    Blocks are committed every settings.INGEST_BATCH_PAGES pages and
+    Document.pages_ready is advanced with them, so readers can fetch the
+    first pages while the rest is still being parsed.
+
+    compact: store words_meta/style_runs in the compact encoding with a
+    per-document style palette. Defaults to settings.COMPACT_BLOCK_META.
+
+    defer_images: skip decoding image payloads and only record each image's
+    bbox and xref; images.materialize_images extracts them later (background
+    pass or first request). Defaults to settings.PARSER_DEFER_IMAGES.
+    """
+    if workers is None:
+        workers = settings.PARSER_WORKERS
+    if compact is None:
+        compact = settings.COMPACT_BLOCK_META
+    if defer_images is None:
+        defer_images = settings.PARSER_DEFER_IMAGES
+    if progress is None:
+        progress = _no_progress
+
+    progress("opening", 0, 0)
+
+    if stats is None:
+        stats = ParseStats()
+    started = time.perf_counter()
     if file_bytes:
         doc = fitz.open(stream=file_bytes, filetype="pdf")
     else:
         doc = fitz.open(file_path)
-    
+    stats.add_time("open", time.perf_counter() - started)
+
     try:
         total_pages = len(doc)
-        
-        # Get TOC (native or smart)
+
+        # Get TOC (native or smart). The smart TOC is gathered during
+        # extraction below, so it costs no extra pass over the pages.
         toc_data = doc.get_toc()
-        # ...
-        
-        # Create document record
-        doc_record = Document(
-            id=doc_id,
-            title=title,
-            file_path=file_path,
-            file_data=file_bytes,
-            total_pages=total_pages,
-            created_at=datetime.utcnow().isoformat(),
-            user_id=user_id,
-            toc=toc_data
-        )
-        db_session.add(doc_record)
+        toc_builder = None if toc_data else SmartTocBuilder()
+
+        doc_record = db_session.get(Document, doc_id)
+        if doc_record is None:
+            # Create document record
+            doc_record = Document(
+                id=doc_id,
+                title=title,
+                file_path=file_path,
+                file_data=file_bytes,
+                created_at=datetime.utcnow().isoformat(),
+                user_id=user_id,
+            )
+            db_session.add(doc_record)
+        doc_record.total_pages = total_pages
+        doc_record.toc = toc_data
+        doc_record.status = "processing"
+        doc_record.pages_ready = 0
         db_session.flush() # Ensure doc is inserted before blocks (FK constraint)
-        
-        # Collect all blocks for batch insert
-        block_records = []
-        
-        for page_num in range(total_pages):
-            page = doc[page_num]
-            
-            # Get text blocks with detailed info
-            blocks = page.get_text("dict")["blocks"]
-            
-            block_order = 0
-            
-            for block in blocks:
-                # Handle image blocks
-                if block["type"] == 1: # 1 = Image
-                    # Generate unique filename for the image
-                    image_filename = f"{doc_id}_p{page_num}_b{block_order}.png"
-                    
-                    # Check if image data is available directly or needs extraction
-                    if "image" in block:
-                        img_bytes = block["image"]
-                    else:
-                        # Fallback or xref extraction if needed (pymupdf dict usually has 'image' for type 1 if expanded? check docs)
-                        # Actually get_text("dict") usually provides image bytes or ext
-                        # If not, we might need other methods.
-                        # For simplicity in this "dict" mode, if 'image' key exists (it should for type 1)
-                        img_bytes = block.get("image")
-                    
-                    if not img_bytes:
-                         # Attempt recovering from xref if provided?
-                         # Let's try skipping empty images for now to avoid errors
-                         # Or stick to text if extraction fails
-                         continue
-                         
-                    # Generate Block ID
-                    block_id = str(uuid.uuid4())
-                    
-                    # Create Block Record with image data in DB
-                    block_record = Block(
-                        id=block_id,
-                        doc_id=doc_id,
-                        page_number=page_num,
-                        block_order=block_order,
-                        block_type="image",
-                        text=None,
-                        image_path=f"/api/images/{block_id}", # Point to API endpoint
-                        image_data=img_bytes,                 # Store bytes
-                        words_meta=[],
-                        style_runs=[],
-                        position_meta=block["bbox"]
-                    )
-                    block_records.append(block_record)
-                    block_order += 1
-                    continue
-
-                # Handle Text blocks (type 0)
-                if "lines" not in block:
-                    continue
-
-                # Detect Alignment (Center/Left)
-                # Alignment heuristics often fail or conflict with exact positioning.
-                # User requested default left alignment and exact positioning.
-                # We will rely on 'x' coordinate (indentation) for visual placement.
-                is_centered = False 
-                
-                full_text = ""
-                words_meta = []
-                style_runs = []
-                
-                char_index = 0
-                
-                # Process each line and span
-                for line_idx, line in enumerate(block["lines"]):
-                    # Get line indentation (relative to page)
-                    lx0, ly0, _, _ = line["bbox"]
-                    
-                    is_line_start = True
-                    
-                    for span in line["spans"]:
-                        span_text = span["text"]
-                        if not span_text: continue
-                        
-                        # Sanitize text: PostgreSQL cannot handle NULL bytes (0x00) in text fields
-                        span_text = span_text.replace("\x00", "")
-                        if not span_text: continue
-                        
-                        # Style extraction
-                        size = span["size"]
-                        font = span["font"]
-                        
-                        # Clean font name
-                        # Remove subset tag (e.g. "ABCDE+Arial-Bold" -> "Arial-Bold")
-                        if "+" in font:
-                            font = font.split("+")[-1]
-                        
-                        dest_color = span.get("color", 0) 
-                        
-                        # Convert color to hex
-                        if isinstance(dest_color, int):
-                             color_hex = f"#{dest_color:06x}"
-                        else:
-                             color_hex = "#000000"
-
-                        # Normalize flags
-                        flags = span.get("flags", 0)
-                        is_bold = "Bold" in font or (flags & 16)
-                        is_italic = "Italic" in font or (flags & 2)
-                        
-                        span_words = span_text.split()
-                        
-                        span_start_idx = char_index
-                        full_text += span_text
-                        char_index += len(span_text)
-                        
-                        # Record style run
-                        style_runs.append({
-                            "start": span_start_idx,
-                            "end": char_index,
-                            "fontSize": size,
-                            "font": font,
-                            "color": color_hex,
-                            "isBold": is_bold,
-                            "isItalic": is_italic,
-                            "isCentered": False
-                        })
-
-                        # Extract words
-                        cursor = 0
-                        for i, word in enumerate(span_words):
-                            w_start = span_text.find(word, cursor)
-                            if w_start == -1: continue
-                            
-                            w_end = w_start + len(word)
-                            cursor = w_end
-                            
-                            abs_start = span_start_idx + w_start
-                            abs_end = span_start_idx + w_end
-                            
-                            # Determine if this word starts a new line
-                            forced_newline = False
-                            indent_val = 0
-                            
-                            if is_line_start and i == 0:
-                                forced_newline = True
-                                indent_val = lx0 # Store absolute x position
-                                is_line_start = False 
-                            
-                            words_meta.append({
-                                "start": abs_start,
-                                "end": abs_end,
-                                "text": word,
-                                "fontSize": size,
-                                "fontFamily": font,
-                                "isBold": is_bold,
-                                "isItalic": is_italic,
-                                "color": color_hex,
-                                "align": "left", # Force left
-                                "isNewline": forced_newline,
-                                "x": indent_val
-                            })
-                    
-                    # Add explicit newline in text for fallback
-                    full_text += "\n" 
-                    char_index += 1
-
-                # Skip empty blocks
-                if not full_text.strip():
-                    continue
-                
-                # Create block record
-                block_record = Block(
-                    id=str(uuid.uuid4()),
-                    doc_id=doc_id,
-                    page_number=page_num,
-                    block_order=block_order,
-                    block_type="text",
-                    text=full_text,
-                    words_meta=words_meta,
-                    style_runs=style_runs,
-                    position_meta=block["bbox"]
-                )
-                
-                block_records.append(block_record)
-                block_order += 1
-        
-        # Batch insert all blocks
-        if block_records:
-            # bulk_save_objects does not work well with relationships needing FKs unless flushed
-            # but since we flushed Document, it should be fine.
-            db_session.bulk_save_objects(block_records)
-            db_session.commit()
-            
-        logger.info(f"Parsed {total_pages} pages, {len(block_records)} blocks for doc {doc_id}")
-        
+
+        progress("extracting", 0, total_pages)
+
+        if workers > 1 and total_pages >= settings.PARSER_PARALLEL_MIN_PAGES:
+            logger.info(f"Extracting {total_pages} pages with {workers} workers for doc {doc_id}")
+            pages = _iter_pages_parallel(file_path, file_bytes, total_pages, workers, toc_builder, defer_images, stats)
+        else:
+            pages = _iter_pages_serial(doc, total_pages, toc_builder, defer_images, stats)
+
+        # Blocks are inserted per batch of pages
+        batch_pages = max(1, settings.INGEST_BATCH_PAGES)
+        palette = StylePalette() if compact else None
+        images = ImageCollector()
+        block_rows = []
+        block_count = 0
+        image_blocks = 0
+        for pages_done, page_blocks in enumerate(pages, start=1):
+            for block_data in page_blocks:
+                if block_data["block_type"] == "image":
+                    image_blocks += 1
+                block_rows.append(_build_block_row(doc_id, block_data, images, palette))
+            progress("extracting", pages_done, total_pages)
+
+            if pages_done % batch_pages == 0 and pages_done < total_pages:
+                _save_batch(db_session, doc_record, block_rows, pages_done, images, palette, stats)
+                block_count += len(block_rows)
+                block_rows = []
+
+        if toc_builder is not None:
+            doc_record.toc = toc_builder.build()
+
+        progress("saving", total_pages, total_pages)
+
+        doc_record.status = "ready"
+        doc_record.parser_version = PARSER_VERSION
+        _save_batch(db_session, doc_record, block_rows, total_pages, images, palette, stats)
+        block_count += len(block_rows)
+
+        stats.add_time("images", images.seconds)
+        stats.add_time("total", time.perf_counter() - started)
+        stats.incr("blocks", block_count)
+        stats.incr("image_blocks", image_blocks)
+        stats.incr("image_bytes", images.image_bytes)
+        stats.incr("stored_image_bytes", images.stored_bytes)
+        parse_metrics = stats.as_dict()
+        doc_record.parse_metrics = parse_metrics
+        db_session.commit()
+
+        progress("done", total_pages, total_pages)
+
+        seconds = parse_metrics["seconds"]
+        logger.info(
+            f"Parsed {total_pages} pages, {block_count} blocks for doc {doc_id} in {seconds['total']}s "
+            f"(get_text {seconds.get('get_text', 0)}s, text {seconds.get('text', 0)}s, "
+            f"images {seconds['images']}s, insert {seconds.get('insert', 0)}s)"
+        )
+        if images.images:
+            logger.info(
+                f"Doc {doc_id}: {images.images} images ({images.image_bytes} bytes), "
+                f"{images.stored_bytes} new bytes stored"
+            )
+        report_parse(doc_id, parse_metrics)
+
     finally:
         doc.close() # Always close the file handle
-    
+
     return doc_record
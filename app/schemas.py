@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Dict, Union
 
 
 # ============ Document Schemas ============
@@ -20,6 +20,10 @@ class DocumentResponse(BaseModel):
     user_id: Optional[str] = None
     theme: str = "plain"
     toc: Optional[List[Any]] = None
+    status: Optional[str] = None
+    pages_ready: Optional[int] = None
+    style_palette: Optional[List[Any]] = None  # Only used by compact block meta
+    parse_metrics: Optional[Dict[str, Any]] = None  # {"seconds": {stage: s}, "counts": {...}}
 
     class Config:
         from_attributes = True
@@ -45,9 +49,10 @@ class BlockResponse(BaseModel):
     text: Optional[str] = None
     block_type: str
     image_path: Optional[str] = None
-    words_meta: List[Any]      # JSON object
-    style_runs: List[Any]      # JSON object
+    words_meta: Union[List[Any], Dict[str, Any]]   # JSON object (dict when compact)
+    style_runs: Union[List[Any], Dict[str, Any]]   # JSON object (dict when compact)
     position_meta: List[Any]   # JSON object
+    meta_version: int = 1      # 1 = verbose, 2 = compact (see compact.py)
 
     class Config:
         from_attributes = True
@@ -109,6 +114,20 @@ class UploadResponse(BaseModel):
     document_id: str
     title: str
     total_pages: int
+    job_id: Optional[str] = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    document_id: str
+    status: str              # queued, running, done, failed
+    stage: str
+    pages_processed: int
+    total_pages: int
+    error: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
+    metrics: Optional[Dict[str, Any]] = None  # Document.parse_metrics once parsed
 
 
 # ============ Preference Schemas ============
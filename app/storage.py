@@ -0,0 +1,269 @@
+"""
+Blob storage for PDFs, images and thumbnails
+With BLOB_STORAGE=database (the default) bytes stay in their BYTEA columns.
+With "local" or "s3" new blobs go to a content-addressed store instead and
+the rows keep only the key (Document.file_key, ImageBlob.storage_key,
+DocumentThumbnail.storage_key); readers handle both, so existing rows keep
+working until scripts/migrate_blobs.py moves them.
+
+Keys are derived from content hashes (pdfs/<sha256>, images/<sha256>,
+thumbnails/<sha256>-<size>), so the same bytes are stored once.
+"""
+import os
+import shutil
+from abc import ABC, abstractmethod
+import logging
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import Document
+
+logger = logging.getLogger("storage")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def pdf_key(content_hash: str) -> str:
+    return f"pdfs/{content_hash}"
+
+
+def image_key(digest: str) -> str:
+    return f"images/{digest}"
+
+
+def thumbnail_key(content_hash: str, size: str) -> str:
+    return f"thumbnails/{content_hash}-{size}"
+
+
+class BlobStore(ABC):
+    """Interface of a blob backend. Writes of an existing key are no-ops (content-addressed)."""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        ...
+
+    @abstractmethod
+    def put_file(self, key: str, path: str):
+        ...
+
+    @abstractmethod
+    def get(self, key: str):
+        """All bytes of a blob, or None if it doesn't exist."""
+
+    @abstractmethod
+    def size(self, key: str):
+        """Size in bytes, or None if the blob doesn't exist."""
+
+    @abstractmethod
+    def iter_range(self, key: str, start: int = 0, end: int = None, chunk_size: int = CHUNK_SIZE):
+        """Yield bytes start..end (inclusive; end=None for the rest) in chunks."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+
+class LocalBlobStore(BlobStore):
+    """Files under a root directory: <root>/<kind>/<2 hex chars>/<name>."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        kind, _, name = key.partition("/")
+        return self.root / kind / name[:2] / name
+
+    def _write(self, key: str, write):
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                write(out)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def put(self, key: str, data: bytes):
+        self._write(key, lambda out: out.write(data))
+
+    def put_file(self, key: str, path: str):
+        def copy(out):
+            with open(path, "rb") as src:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+        self._write(key, copy)
+
+    def get(self, key: str):
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def size(self, key: str):
+        try:
+            return self._path(key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def iter_range(self, key: str, start: int = 0, end: int = None, chunk_size: int = CHUNK_SIZE):
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str):
+        self._path(key).unlink(missing_ok=True)
+
+
+class S3BlobStore(BlobStore):
+    """An S3 bucket (or any S3-compatible service via S3_ENDPOINT_URL, e.g. MinIO)."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("BLOB_STORAGE=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put(self, key: str, data: bytes):
+        if self.size(key) is None:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def put_file(self, key: str, path: str):
+        if self.size(key) is None:
+            # Multipart for large files, streamed from disk
+            self.client.upload_file(path, self.bucket, self._key(key))
+
+    def get(self, key: str):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def size(self, key: str):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))["ContentLength"]
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def iter_range(self, key: str, start: int = 0, end: int = None, chunk_size: int = CHUNK_SIZE):
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(key), Range=byte_range)["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+_store = None
+
+
+def get_blob_store():
+    """The configured external store, or None when blobs stay in Postgres."""
+    global _store
+    backend = settings.BLOB_STORAGE
+    if backend == "database":
+        return None
+    if _store is None:
+        if backend == "local":
+            _store = LocalBlobStore(settings.BLOB_STORAGE_DIR)
+        elif backend == "s3":
+            _store = S3BlobStore(
+                settings.S3_BUCKET, settings.S3_PREFIX, settings.S3_ENDPOINT_URL, settings.S3_REGION
+            )
+        else:
+            raise ValueError(f"Unknown BLOB_STORAGE backend: {backend}")
+    return _store
+
+
+def require_blob_store() -> BlobStore:
+    """The store holding keyed blobs; fails loudly if the app was switched back to database."""
+    store = get_blob_store()
+    if store is None:
+        raise RuntimeError("Blob has a storage key but BLOB_STORAGE is 'database'")
+    return store
+
+
+# Rows that store PDF bytes themselves (checks the null bitmap, never reads the bytes)
+HOLDS_FILE = or_(Document.file_key.isnot(None), Document.file_data.isnot(None))
+
+
+def file_holder_id(db_session: Session, doc_id: str):
+    """
+    Id of the document row holding doc_id's PDF bytes (file_key or
+    file_data). Shared and detached copies of a PDF keep none of their own;
+    the bytes are found by content hash on whichever row stores them.
+    """
+    row = db_session.query(Document.content_hash, HOLDS_FILE.label("holds")).filter(Document.id == doc_id).first()
+    if not row:
+        return None
+    if row.holds:
+        return doc_id
+    if not row.content_hash:
+        return None
+    return db_session.query(Document.id).filter(
+        Document.content_hash == row.content_hash, HOLDS_FILE
+    ).order_by(Document.created_at).limit(1).scalar()
+
+
+def load_file_data(db_session: Session, doc_id: str):
+    """PDF bytes of a document, wherever they are stored (see file_holder_id)."""
+    storage_id = file_holder_id(db_session, doc_id)
+    if not storage_id:
+        return None
+    row = db_session.query(Document.file_key, Document.file_data).filter(Document.id == storage_id).first()
+    if not row:
+        return None
+    if row.file_key:
+        return require_blob_store().get(row.file_key)
+    return row.file_data
+
+
+def unreferenced_file_key(db_session: Session, file_key: str):
+    """file_key if no document references it any more (delete it after commit), else None."""
+    if file_key and not db_session.query(Document.id).filter(Document.file_key == file_key).first():
+        return file_key
+    return None
+
+
+def delete_blobs(keys):
+    """Best-effort removal of blobs whose rows are gone (call after commit)."""
+    keys = [key for key in keys if key]
+    if not keys:
+        return
+    store = require_blob_store()
+    for key in keys:
+        try:
+            store.delete(key)
+        except Exception as e:
+            logger.warning(f"Could not delete blob {key}: {e}")
@@ -0,0 +1,109 @@
+"""
+Pre-rendered document thumbnails
+The first page is rendered once per PDF content (at ingest, or on the
+first request for older documents) in a few sizes, stored as JPEG in
+document_thumbnails (or the blob store, see storage.py) and served with a strong ETag derived from the
+content hash.
+"""
+import logging
+from datetime import datetime
+
+import fitz  # PyMuPDF
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .dedupe import ensure_content_hash
+from .models import Document, DocumentThumbnail
+from .storage import get_blob_store, load_file_data, thumbnail_key
+
+logger = logging.getLogger("thumbnails")
+
+# size name -> width in pixels (library grid cards, and their 2x variant)
+THUMBNAIL_SIZES = {"sm": 240, "md": 480}
+DEFAULT_SIZE = "md"
+JPEG_QUALITY = 80
+
+
+def thumbnail_etag(content_hash: str, size: str) -> str:
+    return f'"{content_hash[:32]}-{size}"'
+
+
+def render_thumbnails(pdf) -> dict:
+    """Render page 0 in every THUMBNAIL_SIZES width; returns {size: (jpeg, width, height)}."""
+    page = pdf[0]
+    thumbnails = {}
+    for size, width in THUMBNAIL_SIZES.items():
+        zoom = width / page.rect.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        thumbnails[size] = (pix.tobytes("jpg", jpg_quality=JPEG_QUALITY), pix.width, pix.height)
+    return thumbnails
+
+
+def store_thumbnails(db_session: Session, content_hash: str, pdf):
+    """Render and insert the thumbnails of a PDF (first writer wins). Does not commit."""
+    rows = [
+        {
+            "content_hash": content_hash,
+            "size": size,
+            "data": data,
+            "media_type": "image/jpeg",
+            "width": width,
+            "height": height,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        for size, (data, width, height) in render_thumbnails(pdf).items()
+    ]
+    store = get_blob_store()
+    if store is not None:
+        for row in rows:
+            row["storage_key"] = thumbnail_key(content_hash, row["size"])
+            store.put(row["storage_key"], row.pop("data"))
+    db_session.execute(
+        insert(DocumentThumbnail).values(rows).on_conflict_do_nothing(index_elements=["content_hash", "size"])
+    )
+
+
+def generate_thumbnails(db_session: Session, content_hash: str, file_path: str = None, file_data: bytes = None):
+    """Open the PDF from disk or bytes, store its thumbnails and commit."""
+    if file_path:
+        pdf = fitz.open(file_path)
+    else:
+        pdf = fitz.open(stream=file_data, filetype="pdf")
+    try:
+        store_thumbnails(db_session, content_hash, pdf)
+    finally:
+        pdf.close()
+    db_session.commit()
+
+
+def get_thumbnail(db_session: Session, doc: Document, size: str):
+    """The stored thumbnail of a document, rendering it first if needed."""
+    content_hash = ensure_content_hash(db_session, doc)
+    if not content_hash:
+        return None
+
+    thumbnail = db_session.get(DocumentThumbnail, (content_hash, size))
+    if thumbnail is None:
+        file_data = load_file_data(db_session, doc.id)
+        if not file_data:
+            return None
+        generate_thumbnails(db_session, content_hash, file_data=file_data)
+        thumbnail = db_session.get(DocumentThumbnail, (content_hash, size))
+        logger.info(f"Generated thumbnails for doc {doc.id}")
+    return thumbnail
+
+
+def delete_unused_thumbnails(db_session: Session, content_hash: str) -> list:
+    """
+    Drop a PDF's thumbnails once no document uses that content. Does not
+    commit; returns the blob store keys to delete after the commit.
+    """
+    if not content_hash:
+        return []
+    still_used = db_session.query(Document.id).filter(Document.content_hash == content_hash).first()
+    if still_used:
+        return []
+    thumbnails = db_session.query(DocumentThumbnail).filter(DocumentThumbnail.content_hash == content_hash)
+    keys = [key for (key,) in thumbnails.with_entities(DocumentThumbnail.storage_key)]
+    thumbnails.delete(synchronize_session=False)
+    return keys
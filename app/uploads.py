@@ -0,0 +1,137 @@
+"""
+Memory-bounded upload handling
+The request body is copied to a temp file in chunks while it is hashed and
+size-checked; parsing reads that file and the bytes reach
+Document.file_data through a COPY stream, so no step holds the whole PDF
+in memory.
+"""
+import os
+import struct
+import hashlib
+import logging
+import tempfile
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .storage import get_blob_store, pdf_key
+
+logger = logging.getLogger("uploads")
+
+
+class UploadTooLarge(Exception):
+    """Raised while spooling once the upload passes the size limit."""
+
+
+class SpooledUpload:
+    """A PDF upload on local disk, with its size and SHA-256."""
+
+    def __init__(self, path: str, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def discard(self):
+        discard_spool(self.path)
+
+
+def discard_spool(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def spool_upload(src, max_size: int, chunk_size: int = None) -> SpooledUpload:
+    """
+    Copy a file-like upload body to a temp file chunk by chunk, hashing it
+    on the way. Raises UploadTooLarge (and removes the file) past max_size.
+    """
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="upload-", dir=settings.UPLOAD_SPOOL_DIR or None)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"File too large (max {max_size // (1024 * 1024)}MB)")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard_spool(path)
+        raise
+    return SpooledUpload(path, size, digest.hexdigest())
+
+
+# PostgreSQL binary COPY framing for a single bytea column
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+
+
+class _CopyStream:
+    """File-like object yielding one binary COPY row whose only field is a file's bytes."""
+
+    def __init__(self, path: str, size: int):
+        self._file = open(path, "rb")
+        self._prefix = _COPY_HEADER + struct.pack("!hi", 1, size)
+        self._suffix = _COPY_TRAILER
+
+    def read(self, size: int = -1) -> bytes:
+        if self._prefix:
+            data, self._prefix = self._prefix, b""
+            return data
+        data = self._file.read(size)
+        if data:
+            return data
+        data, self._suffix = self._suffix, b""
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def store_file_data(db_session: Session, doc_id: str, upload: SpooledUpload):
+    """
+    Write the spooled file into documents.file_data without loading it.
+    Streams it with COPY into a temp table (psycopg2), then moves it over
+    inside Postgres; other drivers fall back to a plain UPDATE with the
+    bytes. With an external blob store the file goes there and only its
+    key is saved. Runs in the session's transaction (does not commit).
+    """
+    store = get_blob_store()
+    if store is not None:
+        key = pdf_key(upload.sha256)
+        store.put_file(key, upload.path)
+        db_session.execute(
+            text("UPDATE documents SET file_key = :key WHERE id = :id"),
+            {"key": key, "id": doc_id}
+        )
+        return
+
+    connection = db_session.connection()
+    if connection.dialect.driver != "psycopg2":
+        with open(upload.path, "rb") as f:
+            db_session.execute(
+                text("UPDATE documents SET file_data = :data WHERE id = :id"),
+                {"data": f.read(), "id": doc_id}
+            )
+        return
+
+    db_session.execute(text("CREATE TEMP TABLE upload_blob (data bytea) ON COMMIT DROP"))
+    stream = _CopyStream(upload.path, upload.size)
+    try:
+        with connection.connection.dbapi_connection.cursor() as cursor:
+            cursor.copy_expert("COPY upload_blob (data) FROM STDIN WITH (FORMAT binary)", stream, size=settings.UPLOAD_CHUNK_SIZE)
+    finally:
+        stream.close()
+    db_session.execute(
+        text("UPDATE documents SET file_data = (SELECT data FROM upload_blob) WHERE id = :id"),
+        {"id": doc_id}
+    )
+    db_session.execute(text("DROP TABLE upload_blob"))
@@ -0,0 +1,176 @@
+"""
+Deterministic synthetic PDFs for the ingestion benchmark.
+
+Every document is generated from a fixed seed with fixed metadata, so the
+same corpus (byte for byte) is produced on every machine and run.
+
+Usage: python scripts/bench_corpus.py [--out bench_corpus] [--scale 1.0]
+"""
+import sys
+import random
+import argparse
+from pathlib import Path
+
+import fitz
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud "
+    "exercitation ullamco laboris nisi aliquip ex ea commodo consequat duis aute irure "
+    "in reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint "
+    "occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim id est"
+).split()
+
+FONTS = ("helv", "tiro", "cour", "hebo", "tibo", "coit")
+PAGE_WIDTH, PAGE_HEIGHT = fitz.paper_size("a4")
+MARGIN = 56
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+_fonts = {}
+
+
+def _font(name: str):
+    if name not in _fonts:
+        _fonts[name] = fitz.Font(name)
+    return _fonts[name]
+
+
+def _heading(page, rng: random.Random, page_num: int, y: float) -> float:
+    """Chapter/section headings in a few distinct sizes (feeds the smart TOC)."""
+    if page_num % 10 == 0:
+        page.insert_text((MARGIN, y), f"Chapter {page_num // 10 + 1} {_sentence(rng, 3)}", fontsize=20, fontname="hebo")
+        return y + 34
+    page.insert_text((MARGIN, y), f"{page_num}. {_sentence(rng, 4)}", fontsize=14, fontname="hebo")
+    return y + 26
+
+
+def _text_column(page, rng: random.Random, x0: float, x1: float, y: float, fontsize: float = 10,
+                 bottom: float = PAGE_HEIGHT - MARGIN):
+    """Fill a column with word-wrapped paragraphs down to bottom (one append per line)."""
+    writer = fitz.TextWriter(page.rect)
+    font = _font("tiro")
+    widths = {word: font.text_length(word + " ", fontsize=fontsize) for word in WORDS}
+    leading = fontsize * 1.3
+    y += fontsize
+    while y < bottom:
+        line, x = [], x0
+        for word in _sentence(rng, rng.randint(40, 90)).split():
+            if x + widths[word] > x1 and line:
+                writer.append((x0, y), " ".join(line), font=font, fontsize=fontsize)
+                line, x, y = [], x0, y + leading
+                if y >= bottom:
+                    break
+            line.append(word)
+            x += widths[word]
+        if line and y < bottom:
+            writer.append((x0, y), " ".join(line), font=font, fontsize=fontsize)
+        y += leading * 2  # paragraph break
+    writer.write_text(page)
+
+
+def _noise_image(rng: random.Random, size: int) -> bytes:
+    """Distinct PNG per call (8x8 random colour cells), so dedup doesn't hide the cost."""
+    cell = max(1, size // 8)
+    rows = []
+    for _ in range(8):
+        row = b"".join(bytes((rng.randrange(256), rng.randrange(256), rng.randrange(256))) * cell for _ in range(8))
+        rows.append(row * cell)
+    side = cell * 8
+    pix = fitz.Pixmap(fitz.csRGB, side, side, b"".join(rows), False)
+    return pix.tobytes("png")
+
+
+def text_heavy(doc, rng, pages):
+    for p in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        y = _heading(page, rng, p, MARGIN + 20)
+        _text_column(page, rng, MARGIN, PAGE_WIDTH - MARGIN, y)
+
+
+def multi_column(doc, rng, pages, columns=3, gap=18):
+    width = (PAGE_WIDTH - 2 * MARGIN - (columns - 1) * gap) / columns
+    for p in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        y = _heading(page, rng, p, MARGIN + 20)
+        for c in range(columns):
+            x0 = MARGIN + c * (width + gap)
+            _text_column(page, rng, x0, x0 + width, y, fontsize=9)
+
+
+def image_heavy(doc, rng, pages, per_page=4):
+    logo = _noise_image(random.Random(0), 48)  # repeated on every page
+    for p in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page.insert_image(fitz.Rect(PAGE_WIDTH - MARGIN - 40, 16, PAGE_WIDTH - MARGIN, 56), stream=logo)
+        y = _heading(page, rng, p, MARGIN + 20)
+        for i in range(per_page):
+            top = y + i * 170
+            page.insert_image(fitz.Rect(MARGIN, top, MARGIN + 200, top + 150), stream=_noise_image(rng, 256))
+            _text_column(page, rng, MARGIN + 215, PAGE_WIDTH - MARGIN, top, fontsize=9, bottom=top + 150)
+
+
+def many_spans(doc, rng, pages, lines=45, words_per_line=12):
+    """Every word in its own font/size/colour: worst case for style_runs."""
+    colors = ((0, 0, 0), (0.5, 0, 0), (0, 0, 0.5), (0, 0.4, 0))
+    for p in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        writers = [fitz.TextWriter(page.rect, color=color) for color in colors]
+        y = _heading(page, rng, p, MARGIN + 20)
+        for _ in range(lines):
+            x = MARGIN
+            for _ in range(words_per_line):
+                word = rng.choice(WORDS) + " "
+                font = _font(rng.choice(FONTS))
+                fontsize = rng.choice((9, 10, 11))
+                rng.choice(writers).append((x, y), word, font=font, fontsize=fontsize)
+                x += font.text_length(word, fontsize=fontsize)
+            y += 15
+        for writer in writers:
+            writer.write_text(page)
+
+
+# name -> (generator, pages at scale 1.0)
+CORPUS = {
+    "text_heavy": (text_heavy, 200),
+    "multi_column": (multi_column, 100),
+    "image_heavy": (image_heavy, 60),
+    "many_spans": (many_spans, 100),
+    "long_1200p": (text_heavy, 1200),
+}
+
+
+def build_document(name: str, path: Path, scale: float = 1.0) -> Path:
+    generator, pages = CORPUS[name]
+    rng = random.Random(f"{name}:{scale}")
+    doc = fitz.open()
+    generator(doc, rng, max(1, int(pages * scale)))
+    doc.set_metadata({"title": name, "producer": "bench_corpus", "creationDate": "", "modDate": ""})
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return path
+
+
+def build_corpus(out_dir: Path, scale: float = 1.0, names=None) -> dict:
+    """Generate missing corpus files; returns {name: path}."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name in names or CORPUS:
+        path = out_dir / f"{name}-x{scale:g}.pdf"
+        if not path.exists():
+            print(f"Generating {path}...", file=sys.stderr)
+            build_document(name, path, scale)
+        paths[name] = path
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--out", default="bench_corpus")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply page counts (e.g. 0.1 for a quick run)")
+    args = parser.parse_args()
+    for name, path in build_corpus(Path(args.out), args.scale).items():
+        print(f"{name:14} {path} ({path.stat().st_size} bytes)")
@@ -0,0 +1,207 @@
+"""
+API read benchmark: sync (threadpool) vs async (asyncpg) database mode.
+
+Starts the API under uvicorn once per mode (ASYNC_DB=false / true) against
+the configured DATABASE_URL, then keeps N concurrent clients busy for a
+fixed time on the read endpoints of one document and prints throughput and
+latency percentiles as JSON.
+
+Requests (picked round-robin per client):
+  page       GET /api/documents/{id}/pages/{n}/blocks   (n cycles through the pages)
+  annotations GET /api/documents/{id}/annotations
+  list       GET /api/documents                        (authenticated)
+  stats      GET /api/documents/{id}/stats               (authenticated)
+
+Authenticated requests use a token minted here: the server is started with
+a throwaway SUPABASE_JWT_SECRET, so no Supabase project is involved (the
+document list is that of --user). The load generator runs on the same
+machine, so absolute numbers include its CPU use; compare the modes.
+
+Usage:
+  python scripts/benchmark_api.py [--doc DOC_ID] [--user USER_ID] [--concurrency 16,64,256]
+                                  [--duration 10] [--modes sync,async] [--workers 1]
+                                  [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+
+import httpx
+import jwt
+
+ROOT = Path(__file__).parent.parent
+# Add app directory to path
+sys.path.append(str(ROOT))
+
+REQUEST_KINDS = ("page", "annotations", "list", "stats")
+
+
+def pick_document(doc_id: str = None):
+    """(id, user_id, total_pages) of --doc, or of the largest ready document."""
+    from app.database import SessionLocal
+    from app.models import Document
+
+    db = SessionLocal()
+    try:
+        query = db.query(Document.id, Document.user_id, Document.total_pages)
+        if doc_id:
+            row = query.filter(Document.id == doc_id).first()
+        else:
+            row = query.filter(Document.status == "ready").order_by(Document.total_pages.desc()).first()
+        if row is None:
+            sys.exit("No document to benchmark (upload one or pass --doc)")
+        return row.id, row.user_id, row.total_pages or 1
+    finally:
+        db.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, port: int, secret: str, workers: int):
+    env = dict(
+        os.environ,
+        ASYNC_DB="true" if mode == "async" else "false",
+        SUPABASE_JWT_SECRET=secret,
+        AUTH_VERIFY_MODE="local",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    sys.exit(f"Server ({mode}) did not start")
+
+
+def request_urls(doc_id: str, total_pages: int):
+    """Endless (kind, path) sequence cycling through REQUEST_KINDS and pages."""
+    page = 0
+    while True:
+        for kind in REQUEST_KINDS:
+            if kind == "page":
+                yield kind, f"/api/documents/{doc_id}/pages/{page}/blocks"
+                page = (page + 1) % total_pages
+            elif kind == "annotations":
+                yield kind, f"/api/documents/{doc_id}/annotations"
+            elif kind == "list":
+                yield kind, "/api/documents"
+            else:
+                yield kind, f"/api/documents/{doc_id}/stats"
+
+
+async def run_load(base_url: str, token: str, doc_id: str, total_pages: int,
+                   concurrency: int, duration: float) -> dict:
+    latencies = {kind: [] for kind in REQUEST_KINDS}
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": "identity"}
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, headers=headers, timeout=60) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def worker(offset: int):
+            nonlocal errors
+            urls = request_urls(doc_id, total_pages)
+            for _ in range(offset):
+                next(urls)
+            while time.perf_counter() < stop_at:
+                kind, path = next(urls)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies[kind].append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    def percentiles(values: list) -> dict:
+        if not values:
+            return {}
+        values = sorted(values)
+        pick = lambda p: values[min(len(values) - 1, int(p * len(values)))]
+        return {"p50_ms": round(pick(0.50) * 1000, 1), "p99_ms": round(pick(0.99) * 1000, 1)}
+
+    every = [value for values in latencies.values() for value in values]
+    return {
+        "concurrency": concurrency,
+        "requests": len(every),
+        "errors": errors,
+        "req_per_sec": round(len(every) / elapsed, 1),
+        **percentiles(every),
+        "by_kind": {kind: {"requests": len(values), **percentiles(values)} for kind, values in latencies.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doc")
+    parser.add_argument("--user", help="User whose document list is read (default: the document's owner)")
+    parser.add_argument("--concurrency", default="16,64,256")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    doc_id, owner, total_pages = pick_document(args.doc)
+    secret = uuid.uuid4().hex
+    token = jwt.encode(
+        {"sub": args.user or owner or "benchmark", "aud": "authenticated", "exp": int(time.time()) + 86400},
+        secret, algorithm="HS256",
+    )
+
+    report = {"document": doc_id, "pages": total_pages, "duration": args.duration, "modes": {}}
+    for mode in args.modes.split(","):
+        port = free_port()
+        server = start_server(mode, port, secret, args.workers)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            # Warm the page payload cache and connection pools
+            asyncio.run(run_load(base_url, token, doc_id, total_pages, 4, 2))
+            report["modes"][mode] = [
+                asyncio.run(run_load(base_url, token, doc_id, total_pages, int(c), args.duration))
+                for c in args.concurrency.split(",")
+            ]
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps(report, indent=2))
+    for concurrency_index, concurrency in enumerate(args.concurrency.split(",")):
+        row = [f"c={concurrency:>4}"]
+        for mode, results in report["modes"].items():
+            r = results[concurrency_index]
+            row.append(f"{mode}: {r['req_per_sec']:>7} req/s  p50 {r.get('p50_ms')} ms  p99 {r.get('p99_ms')} ms  errors {r['errors']}")
+        print("   ".join(row), file=sys.stderr)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
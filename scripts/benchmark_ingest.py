@@ -0,0 +1,296 @@
+"""
+Ingestion benchmark: run parse_pdf over the synthetic corpus (bench_corpus.py)
+and report throughput, peak memory and time per stage as JSON.
+
+Each case runs in a fresh interpreter, so peak RSS is per document and
+imports/caches of one case don't leak into the next.
+
+Sinks:
+  memory    blocks are built but never sent anywhere (parser cost only)
+  postgres  the configured DATABASE_URL; benchmark rows are deleted afterwards
+
+Stages (seconds) are parse_pdf's own Document.parse_metrics:
+  open         fitz.open
+  get_text     page.get_text("dict")
+  text         span/word processing (words_meta, style_runs, smart TOC)
+  images       image hashing/conversion
+  image_flush  image blob inserts
+  insert       block load: COPY with the default --block-loader copy, or
+               bulk_save_objects with --block-loader orm (or no COPY support)
+  commit       batch commits
+  other        total minus the above (block rows, compact encoding, ...)
+
+Block loaders (postgres sink): copy (bulk_load.py, the default) or orm
+(bulk_save_objects); "both" runs every case with each and prints the ratio:
+  python scripts/benchmark_ingest.py --sink postgres --cases long_1200p --block-loader both
+
+Usage:
+  python scripts/benchmark_ingest.py [--sink memory|postgres] [--cases text_heavy,long_1200p]
+                                     [--scale 1.0] [--workers 1] [--compact] [--defer-images]
+                                     [--block-loader copy|orm|both] [--repeat 3]
+                                     [--output results.json] [--baseline old.json]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from bench_corpus import CORPUS, build_corpus
+
+
+class MemorySession:
+    """The subset of Session that parse_pdf uses; keeps nothing but counts."""
+
+    def __init__(self):
+        self.blocks = 0
+        self.commits = 0
+
+    def get(self, model, ident):
+        return None
+
+    def add(self, obj):
+        pass
+
+    def flush(self):
+        pass
+
+    def bulk_save_objects(self, objects):
+        self.blocks += len(objects)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def execute(self, statement, params=None):
+        pass
+
+    def query(self, *entities):
+        return _EmptyQuery()
+
+    def close(self):
+        pass
+
+
+class _EmptyQuery:
+    def filter(self, *criteria):
+        return self
+
+    def __iter__(self):
+        return iter(())
+
+
+def _delete_benchmark_doc(db, doc_id: str):
+    from app.models import Block, Document, ImageBlob
+    from app.storage import delete_blobs
+
+    image_hashes = [
+        h for (h,) in db.query(Block.image_hash).filter(Block.doc_id == doc_id, Block.image_hash.isnot(None)).distinct()
+    ]
+    db.query(Block).filter(Block.doc_id == doc_id).delete()
+    unused_keys = []
+    if image_hashes:
+        still_used = db.query(Block.id).filter(Block.image_hash == ImageBlob.hash).exists()
+        unused = db.query(ImageBlob).filter(ImageBlob.hash.in_(image_hashes), ~still_used)
+        unused_keys = [key for (key,) in unused.with_entities(ImageBlob.storage_key)]
+        unused.delete(synchronize_session=False)
+    db.query(Document).filter(Document.id == doc_id).delete()
+    db.commit()
+    delete_blobs(unused_keys)
+
+
+def run_case(path: str, sink: str, workers: int, compact: bool, defer_images: bool) -> dict:
+    """Parse one PDF in this process and return its measurements."""
+    from app.metrics import ParseStats
+    from app.parser import parse_pdf
+
+    stats = ParseStats()
+    file_bytes = Path(path).read_bytes()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    doc_id = f"bench-{uuid.uuid4().hex[:8]}"
+
+    if sink == "memory":
+        db = MemorySession()
+    else:
+        from app.database import SessionLocal
+        db = SessionLocal()
+
+    try:
+        started = time.perf_counter()
+        doc_record = parse_pdf(
+            file_path=Path(path).name,
+            db_session=db,
+            doc_id=doc_id,
+            title=Path(path).name,
+            file_bytes=file_bytes,
+            workers=workers,
+            stats=stats,
+            compact=compact,
+            defer_images=defer_images,
+        )
+        elapsed = time.perf_counter() - started
+        pages = doc_record.total_pages
+
+        if sink == "memory":
+            blocks = db.blocks
+        else:
+            from app.models import Block
+            blocks = db.query(Block).filter(Block.doc_id == doc_id).count()
+    finally:
+        if sink != "memory":
+            _delete_benchmark_doc(db, doc_id)
+        db.close()
+
+    parse_metrics = stats.as_dict()
+    stages = {name: value for name, value in parse_metrics["seconds"].items() if name != "total"}
+    stages["other"] = round(max(0.0, elapsed - sum(stages.values())), 4)
+    return {
+        "pages": pages,
+        "blocks": blocks,
+        "file_bytes": len(file_bytes),
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(pages / elapsed, 2),
+        "blocks_per_sec": round(blocks / elapsed, 2),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rss_before_mb": round(rss_before / 1024, 1),
+        "workers_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stages": stages,
+        "counts": parse_metrics["counts"],
+    }
+
+
+def _run_case_subprocess(path: Path, args, block_loader: str) -> dict:
+    cmd = [
+        sys.executable, __file__, "--run-case", str(path),
+        "--sink", args.sink, "--workers", str(args.workers),
+    ]
+    if args.compact:
+        cmd.append("--compact")
+    if args.defer_images:
+        cmd.append("--defer-images")
+    env = dict(os.environ, INGEST_COPY_BLOCKS="true" if block_loader == "copy" else "false")
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def compare(results: list, baseline_path: Path):
+    """Print per-case speed and memory against a previous run."""
+    baseline = {_key(r): r for r in json.loads(baseline_path.read_text())["results"]}
+    print(f"{'case':19} {'pages/s':>10} {'baseline':>10} {'change':>8} {'rss MB':>8} {'baseline':>9}", file=sys.stderr)
+    for r in results:
+        b = baseline.get(_key(r))
+        if not b:
+            continue
+        change = (r["pages_per_sec"] / b["pages_per_sec"] - 1) * 100
+        print(
+            f"{'/'.join(_key(r)):19} {r['pages_per_sec']:>10} {b['pages_per_sec']:>10} {change:>+7.1f}% "
+            f"{r['peak_rss_mb']:>8} {b['peak_rss_mb']:>9}",
+            file=sys.stderr
+        )
+
+
+def _key(result: dict) -> tuple:
+    return result["case"], result.get("block_loader", "orm")
+
+
+def compare_loaders(results: list):
+    """Print COPY against ORM insert time per case (--block-loader both)."""
+    by_key = {_key(r): r for r in results}
+    print(f"{'case':14} {'orm insert':>11} {'copy insert':>12} {'speedup':>8} {'orm total':>10} {'copy total':>11}", file=sys.stderr)
+    for case in dict.fromkeys(r["case"] for r in results):
+        orm, copy = by_key.get((case, "orm")), by_key.get((case, "copy"))
+        if not orm or not copy:
+            continue
+        orm_insert, copy_insert = orm["stages"].get("insert", 0), copy["stages"].get("insert", 0)
+        print(
+            f"{case:14} {orm_insert:>10.2f}s {copy_insert:>11.2f}s {orm_insert / max(copy_insert, 1e-6):>7.1f}x "
+            f"{orm['seconds']:>9.2f}s {copy['seconds']:>10.2f}s",
+            file=sys.stderr
+        )
+
+
+def main(args):
+    import fitz
+
+    names = args.cases or list(CORPUS)
+    corpus = build_corpus(Path(args.corpus_dir), args.scale, names)
+    loaders = ["orm", "copy"] if args.block_loader == "both" else [args.block_loader]
+
+    results = []
+    for name in names:
+        for block_loader in loaders:
+            runs = [_run_case_subprocess(corpus[name], args, block_loader) for _ in range(args.repeat)]
+            median = sorted(runs, key=lambda r: r["seconds"])[len(runs) // 2]
+            result = {"case": name, "block_loader": block_loader, **median, "runs_seconds": [r["seconds"] for r in runs]}
+            if len(runs) > 1:
+                result["stdev_seconds"] = round(statistics.stdev(r["seconds"] for r in runs), 4)
+            results.append(result)
+            print(
+                f"{name:14} {block_loader:4} {result['pages']:>5} pages {result['seconds']:>8.2f}s "
+                f"{result['pages_per_sec']:>8} pages/s {result['peak_rss_mb']:>7} MB",
+                file=sys.stderr
+            )
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "pymupdf": fitz.VersionBind,
+            "machine": platform.machine(),
+            "sink": args.sink,
+            "workers": args.workers,
+            "compact": args.compact,
+            "defer_images": args.defer_images,
+            "scale": args.scale,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        compare(results, Path(args.baseline))
+    if len(loaders) > 1:
+        compare_loaders(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sink", choices=("memory", "postgres"), default="memory")
+    parser.add_argument("--cases", type=lambda v: [c for c in v.split(",") if c])
+    parser.add_argument("--corpus-dir", default="bench_corpus")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--defer-images", action="store_true")
+    parser.add_argument("--block-loader", choices=("copy", "orm", "both"), default="copy")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case; the median run is reported")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.sink, args.workers, args.compact, args.defer_images)))
+    else:
+        unknown = set(args.cases or []) - set(CORPUS)
+        if unknown:
+            sys.exit(f"Unknown cases: {', '.join(sorted(unknown))} (choose from {', '.join(CORPUS)})")
+        main(args)
@@ -0,0 +1,115 @@
+"""
+Compare bytes on the wire and server encode time of block list responses
+(JSON vs MessagePack, each uncompressed and with gzip / br / zstd) for a set
+of PDFs, in the full and compact (format=compact) block formats. Payloads
+are built the way the API shapes them; nothing is written to the database.
+
+Times are per whole-document response, best of --repeat runs. "encode" is
+what the server spends per request: JSON comes ready from the page cache,
+MessagePack is converted from it, and compression runs on every response.
+
+Usage: python scripts/measure_block_encoding.py [--repeat N] file1.pdf [file2.pdf ...]
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+from pathlib import Path
+import fitz
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app import encoding
+from app.compact import META_VERSION_COMPACT, META_VERSION_VERBOSE, StylePalette, encode_block_meta
+from app.page_cache import encode_payloads
+from app.parser import _extract_page_blocks
+
+
+def build_payloads(path: str):
+    """(full, compact) BlockResponse-shaped payload lists of a PDF."""
+    doc = fitz.open(path)
+    palette = StylePalette()
+    doc_id = uuid.uuid4().hex[:8]
+    full, compact = [], []
+    try:
+        for page_num in range(len(doc)):
+            for block in _extract_page_blocks(doc[page_num], page_num, defer_images=True):
+                block_id = str(uuid.uuid4())
+                payload = {
+                    "id": block_id,
+                    "doc_id": doc_id,
+                    "page_number": block["page_number"],
+                    "block_order": block["block_order"],
+                    "text": block.get("text"),
+                    "block_type": block["block_type"],
+                    "image_path": f"/api/images/{block_id}" if block["block_type"] == "image" else None,
+                    "words_meta": block["words_meta"],
+                    "style_runs": block["style_runs"],
+                    "position_meta": block["position_meta"],
+                    "meta_version": META_VERSION_VERBOSE,
+                }
+                full.append(payload)
+                if block["block_type"] == "text":
+                    words, runs = encode_block_meta(block["words_meta"], block["style_runs"], palette)
+                    payload = dict(payload, words_meta=words, style_runs=runs, meta_version=META_VERSION_COMPACT)
+                compact.append(payload)
+    finally:
+        doc.close()
+    return full, compact
+
+
+def best_time(fn, repeat: int):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def measure(payloads: list, repeat: int) -> list:
+    """[(label, bytes, encode seconds)] for every media type and coding."""
+    json_body, json_seconds = best_time(lambda: encode_payloads(payloads), repeat)
+    bodies = [("json", json_body, 0.0)]
+    if encoding.msgpack is not None:
+        msgpack_body, msgpack_seconds = best_time(
+            lambda: encoding.msgpack.packb(json.loads(json_body), use_bin_type=True), repeat
+        )
+        bodies.append(("msgpack", msgpack_body, msgpack_seconds))
+
+    rows = [("json (uncached serialize)", len(json_body), json_seconds)]
+    for kind, body, seconds in bodies:
+        rows.append((kind, len(body), seconds))
+        for coding in ("gzip", "br", "zstd"):
+            if coding not in encoding.AVAILABLE_ENCODINGS:
+                continue
+            compressed, compress_seconds = best_time(lambda: encoding.compress(body, coding), repeat)
+            rows.append((f"{kind} + {coding}", len(compressed), seconds + compress_seconds))
+    return rows
+
+
+def main(paths: list, repeat: int):
+    missing = [name for name, module in (("msgpack", encoding.msgpack), ("brotli", encoding.brotli),
+                                         ("zstandard", encoding.zstandard)) if module is None]
+    if missing:
+        print(f"Not installed (skipped): {', '.join(missing)}")
+    for path in paths:
+        full, compact = build_payloads(path)
+        for meta_format, payloads in (("full", full), ("compact", compact)):
+            rows = measure(payloads, repeat)
+            baseline = rows[1][1]
+            print(f"\n{Path(path).name} - {len(payloads)} blocks, format={meta_format}")
+            print(f"{'encoding':28} {'bytes':>12} {'vs json':>8} {'encode ms':>10}")
+            for label, size, seconds in rows:
+                print(f"{label:28} {size:>12} {size / baseline:>7.1%} {seconds * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.paths, args.repeat)
@@ -0,0 +1,71 @@
+"""
+Compare the stored size of words_meta/style_runs in the verbose (v1) and
+compact (v2) encodings for a set of PDFs. Nothing is written to the database.
+
+Usage: python scripts/measure_compact.py file1.pdf [file2.pdf ...]
+"""
+import sys
+import json
+from pathlib import Path
+import fitz
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.compact import StylePalette, encode_block_meta, expand_words_meta, expand_style_runs
+from app.parser import _extract_page_blocks
+
+
+def json_size(value) -> int:
+    return len(json.dumps(value, separators=(",", ":")).encode())
+
+
+def measure(path: str) -> dict:
+    doc = fitz.open(path)
+    palette = StylePalette()
+    text_bytes = verbose_bytes = compact_bytes = 0
+    try:
+        for page_num in range(len(doc)):
+            for block in _extract_page_blocks(doc[page_num], page_num):
+                if block["block_type"] != "text":
+                    continue
+                words, runs = encode_block_meta(block["words_meta"], block["style_runs"], palette)
+
+                # Round-trip check: the API must be able to serve the v1 shape
+                assert expand_words_meta(words, block["text"], palette.styles) == block["words_meta"]
+                assert expand_style_runs(runs, palette.styles) == block["style_runs"]
+
+                text_bytes += len(block["text"].encode())
+                verbose_bytes += json_size(block["words_meta"]) + json_size(block["style_runs"])
+                compact_bytes += json_size(words) + json_size(runs)
+    finally:
+        doc.close()
+
+    compact_bytes += json_size(palette.styles)
+    return {
+        "file": Path(path).name,
+        "text_bytes": text_bytes,
+        "verbose_bytes": verbose_bytes,
+        "compact_bytes": compact_bytes,
+        "palette_styles": len(palette.styles),
+    }
+
+
+def main(paths: list):
+    total_verbose = total_compact = 0
+    print(f"{'file':40} {'text':>10} {'verbose':>12} {'compact':>12} {'ratio':>7}")
+    for path in paths:
+        r = measure(path)
+        total_verbose += r["verbose_bytes"]
+        total_compact += r["compact_bytes"]
+        ratio = r["verbose_bytes"] / max(1, r["compact_bytes"])
+        print(f"{r['file'][:40]:40} {r['text_bytes']:>10} {r['verbose_bytes']:>12} {r['compact_bytes']:>12} {ratio:>6.1f}x")
+    if total_compact:
+        print(f"{'TOTAL':40} {'':>10} {total_verbose:>12} {total_compact:>12} {total_verbose / total_compact:>6.1f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])
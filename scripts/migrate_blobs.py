@@ -0,0 +1,144 @@
+"""
+Move PDF, image and thumbnail bytes out of Postgres into the configured
+blob store (BLOB_STORAGE=local or s3), in batches.
+
+Each blob is written to the store before its row is switched to the key
+and its BYTEA column cleared, so an interrupted run can just be started
+again. The freed space is reused by Postgres after autovacuum; run
+VACUUM FULL on documents/image_blobs to give it back to the OS.
+
+Usage: python scripts/migrate_blobs.py [--kinds pdfs,images,thumbnails] [--batch-size 20]
+"""
+import sys
+import hashlib
+import argparse
+from pathlib import Path
+
+from sqlalchemy import tuple_
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Document, DocumentThumbnail, ImageBlob
+from app.storage import get_blob_store, image_key, pdf_key, thumbnail_key
+
+KINDS = ("pdfs", "images", "thumbnails")
+
+
+def migrate_pdfs(db, store, batch_size: int) -> int:
+    """One PDF in memory at a time; ids are read in batches."""
+    last_id = ""
+    moved = 0
+    while True:
+        ids = [doc_id for (doc_id,) in db.query(Document.id).filter(
+            Document.file_data.isnot(None),
+            Document.file_key.is_(None),
+            Document.id > last_id
+        ).order_by(Document.id).limit(batch_size)]
+        if not ids:
+            break
+
+        for doc_id in ids:
+            file_data, content_hash = db.query(Document.file_data, Document.content_hash).filter(
+                Document.id == doc_id
+            ).one()
+            content_hash = content_hash or hashlib.sha256(file_data).hexdigest()
+            key = pdf_key(content_hash)
+            store.put(key, file_data)
+            db.query(Document).filter(Document.id == doc_id).update(
+                {Document.file_key: key, Document.file_data: None, Document.content_hash: content_hash},
+                synchronize_session=False
+            )
+        db.commit()
+
+        moved += len(ids)
+        last_id = ids[-1]
+        print(f"  moved {moved} PDFs...")
+    return moved
+
+
+def migrate_images(db, store, batch_size: int) -> int:
+    last_hash = ""
+    moved = 0
+    while True:
+        rows = db.query(ImageBlob.hash, ImageBlob.data).filter(
+            ImageBlob.data.isnot(None),
+            ImageBlob.storage_key.is_(None),
+            ImageBlob.hash > last_hash
+        ).order_by(ImageBlob.hash).limit(batch_size).all()
+        if not rows:
+            break
+
+        for row in rows:
+            key = image_key(row.hash)
+            store.put(key, row.data)
+            db.query(ImageBlob).filter(ImageBlob.hash == row.hash).update(
+                {ImageBlob.storage_key: key, ImageBlob.data: None},
+                synchronize_session=False
+            )
+        db.commit()
+
+        moved += len(rows)
+        last_hash = rows[-1].hash
+        print(f"  moved {moved} images...")
+    return moved
+
+
+def migrate_thumbnails(db, store, batch_size: int) -> int:
+    last = ("", "")
+    moved = 0
+    while True:
+        rows = db.query(DocumentThumbnail.content_hash, DocumentThumbnail.size, DocumentThumbnail.data).filter(
+            DocumentThumbnail.data.isnot(None),
+            DocumentThumbnail.storage_key.is_(None),
+            tuple_(DocumentThumbnail.content_hash, DocumentThumbnail.size) > last
+        ).order_by(DocumentThumbnail.content_hash, DocumentThumbnail.size).limit(batch_size).all()
+        if not rows:
+            break
+
+        for row in rows:
+            key = thumbnail_key(row.content_hash, row.size)
+            store.put(key, row.data)
+            db.query(DocumentThumbnail).filter(
+                DocumentThumbnail.content_hash == row.content_hash,
+                DocumentThumbnail.size == row.size
+            ).update({DocumentThumbnail.storage_key: key, DocumentThumbnail.data: None}, synchronize_session=False)
+        db.commit()
+
+        moved += len(rows)
+        last = (rows[-1].content_hash, rows[-1].size)
+        print(f"  moved {moved} thumbnails...")
+    return moved
+
+
+MIGRATIONS = {"pdfs": migrate_pdfs, "images": migrate_images, "thumbnails": migrate_thumbnails}
+
+
+def migrate(kinds, batch_size: int):
+    store = get_blob_store()
+    if store is None:
+        sys.exit("BLOB_STORAGE is 'database'; set it to 'local' or 's3' first.")
+
+    db = SessionLocal()
+    try:
+        for kind in kinds:
+            print(f"Moving {kind} to {settings.BLOB_STORAGE} storage...")
+            moved = MIGRATIONS[kind](db, store, batch_size)
+            print(f"Done: {moved} {kind}.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", default=",".join(KINDS), help="comma-separated: " + ", ".join(KINDS))
+    parser.add_argument("--batch-size", type=int, default=20, help="rows per commit")
+    args = parser.parse_args()
+
+    kinds = [kind for kind in args.kinds.split(",") if kind]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        sys.exit(f"Unknown kinds: {', '.join(sorted(unknown))} (choose from {', '.join(KINDS)})")
+    migrate(kinds, args.batch_size)
@@ -0,0 +1,56 @@
+"""
+Move legacy per-block image bytes (blocks.image_data) into the
+content-addressed image_blobs table, in batches.
+
+Usage: python scripts/migrate_image_blobs.py [--batch-size 200]
+"""
+import sys
+import argparse
+from pathlib import Path
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal
+from app.images import ImageCollector, guess_ext
+from app.models import Block
+
+
+def migrate(batch_size: int):
+    db = SessionLocal()
+    images = ImageCollector()
+    last_id = ""
+    migrated = 0
+    try:
+        while True:
+            rows = db.query(Block.id, Block.image_data).filter(
+                Block.image_data.isnot(None),
+                Block.image_hash.is_(None),
+                Block.id > last_id
+            ).order_by(Block.id).limit(batch_size).all()
+            if not rows:
+                break
+
+            hashes = {row.id: images.add(row.image_data, guess_ext(row.image_data)) for row in rows}
+            images.flush(db)
+            for block_id, digest in hashes.items():
+                db.query(Block).filter(Block.id == block_id).update(
+                    {Block.image_hash: digest, Block.image_data: None},
+                    synchronize_session=False
+                )
+            db.commit()
+
+            migrated += len(rows)
+            last_id = rows[-1].id
+            print(f"  migrated {migrated} image blocks...")
+    finally:
+        db.close()
+
+    print(f"Done: {images.images} images, {images.image_bytes} bytes before, {images.stored_bytes} bytes after.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+    migrate(args.batch_size)
@@ -0,0 +1,317 @@
+"""
+Re-process stored documents from Document.file_data, in parallel and resumably.
+
+Documents are streamed by id (keyset pagination, PDF bytes never loaded in
+this process) and handed to a pool of worker processes; each worker parses
+one document with its own DB session and commits it on its own. Progress is
+written to a checkpoint file after every document, so an interrupted run
+resumes where it stopped when started again with the same checkpoint.
+
+Stages:
+  toc     rebuild the TOC (native, or smart TOC when the PDF has none)
+  blocks  re-extract blocks; ids are kept by (page, order) so annotations
+          and image URLs stay valid. Also rebuilds the TOC.
+  images  extract deferred images (PARSER_DEFER_IMAGES)
+
+By default only documents parsed by an older parser (Document.parser_version
+below parser.PARSER_VERSION) are selected.
+
+Usage:
+  python scripts/reprocess.py [--stages toc,blocks,images] [--workers 4]
+                              [--parser-version N | --all] [--missing-toc]
+                              [--doc-id ID ...] [--checkpoint FILE]
+                              [--retry-failed] [--restart]
+"""
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import fitz
+
+# Add app directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.compact import StylePalette
+from app.config import settings
+from app.database import SessionLocal
+from app.images import ImageCollector, materialize_images
+from app.documents import bump_annotation_version, bump_metadata_version
+from app.models import Annotation, Block, Document
+from app.page_cache import bump_content_version
+from app.parser import (
+    PARSER_VERSION, SmartTocBuilder, _build_block_record, _iter_pages_serial, generate_smart_toc
+)
+from app.storage import load_file_data
+
+STAGES = ("toc", "blocks", "images")
+DEFAULT_CHECKPOINT = "reprocess.checkpoint.json"
+
+
+# ============ Worker side ============
+
+def _open_pdf(db, doc_record: Document):
+    file_data = load_file_data(db, doc_record.id)
+    if file_data:
+        return fitz.open(stream=file_data, filetype="pdf")
+    if doc_record.file_path and Path(doc_record.file_path).exists():
+        return fitz.open(doc_record.file_path)
+    return None
+
+
+def _column_values(record: Block) -> dict:
+    """Column values of a freshly built block, with column defaults applied."""
+    values = {}
+    for column in Block.__table__.columns:
+        if column.key in ("id", "doc_id"):
+            continue
+        value = getattr(record, column.key)
+        if value is None and column.default is not None:
+            value = column.default.arg
+        values[column.key] = value
+    return values
+
+
+def _nearest_block(new_keys: dict, page_number: int, block_order: int):
+    """Id of the block on the same page closest to (at or before) block_order."""
+    candidates = [(order, block_id) for (page, order), block_id in new_keys.items() if page == page_number]
+    if not candidates:
+        return None
+    before = [c for c in candidates if c[0] <= block_order]
+    return max(before)[1] if before else min(candidates)[1]
+
+
+def _replace_blocks(db, doc_record: Document, pdf, toc_builder) -> int:
+    """
+    Re-extract all blocks of a document and write them in one transaction.
+    Blocks at an existing (page, order) keep their id and are updated in
+    place; annotations on blocks that no longer exist move to the nearest
+    block on the same page.
+    """
+    doc_id = doc_record.id
+    existing = {
+        (b.page_number, b.block_order): b
+        for b in db.query(Block).filter(Block.doc_id == doc_id)
+    }
+    palette = StylePalette() if settings.COMPACT_BLOCK_META else None
+    images = ImageCollector()
+
+    new_keys = {}
+    for page_blocks in _iter_pages_serial(pdf, len(pdf), toc_builder, settings.PARSER_DEFER_IMAGES):
+        for block_data in page_blocks:
+            key = (block_data["page_number"], block_data["block_order"])
+            current = existing.pop(key, None)
+            record = _build_block_record(doc_id, block_data, images, palette, current.id if current else None)
+            if current is None:
+                db.add(record)
+            else:
+                for column, value in _column_values(record).items():
+                    setattr(current, column, value)
+            new_keys[key] = record.id
+
+    images.flush(db)
+    db.flush()
+
+    # Blocks left over no longer exist in the new extraction
+    for (page_number, block_order), block in existing.items():
+        target = _nearest_block(new_keys, page_number, block_order)
+        db.query(Annotation).filter(Annotation.block_id == block.id).update(
+            {Annotation.block_id: target}, synchronize_session=False
+        )
+    if existing:
+        db.query(Block).filter(Block.id.in_([b.id for b in existing.values()])).delete(synchronize_session=False)
+        bump_annotation_version(db, doc_id, with_shared=True)
+
+    doc_record.style_palette = list(palette.styles) if palette is not None else None
+    doc_record.total_pages = len(pdf)
+    doc_record.pages_ready = len(pdf)
+    doc_record.status = "ready"
+    doc_record.parser_version = PARSER_VERSION
+    bump_content_version(db, doc_id)
+    return len(new_keys)
+
+
+def reprocess_document(task) -> dict:
+    """Run the requested stages for one document (runs in a worker process)."""
+    doc_id, stages = task
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        doc_record = db.get(Document, doc_id)
+        if doc_record is None:
+            return {"id": doc_id, "status": "skipped", "reason": "deleted"}
+
+        blocks = 0
+        if "toc" in stages or "blocks" in stages:
+            pdf = _open_pdf(db, doc_record)
+            if pdf is None:
+                return {"id": doc_id, "status": "skipped", "reason": "no file data"}
+            try:
+                toc_data = pdf.get_toc()
+                toc_builder = None if toc_data else SmartTocBuilder()
+                if "blocks" in stages:
+                    blocks = _replace_blocks(db, doc_record, pdf, toc_builder)
+                    if toc_builder is not None:
+                        toc_data = toc_builder.build()
+                elif toc_builder is not None:
+                    toc_data = generate_smart_toc(pdf)
+            finally:
+                pdf.close()
+            doc_record.toc = toc_data
+
+            # Documents sharing this one's blocks (dedupe.py) carry copies of these
+            db.query(Document).filter(Document.source_doc_id == doc_id).update(
+                {Document.toc: doc_record.toc, Document.style_palette: doc_record.style_palette},
+                synchronize_session=False
+            )
+            bump_metadata_version(db, doc_id, with_shared=True)
+        db.commit()
+
+        images = materialize_images(db, doc_id) if "images" in stages else 0
+        return {
+            "id": doc_id,
+            "status": "done",
+            "blocks": blocks,
+            "images": images,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+    except Exception as e:
+        db.rollback()
+        return {"id": doc_id, "status": "failed", "error": str(e)}
+    finally:
+        db.close()
+
+
+# ============ Driver ============
+
+def _document_filter(query, args):
+    query = query.filter(
+        Document.source_doc_id.is_(None),       # shared copies follow their source
+        Document.status.is_(None) | (Document.status != "processing")  # leave live ingest jobs alone
+    )
+    if args.doc_id:
+        return query.filter(Document.id.in_(args.doc_id))
+    if args.missing_toc:
+        query = query.filter(Document.toc.is_(None) | (Document.toc == []))
+    if not args.all:
+        query = query.filter(Document.parser_version.is_(None) | (Document.parser_version < args.parser_version))
+    return query
+
+
+def iter_document_ids(args, after_id: str):
+    """Yield matching document ids in id order, one keyset page at a time."""
+    db = SessionLocal()
+    try:
+        while True:
+            ids = [
+                doc_id for (doc_id,) in _document_filter(db.query(Document.id), args)
+                .filter(Document.id > after_id)
+                .order_by(Document.id)
+                .limit(args.batch_size)
+            ]
+            if not ids:
+                return
+            yield from ids
+            after_id = ids[-1]
+    finally:
+        db.close()
+
+
+def load_checkpoint(path: Path, selection: dict, restart: bool) -> dict:
+    fresh = {"selection": selection, "last_id": "", "done": 0, "skipped": 0, "failed": {}}
+    if restart or not path.exists():
+        return fresh
+    checkpoint = json.loads(path.read_text())
+    if checkpoint.get("selection") != selection:
+        sys.exit(f"{path} was written for {checkpoint.get('selection')}; use --restart or another --checkpoint")
+    print(f"Resuming after {checkpoint['last_id']!r} ({checkpoint['done']} done, {len(checkpoint['failed'])} failed)")
+    return checkpoint
+
+
+def save_checkpoint(path: Path, checkpoint: dict):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(checkpoint, indent=2))
+    tmp.replace(path)  # atomic: a crash never leaves a half-written checkpoint
+
+
+def run(args):
+    stages = tuple(s for s in STAGES if s in args.stages)
+    selection = {
+        "stages": list(stages),
+        "parser_version": None if args.all else args.parser_version,
+        "missing_toc": args.missing_toc,
+        "doc_id": sorted(args.doc_id or []),
+    }
+    checkpoint_path = Path(args.checkpoint)
+    checkpoint = load_checkpoint(checkpoint_path, selection, args.restart)
+
+    if args.retry_failed:
+        doc_ids = iter(sorted(checkpoint["failed"]))
+    else:
+        doc_ids = iter_document_ids(args, checkpoint["last_id"])
+
+    started = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as executor:
+        # Results are consumed in submission (= id) order, so last_id is
+        # always a point below which every document has been handled.
+        in_flight = deque()
+        for doc_id in doc_ids:
+            in_flight.append(executor.submit(reprocess_document, (doc_id, stages)))
+            if len(in_flight) >= args.workers * 2:
+                _record(in_flight.popleft().result(), checkpoint, checkpoint_path, args.retry_failed)
+        while in_flight:
+            _record(in_flight.popleft().result(), checkpoint, checkpoint_path, args.retry_failed)
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done: {checkpoint['done']} documents, {checkpoint['skipped']} skipped, "
+        f"{len(checkpoint['failed'])} failed ({elapsed:.1f}s). Checkpoint: {checkpoint_path}"
+    )
+
+
+def _record(result: dict, checkpoint: dict, checkpoint_path: Path, retrying: bool):
+    doc_id = result["id"]
+    if result["status"] == "failed":
+        checkpoint["failed"][doc_id] = result["error"]
+        print(f"  ! {doc_id}: {result['error']}")
+    else:
+        checkpoint["failed"].pop(doc_id, None)
+        if result["status"] == "skipped":
+            checkpoint["skipped"] += 1
+            print(f"  - {doc_id}: skipped ({result['reason']})")
+        else:
+            checkpoint["done"] += 1
+            print(f"  + {doc_id}: {result['blocks']} blocks, {result['images']} images ({result['seconds']}s)")
+    if not retrying:
+        checkpoint["last_id"] = doc_id
+    save_checkpoint(checkpoint_path, checkpoint)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", default="toc,blocks,images",
+                        type=lambda v: [s.strip() for s in v.split(",") if s.strip()])
+    parser.add_argument("--workers", type=int, default=max(1, (multiprocessing.cpu_count() or 2) - 1))
+    parser.add_argument("--parser-version", type=int, default=PARSER_VERSION,
+                        help="select documents parsed by a version below this (default: current)")
+    parser.add_argument("--all", action="store_true", help="ignore parser_version, select every document")
+    parser.add_argument("--missing-toc", action="store_true", help="only documents without a TOC")
+    parser.add_argument("--doc-id", action="append", help="only these documents (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=500, help="ids fetched per keyset page")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--retry-failed", action="store_true", help="re-run the documents that failed")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        sys.exit(f"Unknown stages: {', '.join(sorted(unknown))} (choose from {', '.join(STAGES)})")
+    run(args)
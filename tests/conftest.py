@@ -0,0 +1,49 @@
+"""
+Shared fixtures. The app reads its settings at import time, so placeholders
+are set before anything from app/ is imported; tests that need Postgres
+use the database fixture and are skipped when DATABASE_URL can't be reached.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://postgres@localhost/pdfread_test")
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test")
+# Jobs in threads: no worker process start-up per test session
+os.environ.setdefault("INGEST_EXECUTOR", "thread")
+
+
+@pytest.fixture(scope="session")
+def database():
+    """The app's engine; skips the test when Postgres can't be reached."""
+    from sqlalchemy import text
+    from app.database import engine
+
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        pytest.skip(f"Postgres not reachable: {e}")
+    return engine
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    """TestClient whose requests are authenticated as the X-Test-User header (default test-user)."""
+    from fastapi import Request
+    from fastapi.testclient import TestClient
+    from app import main
+    from app.auth import UserWrapper, get_current_user
+
+    def test_user(request: Request):
+        return UserWrapper({"id": request.headers.get("X-Test-User", "test-user"), "email": None})
+
+    main.app.dependency_overrides[get_current_user] = test_user
+    with TestClient(main.app) as test_client:
+        yield test_client
+    main.app.dependency_overrides.clear()
@@ -0,0 +1,35 @@
+import time
+import uuid
+
+import fitz
+
+
+def make_pdf(pages: int = 3, lines: int = 5) -> bytes:
+    """A PDF no earlier upload has (unique text), with one text block per line."""
+    marker = uuid.uuid4().hex
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Heading {p} {marker}", fontsize=16)
+        for i in range(lines):
+            page.insert_text((50, 120 + i * 40), f"line {i} of page {p} alpha beta gamma delta", fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def upload(client, data: bytes, user: str) -> dict:
+    """Upload a PDF as user and wait for its ingest job; returns the upload response."""
+    response = client.post(
+        "/api/upload", files={"file": ("test.pdf", data, "application/pdf")}, headers={"X-Test-User": user}
+    )
+    assert response.status_code in (200, 202), response.text
+    body = response.json()
+    if body.get("job_id"):
+        for _ in range(200):
+            job = client.get(f"/api/jobs/{body['job_id']}", headers={"X-Test-User": user}).json()
+            if job["status"] in ("done", "failed"):
+                break
+            time.sleep(0.05)
+        assert job["status"] == "done", job
+    return body
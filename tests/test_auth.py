@@ -0,0 +1,76 @@
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app import auth
+from app.config import settings
+
+SECRET = "test-jwt-secret-with-at-least-32-bytes"
+
+
+@pytest.fixture(autouse=True)
+def local_auth(monkeypatch):
+    """Local HS256 verification with an empty cache; asking Supabase fails the test."""
+    monkeypatch.setattr(settings, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(settings, "SUPABASE_JWKS_URL", "")
+    monkeypatch.setattr(settings, "AUTH_VERIFY_MODE", "local")
+    monkeypatch.setattr(auth, "token_cache", auth.TokenCache(max_entries=100, ttl=300))
+
+    def remote(token):
+        pytest.fail("Supabase was asked about a token that can be verified locally")
+
+    monkeypatch.setattr(auth, "verify_token_remotely", remote)
+
+
+def mint(secret: str = SECRET, **claims) -> str:
+    now = int(time.time())
+    payload = {"sub": "user-1", "email": "user@example.com", "aud": "authenticated", "iat": now, "exp": now + 3600}
+    payload.update(claims)
+    return jwt.encode({k: v for k, v in payload.items() if v is not None}, secret, algorithm="HS256")
+
+
+def test_valid_token():
+    user = auth.verify_token(mint())
+    assert (user.id, user.email) == ("user-1", "user@example.com")
+
+
+@pytest.mark.parametrize("token, error", [
+    (lambda: mint(secret="another-secret-with-at-least-32-bytes"), jwt.InvalidSignatureError),
+    (lambda: mint(exp=int(time.time()) - 60), jwt.ExpiredSignatureError),
+    (lambda: mint(aud="someone-else"), jwt.InvalidAudienceError),
+    (lambda: mint(sub=None), jwt.MissingRequiredClaimError),
+])
+def test_invalid_tokens_are_rejected(token, error):
+    with pytest.raises(error):
+        auth.verify_token(token())
+
+
+def test_invalid_token_is_a_401():
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=mint(exp=int(time.time()) - 60))
+    with pytest.raises(HTTPException) as raised:
+        auth.get_current_user(credentials)
+    assert raised.value.status_code == 401
+
+
+def test_second_call_is_served_from_cache(monkeypatch):
+    token = mint()
+    calls = []
+    verify_locally = auth.verify_token_locally
+    monkeypatch.setattr(auth, "verify_token_locally", lambda t: calls.append(t) or verify_locally(t))
+
+    first, second = auth.verify_token(token), auth.verify_token(token)
+    assert second is first
+    assert len(calls) == 1
+
+
+def test_cache_entry_ends_at_token_expiry(monkeypatch):
+    expires_at = int(time.time()) + 30  # well inside the 300s cache TTL
+    token = mint(exp=expires_at)
+    user = auth.verify_token(token)
+    assert auth.token_cache.get(token) is user
+
+    monkeypatch.setattr(auth.time, "time", lambda: expires_at + 1)
+    assert auth.token_cache.get(token) is None
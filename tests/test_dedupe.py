@@ -0,0 +1,92 @@
+from sqlalchemy import text
+
+from tests.helpers import make_pdf, upload
+
+OWNER, SHARER = "dedupe-owner", "dedupe-sharer"
+
+
+def page_blocks(client, doc_id: str, user: str, page: int = 0) -> list:
+    response = client.get(f"/api/documents/{doc_id}/pages/{page}/blocks", headers={"X-Test-User": user})
+    assert response.status_code == 200
+    return response.json()
+
+
+def annotate(client, doc_id: str, block_id: str, user: str) -> dict:
+    response = client.post("/api/annotations", json={
+        "doc_id": doc_id, "block_id": block_id, "start_word_index": 0, "end_word_index": 1, "user_id": user,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def split(client, doc_id: str, block_id: str, user: str) -> list:
+    response = client.post(
+        f"/api/documents/{doc_id}/blocks/{block_id}/split", json={"split_index": 2}, headers={"X-Test-User": user}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def stores_file(database, doc_id: str) -> bool:
+    with database.connect() as conn:
+        return conn.execute(
+            text("SELECT file_data IS NOT NULL OR file_key IS NOT NULL FROM documents WHERE id = :id"), {"id": doc_id}
+        ).scalar()
+
+
+def shared_pair(client):
+    data = make_pdf()
+    owner_doc = upload(client, data, OWNER)["document_id"]
+    sharer_doc = upload(client, data, SHARER)["document_id"]
+    return data, owner_doc, sharer_doc
+
+
+def test_owner_split_leaves_sharer_content(client):
+    _, owner_doc, sharer_doc = shared_pair(client)
+    try:
+        before = page_blocks(client, sharer_doc, SHARER)  # also warms the sharer's page cache
+        target = next(b for b in before if len(b["words_meta"]) > 2)
+        sharer_note = annotate(client, sharer_doc, target["id"], SHARER)
+        owner_note = annotate(client, owner_doc, target["id"], OWNER)
+
+        halves = split(client, owner_doc, target["id"], OWNER)
+
+        # The sharer still sees the unsplit block with the same ids
+        after = page_blocks(client, sharer_doc, SHARER)
+        assert [(b["id"], b["text"]) for b in after] == [(b["id"], b["text"]) for b in before]
+        notes = client.get(f"/api/documents/{sharer_doc}/annotations").json()
+        assert [n["block_id"] for n in notes if n["id"] == sharer_note["id"]] == [target["id"]]
+
+        # The owner split its own copy, and its annotation followed that copy
+        owner_blocks = page_blocks(client, owner_doc, OWNER)
+        assert len(owner_blocks) == len(before) + 1
+        assert {b["id"] for b in halves} <= {b["id"] for b in owner_blocks}
+        assert target["id"] not in {b["id"] for b in owner_blocks}
+        notes = client.get(f"/api/documents/{owner_doc}/annotations").json()
+        owner_block = next(n["block_id"] for n in notes if n["id"] == owner_note["id"])
+        assert owner_block == halves[0]["id"]
+    finally:
+        client.delete(f"/api/documents/{owner_doc}", headers={"X-Test-User": OWNER})
+        client.delete(f"/api/documents/{sharer_doc}", headers={"X-Test-User": SHARER})
+
+
+def test_sharer_split_does_not_copy_pdf(client, database):
+    data, owner_doc, sharer_doc = shared_pair(client)
+    try:
+        before = page_blocks(client, owner_doc, OWNER)
+        target = next(b for b in before if len(b["words_meta"]) > 2)
+        split(client, sharer_doc, target["id"], SHARER)
+
+        assert page_blocks(client, owner_doc, OWNER) == before
+        assert len(page_blocks(client, sharer_doc, SHARER)) == len(before) + 1
+        assert not stores_file(database, sharer_doc)
+
+        # The bytes move to the detached copy only when the last holder is deleted
+        client.delete(f"/api/documents/{owner_doc}", headers={"X-Test-User": OWNER})
+        assert stores_file(database, sharer_doc)
+        download = client.get(f"/api/documents/{sharer_doc}/download", headers={"X-Test-User": SHARER})
+        assert download.status_code == 200
+        assert download.content == data
+    finally:
+        client.delete(f"/api/documents/{owner_doc}", headers={"X-Test-User": OWNER})
+        client.delete(f"/api/documents/{sharer_doc}", headers={"X-Test-User": SHARER})
@@ -0,0 +1,65 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from tests.helpers import make_pdf, upload
+
+SELECTED_COLUMNS = re.compile(r"^\s*SELECT\b(.*?)\bFROM\b", re.IGNORECASE | re.DOTALL)
+
+
+@pytest.fixture
+def database_storage(monkeypatch):
+    """PDF bytes in documents.file_data, whatever BLOB_STORAGE the environment sets."""
+    from app import storage
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "BLOB_STORAGE", "database")
+    monkeypatch.setattr(storage, "_store", None)
+
+
+@contextmanager
+def selected_columns(engine):
+    """Collects the column list of every SELECT run on engine inside the block."""
+    columns = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        match = SELECTED_COLUMNS.match(statement)
+        if match:
+            columns.append(match.group(1))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield columns
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def test_document_routes_never_select_file_data(client, database, database_storage):
+    doc_id = upload(client, make_pdf(), "reader-a")["document_id"]
+    headers = {"X-Test-User": "reader-a"}
+
+    with selected_columns(database) as columns:
+        assert client.get("/api/documents", headers=headers).status_code == 200
+        assert client.get(f"/api/documents/{doc_id}", headers=headers).status_code == 200
+        assert client.delete(f"/api/documents/{doc_id}", headers=headers).status_code == 200
+
+    assert columns
+    assert not [c for c in columns if "file_data" in c]
+
+
+def test_file_data_access_raises(client, database, database_storage):
+    from app import models
+    from app.database import SessionLocal
+
+    doc_id = upload(client, make_pdf(), "reader-a")["document_id"]
+    db = SessionLocal()
+    try:
+        doc = db.query(models.Document).filter(models.Document.id == doc_id).one()
+        with pytest.raises(InvalidRequestError):
+            doc.file_data
+    finally:
+        db.close()
+        client.delete(f"/api/documents/{doc_id}", headers={"X-Test-User": "reader-a"})
@@ -0,0 +1,48 @@
+import fitz
+
+from tests.helpers import upload
+
+
+def make_image_pdf(pages: int) -> bytes:
+    """A different small image on every page."""
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Figure page {p}", fontsize=12)
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+        pixmap.set_rect(pixmap.irect, (p * 40 % 256, 90, 200))
+        page.insert_image(fitz.Rect(50, 100, 150, 200), stream=pixmap.tobytes("png"))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_first_deferred_image_request_extracts_whole_document(client, monkeypatch):
+    from app import images, models
+    from app.config import settings
+    from app.database import SessionLocal
+
+    monkeypatch.setattr(settings, "PARSER_DEFER_IMAGES", True)
+    doc_id = upload(client, make_image_pdf(4), "reader-a")["document_id"]
+
+    db = SessionLocal()
+    try:
+        # As if the ingest job hadn't got to the images yet
+        db.query(models.Block).filter(models.Block.doc_id == doc_id).update({models.Block.image_hash: None})
+        db.commit()
+        block_ids = [
+            block_id for (block_id,) in db.query(models.Block.id).filter(
+                models.Block.doc_id == doc_id, models.Block.image_xref.isnot(None)
+            )
+        ]
+        assert len(block_ids) == 4
+
+        loads = []
+        load_file_data = images.load_file_data
+        monkeypatch.setattr(images, "load_file_data", lambda *args: loads.append(args) or load_file_data(*args))
+        for block_id in block_ids:
+            assert client.get(f"/api/images/{block_id}").status_code == 200
+        assert len(loads) == 1
+    finally:
+        db.close()
+        client.delete(f"/api/documents/{doc_id}", headers={"X-Test-User": "reader-a"})
@@ -0,0 +1,41 @@
+import pytest
+from fastapi import HTTPException
+
+from app.auth import require_ops_token
+from app.config import settings
+
+
+@pytest.fixture
+def ops_token(monkeypatch):
+    monkeypatch.setattr(settings, "OPS_TOKEN", "ops-secret")
+    return "ops-secret"
+
+
+def test_metrics_disabled_without_ops_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "OPS_TOKEN", "")
+    assert client.get("/api/metrics", headers={"X-Ops-Token": ""}).status_code == 404
+
+
+def test_metrics_requires_ops_token(client, ops_token):
+    assert client.get("/api/metrics").status_code == 403
+    assert client.get("/api/metrics", headers={"X-Ops-Token": "wrong"}).status_code == 403
+    assert client.get("/api/metrics", headers={"X-Ops-Token": "é".encode("latin-1")}).status_code == 403
+    response = client.get("/api/metrics", headers={"X-Ops-Token": ops_token})
+    assert response.status_code == 200
+    assert isinstance(response.json(), dict)
+
+
+def test_db_diagnostics_requires_ops_token(client, ops_token, monkeypatch):
+    assert client.get("/api/diagnostics/db").status_code == 403
+    response = client.get("/api/diagnostics/db", headers={"X-Ops-Token": ops_token})
+    assert response.status_code == 200
+    assert response.json()["pools"]["sync"]["size"] >= 0
+
+    monkeypatch.setattr(settings, "OPS_TOKEN", "")
+    assert client.get("/api/diagnostics/db", headers={"X-Ops-Token": ops_token}).status_code == 404
+
+
+def test_non_ascii_ops_token_is_rejected(ops_token):
+    with pytest.raises(HTTPException) as error:
+        require_ops_token("é")
+    assert error.value.status_code == 403
@@ -0,0 +1,51 @@
+from tests.helpers import make_pdf, upload
+
+USER = "page-cache-reader"
+
+
+def test_worker_prefill_only_fills_the_table(client, monkeypatch):
+    from app import models, page_cache
+    from app.database import SessionLocal
+
+    doc_id = upload(client, make_pdf(pages=3), USER)["document_id"]
+    lru = page_cache.PayloadLRU(1024 * 1024)
+    monkeypatch.setattr(page_cache, "page_cache", lru)
+    db = SessionLocal()
+    try:
+        db.query(models.PagePayload).filter(models.PagePayload.doc_id == doc_id).delete()
+        db.commit()
+
+        assert page_cache.prefill_page_cache(db, doc_id, in_memory=False) == 3
+        assert lru.stats()["entries"] == 0
+        assert db.query(models.PagePayload).filter(models.PagePayload.doc_id == doc_id).count() == 3
+
+        page_cache.prefill_page_cache(db, doc_id)
+        assert lru.stats()["entries"] == 3
+    finally:
+        db.close()
+        client.delete(f"/api/documents/{doc_id}", headers={"X-Test-User": USER})
+
+
+def test_failed_persist_still_serves_the_page(client, monkeypatch):
+    from app import models, page_cache
+    from app.database import SessionLocal
+
+    doc_id = upload(client, make_pdf(pages=2), USER)["document_id"]
+    headers = {"X-Test-User": USER}
+    expected = client.get(f"/api/documents/{doc_id}/pages/1/blocks", headers=headers).json()
+    monkeypatch.setattr(page_cache, "page_cache", page_cache.PayloadLRU(1024 * 1024))
+    db = SessionLocal()
+    try:
+        db.query(models.PagePayload).filter(models.PagePayload.doc_id == doc_id).delete()
+        db.commit()
+
+        def broken_insert(table):
+            raise RuntimeError("page_payloads is unavailable")
+
+        monkeypatch.setattr(page_cache, "insert", broken_insert)
+        response = client.get(f"/api/documents/{doc_id}/pages/1/blocks", headers=headers)
+        assert response.status_code == 200
+        assert response.json() == expected
+    finally:
+        db.close()
+        client.delete(f"/api/documents/{doc_id}", headers=headers)
@@ -0,0 +1,67 @@
+import threading
+
+from app import page_render
+from app.database import SessionLocal
+from app.dedupe import ensure_content_hash
+from app.documents import find_document
+from tests.helpers import make_pdf, upload
+
+USER = "render-user"
+
+
+def test_zoom_below_minimum_is_rejected(client):
+    doc_id = upload(client, make_pdf(pages=1), USER)["document_id"]
+    try:
+        url = f"/api/documents/{doc_id}/pages/0/image"
+        assert client.get(url, params={"zoom": 0.004}, headers={"X-Test-User": USER}).status_code == 422
+        response = client.get(url, params={"zoom": page_render.MIN_ZOOM}, headers={"X-Test-User": USER})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+    finally:
+        client.delete(f"/api/documents/{doc_id}", headers={"X-Test-User": USER})
+
+
+def test_normalize_zoom_never_reaches_zero():
+    assert page_render.normalize_zoom(0.004) == page_render.MIN_ZOOM
+    assert page_render.normalize_zoom(1.234) == 1.23
+
+
+def test_cold_fetch_does_not_block_other_renders(client, monkeypatch):
+    warm_id = upload(client, make_pdf(pages=1), USER)["document_id"]
+    cold_id = upload(client, make_pdf(pages=1), USER)["document_id"]
+    db = SessionLocal()
+    try:
+        warm, cold = find_document(db, warm_id), find_document(db, cold_id)
+        warm_hash, cold_hash = ensure_content_hash(db, warm), ensure_content_hash(db, cold)
+        page_render.render_page(db, warm, warm_hash, 0, 0.5)  # opens the warm PDF
+
+        fetching, release = threading.Event(), threading.Event()
+        fetch = page_render.load_file_data
+
+        def slow_fetch(db_session, doc_id):
+            fetching.set()
+            release.wait(10)
+            return fetch(db_session, doc_id)
+
+        monkeypatch.setattr(page_render, "load_file_data", slow_fetch)
+
+        def render_cold():
+            cold_db = SessionLocal()
+            try:
+                page_render.render_page(cold_db, cold, cold_hash, 0, 0.51)
+            finally:
+                cold_db.close()
+
+        cold_render = threading.Thread(target=render_cold)
+        cold_render.start()
+        assert fetching.wait(10)
+        # The cold fetch is in progress; a render of the open PDF doesn't wait for it
+        assert page_render.render_page(db, warm, warm_hash, 0, 0.52)
+        assert cold_render.is_alive()
+        release.set()
+        cold_render.join(10)
+        assert not cold_render.is_alive()
+    finally:
+        db.close()
+        client.delete(f"/api/documents/{warm_id}", headers={"X-Test-User": USER})
+        client.delete(f"/api/documents/{cold_id}", headers={"X-Test-User": USER})
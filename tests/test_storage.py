@@ -0,0 +1,41 @@
+import pytest
+
+from app.storage import BlobStore, LocalBlobStore
+
+
+def test_incomplete_backend_fails_on_creation():
+    class PutOnly(BlobStore):
+        def put(self, key, data):
+            pass
+
+    with pytest.raises(TypeError):
+        PutOnly()
+
+
+def test_local_store_round_trip(tmp_path):
+    store = LocalBlobStore(tmp_path)
+    store.put("pdfs/abc", b"0123456789")
+    assert store.get("pdfs/abc") == b"0123456789"
+    assert store.size("pdfs/abc") == 10
+    assert b"".join(store.iter_range("pdfs/abc", 2, 5, chunk_size=2)) == b"2345"
+    store.delete("pdfs/abc")
+    assert store.get("pdfs/abc") is None
+
+
+def test_full_ingest_queue_removes_stored_pdf(client, tmp_path, monkeypatch):
+    from app import storage
+    from app.config import settings
+    from app.jobs import JobQueueFull, job_manager
+    from tests.helpers import make_pdf
+
+    monkeypatch.setattr(settings, "BLOB_STORAGE", "local")
+    monkeypatch.setattr(settings, "BLOB_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "_store", None)
+
+    def full(*args, **kwargs):
+        raise JobQueueFull("Ingest queue is full")
+
+    monkeypatch.setattr(job_manager, "submit", full)
+    response = client.post("/api/upload", files={"file": ("test.pdf", make_pdf(), "application/pdf")})
+    assert response.status_code == 503
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
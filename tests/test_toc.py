@@ -0,0 +1,74 @@
+import fitz
+
+from app.parser import SmartTocBuilder
+
+
+def make_pdf(pages: int, body_lines: int = 40) -> fitz.Document:
+    """One 16pt heading, body_lines of 10pt text and an 8pt footer per page."""
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Section {p + 1}", fontsize=16)
+        for i in range(body_lines):
+            page.insert_text((50, 90 + i * 15), f"body text line {i} of page {p} with a few more words", fontsize=10)
+        page.insert_text((50, 800), f"page {p + 1}", fontsize=8)
+    return doc
+
+
+def feed(builder: SmartTocBuilder, doc: fitz.Document, pages: range):
+    for page_num in pages:
+        for block in doc[page_num].get_text("dict")["blocks"]:
+            if block["type"] == 0:
+                builder.add_block(block, page_num)
+
+
+def test_candidates_bounded_by_headings():
+    doc = make_pdf(30)
+    builder = SmartTocBuilder()
+    feed(builder, doc, range(len(doc)))
+
+    assert len(builder.candidates) == 30
+    assert builder.build() == [[1, f"Section {p + 1}", p + 1] for p in range(30)]
+
+
+def test_candidates_do_not_grow_with_body_text():
+    short, long = make_pdf(10, body_lines=5), make_pdf(10, body_lines=45)
+    counts = []
+    for doc in (short, long):
+        builder = SmartTocBuilder()
+        feed(builder, doc, range(len(doc)))
+        counts.append(len(builder.candidates))
+    assert counts == [10, 10]
+
+
+def test_merged_chunks_match_single_pass():
+    doc = make_pdf(20)
+    single = SmartTocBuilder()
+    feed(single, doc, range(20))
+
+    merged, tail = SmartTocBuilder(), SmartTocBuilder()
+    feed(merged, doc, range(10))
+    feed(tail, doc, range(10, 20))
+    merged.merge(tail)
+
+    assert merged.build() == single.build()
+
+
+def test_chunked_build_matches_serial():
+    # Appendix in larger type: on its own, its 10.5pt body would hide its 11.5pt headings
+    doc = make_pdf(16)
+    for p in range(4):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Appendix {p + 1}", fontsize=11.5)
+        for i in range(30):
+            page.insert_text((50, 90 + i * 20), f"appendix text line {i} of page {p}", fontsize=10.5)
+    serial = SmartTocBuilder()
+    feed(serial, doc, range(len(doc)))
+
+    for chunk_size in (3, 5, 8):
+        merged = SmartTocBuilder()
+        for start in range(0, len(doc), chunk_size):
+            chunk = SmartTocBuilder(prune_body=False)
+            feed(chunk, doc, range(start, min(start + chunk_size, len(doc))))
+            merged.merge(chunk)
+        assert merged.build() == serial.build()